@@ -9,9 +9,10 @@ import imgui.glfw as glfw
 from nodepasta.impasta.imgui_node_graph import ImNodeGraph
 from nodepasta.impasta.imgui_arg_handlers import IntHandler, FloatHandler, EnumHandler
 from nodepasta.nodegraph import NodeGraph
+from nodepasta.control import SelectNode, GateNode, SwitchNode
 from nodepasta.impasta.imgui_arg_handlers import getDefaultArgHandlers
 
-from .example_nodes import const_source, power_node, output_node, sum_node, offset_node, listifier, enumNode
+from .example_nodes import const_source, power_node, output_node, sum_node, offset_node, listifier, enumNode, scale_node
 
 WIDTH = 1000
 HEIGHT = 600
@@ -67,7 +68,11 @@ def main():
         output_node.OutputNode,
         offset_node.OffsetNode,
         listifier.ListifierNode,
-        enumNode.EnumNode
+        enumNode.EnumNode,
+        scale_node.ScaleNode,
+        SelectNode,
+        GateNode,
+        SwitchNode
     ]
 
     for t in nodeTypes:
@@ -0,0 +1,97 @@
+import os
+import sys
+import tempfile
+import time
+
+from .example_nodes.const_source import ConstSource
+from .example_nodes.offset_node import OffsetNode
+from .example_nodes.output_node import OutputNode
+from .example_nodes.sum_list import SumListNode
+
+from nodepasta.nodegraph import NodeGraph
+from nodepasta.bulk_loader import loadGraphs
+
+# Run with: python -m examples.bulk_load_bench [files] [nodes per file]
+# Times loading a directory of graph files one by one against loadGraphs(),
+# and checks that both give the same graphs
+
+NODE_TYPES = [ConstSource, OffsetNode, OutputNode, SumListNode]
+
+
+def makeGraph(size: int) -> NodeGraph:
+    ng = NodeGraph()
+    for t in NODE_TYPES:
+        ng.registerNodeClass(t)
+
+    src = ng.addNode(ConstSource)
+    sumList = ng.addNode(SumListNode)
+    out = ng.addNode(OutputNode)
+    ng.makeLink(sumList.outputs[0], out.inputs[0])
+
+    # Chains of offsets, each ending in a slot of the sum
+    chains = max(1, size // 20)
+    for idx in range(chains):
+        if idx > 0:
+            ng.addVarPort(sumList.inputs[0])
+        prev = src.outputs[0]
+        for _ in range(size // chains):
+            node = ng.addNode(OffsetNode)
+            ng.makeLink(prev, node.inputs[0])
+            prev = node.outputs[0]
+        ng.makeLink(prev, sumList.getInputPorts()[idx])
+    return ng
+
+
+def loadSerial(files):
+    out = {}
+    for filename in files:
+        ng = NodeGraph()
+        for t in NODE_TYPES:
+            ng.registerNodeClass(t)
+        ng.loadFromFile(filename)
+        out[filename] = ng
+    return out
+
+
+def main():
+    numFiles = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for idx in range(numFiles):
+            makeGraph(size).saveToFile(os.path.join(tmp, f'g{idx}.json'))
+        files = sorted(os.path.join(tmp, x) for x in os.listdir(tmp) if x.endswith('.json'))
+
+        start = time.perf_counter()
+        serial = loadSerial(files)
+        serialTime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = loadGraphs(tmp, NODE_TYPES)
+        bulkTime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        plans = loadGraphs(tmp, NODE_TYPES, plansOnly=True).plans
+        parseTime = time.perf_counter() - start
+        start = time.perf_counter()
+        for plan in plans.values():
+            plan.build(NODE_TYPES)
+        buildTime = time.perf_counter() - start
+
+        assert result.ok, result.errors
+        for filename, ng in serial.items():
+            bulk = result.graphs[filename]
+            assert bulk.getJSON() == ng.getJSON(), f'{filename} differs'
+            assert [n.uid for n in bulk._traversal] == [n.uid for n in ng._traversal], f'{filename} traversal differs'
+
+    print(f'{numFiles} files, {size} nodes each, {os.cpu_count()} cores')
+    print(f'Serial loadFromFile: {serialTime * 1000:.1f} ms')
+    print(f'loadGraphs:          {bulkTime * 1000:.1f} ms ({serialTime / bulkTime:.2f}x)')
+    print(f'  Workers, plans only: {parseTime * 1000:.1f} ms')
+    print(f'  GraphPlan.build():   {buildTime * 1000:.1f} ms')
+    # Only the builds are serial, the best loadGraphs() can do with enough cores
+    print(f'Upper bound with enough cores: {serialTime / buildTime:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
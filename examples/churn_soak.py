@@ -0,0 +1,103 @@
+import contextlib
+import gc
+import io
+import os
+import sys
+import tracemalloc
+
+from .example_nodes.const_source import ConstSource
+from .example_nodes.offset_node import OffsetNode
+from .example_nodes.output_node import OutputNode
+from .example_nodes.sum_node import SumNode
+from .example_nodes.sum_list import SumListNode
+
+from nodepasta.nodegraph import NodeGraph
+
+# Run with: python -m examples.churn_soak
+# Simulates a long editing session and checks that memory stays flat
+
+GRAPH_FILE = os.path.join(os.path.dirname(__file__), 'test_graphs', 'test_graph1.json')
+
+CYCLES = 3000
+WARMUP = 300
+# Allowed growth between the end of the warmup and the end of the run
+MAX_GROWTH = 64 * 1024
+
+
+def editCycle(ng: NodeGraph):
+    ng.loadFromFile(GRAPH_FILE)
+
+    # Add a small branch
+    src = ng.addNode(ConstSource)
+    offsets = [ng.addNode(OffsetNode) for _ in range(10)]
+    sumList = ng.addNode(SumListNode)
+    out = ng.addNode(OutputNode)
+
+    for _ in range(5):
+        ng.addVarPort(sumList.inputs[0])
+    for idx, node in enumerate(offsets):
+        ng.makeLink(src.outputs[0], node.inputs[0])
+        ng.makeLink(node.outputs[0], sumList.getInputPorts()[idx % 6])
+    ng.makeLink(sumList.outputs[0], out.inputs[0])
+    # A counter feeding itself through a delay link
+    loop = ng.addNode(OffsetNode)
+    ng.makeLink(loop.outputs[0], loop.inputs[0], delay=True)
+
+    ng.setupNodes()
+    with contextlib.redirect_stdout(io.StringIO()):
+        ng.execute()
+
+    # Then take it apart again
+    for _ in range(3):
+        ng.remVarPort(sumList.inputs[0])
+    for node in offsets[::2]:
+        ng.removeNode(node)
+    for link in list(src):
+        ng.unlink(link)
+    ng.removeNode(sumList)
+    ng.removeNode(loop)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        ng.execute()
+
+
+def checkTables(ng: NodeGraph):
+    numPorts = sum(len(n.getInputPorts()) + len(n.getOutputPorts()) for n in ng)
+    numLinks = sum(1 for n in ng for _ in n)
+    assert len(ng._portLookup) == numPorts, f'{len(ng._portLookup)} ports tracked, {numPorts} in graph'
+    assert len(ng._linkIDLookup) == numLinks, f'{len(ng._linkIDLookup)} links tracked, {numLinks} in graph'
+    assert len(ng._linkLookup) == numLinks, f'{len(ng._linkLookup)} links tracked, {numLinks} in graph'
+
+
+def main():
+    ng = NodeGraph()
+    for t in [ConstSource, OffsetNode, OutputNode, SumNode, SumListNode]:
+        ng.registerNodeClass(t)
+
+    tracemalloc.start()
+    for _ in range(WARMUP):
+        editCycle(ng)
+    checkTables(ng)
+    # Only count memory that is actually still reachable
+    gc.collect()
+    start, _ = tracemalloc.get_traced_memory()
+
+    for _ in range(CYCLES - WARMUP):
+        editCycle(ng)
+    checkTables(ng)
+    gc.collect()
+    end, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    growth = end - start
+    print(f'{CYCLES} cycles, growth after warmup: {growth} bytes, peak: {peak} bytes')
+    assert growth <= MAX_GROWTH, f'grew by {growth} bytes, allowed {MAX_GROWTH}'
+    print("Soak Passed")
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except AssertionError as err:
+        print(f'Soak Failed: {err}')
+        sys.exit(1)
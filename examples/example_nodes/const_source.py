@@ -1,5 +1,5 @@
 from nodepasta.argtypes import NodeArg, FLOAT
-from nodepasta.node import Node, Port
+from nodepasta.node import Node, Port, EFFECT_PURE
 
 
 class ConstSource(Node):
@@ -10,6 +10,7 @@ class ConstSource(Node):
         )
     ]
     NODETYPE = "Source"
+    EFFECT = EFFECT_PURE
     DESCRIPTION = "Outputs a constant value"
 
     def init(self):
@@ -1,4 +1,4 @@
-from nodepasta.node import Node, Port
+from nodepasta.node import Node, Port, EFFECT_PURE
 from nodepasta.argtypes import EnumNodeArg, FLOAT, BOOL
 from operator import lt, gt
 
@@ -18,6 +18,7 @@ class EnumNode(Node):
         )
     ]
     NODETYPE = "Compare"
+    EFFECT = EFFECT_PURE
 
     def init(self) -> None:
         self._opType = self.args[_TYPE]
@@ -1,4 +1,4 @@
-from nodepasta.node import Node, Port
+from nodepasta.node import Node, Port, EFFECT_PURE
 from nodepasta.argtypes import NodeArg, FLOAT
 
 
@@ -7,6 +7,7 @@ class ListifierNode(Node):
     _INPUTS = [Port("Inputs", FLOAT, "The inputs", variable=True)]
     _OUTPUTS = [Port("Output", "List[float]", "The output list")]
     NODETYPE = "Listifier"
+    EFFECT = EFFECT_PURE
 
     def init(self):
         self.a = self.inputs[0]
@@ -1,4 +1,4 @@
-from nodepasta.node import Node, Port
+from nodepasta.node import Node, Port, EFFECT_PURE
 from nodepasta.argtypes import NodeArg, FLOAT
 
 
@@ -7,6 +7,7 @@ class OffsetNode(Node):
     _INPUTS = [Port("value", FLOAT, "The input")]
     _OUTPUTS = [Port("output", FLOAT, "The output")]
     NODETYPE = "Offset"
+    EFFECT = EFFECT_PURE
     _ARGS = [NodeArg("offset", FLOAT, "Offset", "The constant offset", 2)]
 
     def init(self):
@@ -1,4 +1,4 @@
-from nodepasta.node import Node, Port
+from nodepasta.node import Node, Port, EFFECT_WRITES
 from nodepasta.argtypes import ANY
 
 
@@ -6,6 +6,8 @@ class OutputNode(Node):
     DESCRIPTION = "Prints out the input to the console"
     _INPUTS = [Port("value", ANY, "The input")]
     NODETYPE = "Output"
+    # Prints, so it is never skipped
+    EFFECT = EFFECT_WRITES
 
     def init(self) -> None:
         pass
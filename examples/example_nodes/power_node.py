@@ -1,4 +1,4 @@
-from nodepasta.node import Node, Port
+from nodepasta.node import Node, Port, EFFECT_PURE
 from nodepasta.argtypes import FLOAT
 
 
@@ -7,6 +7,7 @@ class Power(Node):
     _INPUTS = [Port("base", FLOAT, "The base"), Port("power", FLOAT, "The exponent")]
     _OUTPUTS = [Port("value", FLOAT, "The output")]
     NODETYPE = "Power"
+    EFFECT = EFFECT_PURE
 
     def init(self) -> None:
         pass
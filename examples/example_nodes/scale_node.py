@@ -0,0 +1,18 @@
+from nodepasta.node import Port, EFFECT_PURE
+from nodepasta.argtypes import NodeArg, FLOAT
+from nodepasta.functional import nodeFunction
+
+
+@nodeFunction(
+    "Scale",
+    inputs=[Port("value", FLOAT, "The input")],
+    outputs=[Port("output", FLOAT, "The output")],
+    args=[NodeArg("factor", FLOAT, "Factor", "The constant factor", 2)],
+    effect=EFFECT_PURE
+)
+def ScaleNode(value: float, factor: float) -> float:
+    """
+    Multiplies the input by a constant
+    """
+    # value is required, so this is never called with None
+    return value * factor
@@ -1,4 +1,4 @@
-from nodepasta.node import Node, Port
+from nodepasta.node import Node, Port, EFFECT_PURE
 from nodepasta.argtypes import NodeArg, FLOAT
 
 
@@ -7,6 +7,7 @@ class SumListNode(Node):
     _INPUTS = [Port("Inputs", FLOAT, "The inputs", variable=True)]
     _OUTPUTS = [Port("Output", FLOAT, "The output sum")]
     NODETYPE = "Listifier"
+    EFFECT = EFFECT_PURE
 
     def init(self):
         self.a = self.inputs[0]
@@ -17,6 +18,6 @@ class SumListNode(Node):
         self.out = self.outputs[0]
 
     def execute(self) -> None:
-        # Input is variable, therefore
-        # a.value is a list of every input value
-        self.out.value(sum(self.a.value()))
+        # Input is variable, the sum is taken right away
+        # so it can read the port's buffer without a copy
+        self.out.value(sum(self.a.valueView()))
@@ -1,4 +1,4 @@
-from nodepasta.node import Node, Port
+from nodepasta.node import Node, Port, EFFECT_PURE
 from nodepasta.argtypes import FLOAT
 
 
@@ -7,6 +7,7 @@ class SumNode(Node):
     _INPUTS = [Port("a", FLOAT, "The first value"), Port("b", FLOAT, "The second value")]
     _OUTPUTS = [Port("value", FLOAT, "The output")]
     NODETYPE = "Sum"
+    EFFECT = EFFECT_PURE
 
     def init(self):
         self.a = self.inputs[0]
@@ -3,7 +3,8 @@ import tkinter as tk
 import os
 
 from nodepasta.nodegraph import NodeGraph
-from .example_nodes import const_source, power_node, output_node, sum_node, offset_node, listifier, enumNode
+from nodepasta.control import SelectNode, GateNode, SwitchNode
+from .example_nodes import const_source, power_node, output_node, sum_node, offset_node, listifier, enumNode, scale_node
 from nodepasta.errors import NodeGraphError
 from nodepasta.tk.tk_node_graph import TKNodeGraph
 from nodepasta.argtypes import FLOAT, INT, BOOL
@@ -25,7 +26,11 @@ if __name__ == '__main__':
         output_node.OutputNode,
         offset_node.OffsetNode,
         listifier.ListifierNode,
-        enumNode.EnumNode
+        enumNode.EnumNode,
+        scale_node.ScaleNode,
+        SelectNode,
+        GateNode,
+        SwitchNode
     ]
 
     for t in nodeTypes:
@@ -50,8 +55,9 @@ if __name__ == '__main__':
     def reload():
         try:
             if os.path.exists(filename):
-                ng.loadFromFile(filename)
-                ngFrame.reset()
+                # Only applies what changed on disk, untouched nodes keep their state
+                _, touched = ng.hotReload(filename)
+                ng.setupNodes(touched)
                 ngFrame.reloadGraph()
         except NodeGraphError as err:
             print("ERROR:", str(err))
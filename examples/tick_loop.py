@@ -0,0 +1,53 @@
+from nodepasta.node import Node, Port
+from nodepasta.argtypes import FLOAT, INT
+from nodepasta.nodegraph import NodeGraph
+from nodepasta.scheduler import TickScheduler, TICK_KEY
+
+from .example_nodes.const_source import ConstSource
+
+# Run with: python -m examples.tick_loop
+# Runs a small graph at a fixed rate and prints the timing stats
+
+RATE = 500
+TICKS = 1000
+
+
+class Accumulator(Node):
+    DESCRIPTION = "Outputs the running sum of its input, carried from one tick to the next"
+    _INPUTS = [Port("value", FLOAT, "The input")]
+    _OUTPUTS = [Port("sum", FLOAT, "The running sum"), Port("tick", INT, "The current tick")]
+    NODETYPE = "Accumulator"
+
+    def init(self):
+        pass
+
+    def setup(self) -> None:
+        pass
+
+    def execute(self) -> None:
+        # Node state lives in the scheduler's context, so it survives between ticks
+        state = self.state
+        state['sum'] = state.get('sum', 0) + self.inputs[0].value()
+        self.outputs[0].value(state['sum'])
+        self.outputs[1].value(self.datamap[TICK_KEY])
+
+
+def main():
+    ng = NodeGraph()
+    for t in [ConstSource, Accumulator]:
+        ng.registerNodeClass(t)
+
+    src = ng.addNode(ConstSource)
+    acc = ng.addNode(Accumulator)
+    ng.makeLink(src.outputs[0], acc.inputs[0])
+    ng.setupNodes()
+
+    scheduler = TickScheduler(ng, RATE)
+    scheduler.run(TICKS)
+
+    print(f'Sum after {TICKS} ticks: {scheduler.ctx.nodeState[acc.nodeID]["sum"]}')
+    print(scheduler.stats())
+
+
+if __name__ == '__main__':
+    main()
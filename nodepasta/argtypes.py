@@ -1,5 +1,16 @@
-from typing import List, Any
+from typing import Iterable, List, Any, Optional
 import abc
+import os
+import json
+import hashlib
+
+from nodepasta.blobstore import LazyBlob
+from nodepasta.errors import NodeGraphError
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 STRING = 'String'
 INT = "Int"
@@ -11,14 +22,55 @@ ANY = "ANY"
 
 class NodeArg:
     def __init__(self, name: str, argType: str, display: str, descr: str, value: Any = None):
+        # Incremented every time the value is set
+        self.version = 0
         self.descr = descr
         self.name = name
         self.argType = argType
         self.value = value
         self.display = self.name if display is None else display
 
+    @property
+    def value(self) -> Any:
+        v = self._value
+        if v.__class__ is LazyBlob:
+            # Map side-car values on first use
+            v = self._value = v.load()
+        return v
+
+    @value.setter
+    def value(self, v: Any):
+        self._value = v
+        self.version += 1
+
+    def pendingBlob(self) -> Optional[LazyBlob]:
+        """
+        Returns the side-car reference if the value has not been loaded yet
+        """
+        v = self._value
+        return v if v.__class__ is LazyBlob else None
+
+    def _setPendingBlob(self, blob: LazyBlob):
+        """
+        Points a value that has not been loaded yet at another copy of its file,
+        the value itself is unchanged
+        """
+        self._value = blob
+
     def copy(self) -> 'NodeArg':
-        return NodeArg(self.name, self.argType, self.display, self.descr, self.value)
+        return NodeArg(self.name, self.argType, self.display, self.descr, self._value)
+
+    def _clone(self) -> 'NodeArg':
+        """
+        Same as copy(), without going through __init__
+        """
+        cls = self.__class__
+        out = cls.__new__(cls)
+        state = self.__dict__.copy()
+        # Matches the single value set done by __init__
+        state['version'] = 1
+        out.__dict__ = state
+        return out
 
     def getJSON(self) -> Any:
         return self.value
@@ -36,5 +88,53 @@ class EnumNodeArg(NodeArg):
         self.enums = enums
 
     def copy(self) -> 'NodeArg':
-        return EnumNodeArg(self.name, self.display, self.descr, self.value, self.enums)
+        return EnumNodeArg(self.name, self.display, self.descr, self._value, self.enums)
+
+
+def _keyDefault(o: Any) -> Any:
+    """
+    Keys the values json can't encode by their contents
+    """
+    if np is not None and isinstance(o, (np.ndarray, np.generic)):
+        if o.dtype.hasobject:
+            raise NodeGraphError("argsKey()", "Cannot key an array of Python objects")
+        return {
+            'dtype': o.dtype.str,
+            'shape': list(o.shape),
+            'digest': hashlib.blake2b(np.ascontiguousarray(o)).hexdigest()
+        }
+    if isinstance(o, (bytes, bytearray, memoryview)):
+        return {
+            'bytes': hashlib.blake2b(o).hexdigest()
+        }
+    raise NodeGraphError("argsKey()", f"Cannot key a value of type {type(o).__name__}")
+
+
+def argsKey(args: Iterable[NodeArg]) -> str:
+    """
+    Returns a string that is equal for two sets of args exactly when their names and values are.
+    Arrays and bytes are keyed by a digest of their contents, side-car values
+    that haven't been loaded by their file, so the file isn't read.
+    Raises NodeGraphError for values that can't be keyed
+    """
+    values = {}
+    for x in args:
+        blob = x.pendingBlob()
+        if blob is None:
+            values[x.name] = x.getJSON()
+            continue
+        try:
+            st = os.stat(blob.path)
+        except OSError as err:
+            raise NodeGraphError("argsKey()", f"Cannot key arg {x.name}: {err}")
+        values[x.name] = {
+            'blob': os.path.abspath(blob.path),
+            'size': st.st_size,
+            'mtime': st.st_mtime_ns
+        }
 
+    try:
+        return json.dumps(values, sort_keys=True, default=_keyDefault)
+    except (TypeError, ValueError) as err:
+        # e.g. dicts with keys that aren't strings
+        raise NodeGraphError("argsKey()", f"Cannot key args: {err}")
@@ -0,0 +1,242 @@
+import os
+import mmap
+import threading
+import weakref
+from typing import Any, Dict, Optional, Set
+
+from nodepasta.errors import NodeGraphError
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+_BLOB = '__blob__'
+_FORMAT = 'format'
+
+_NPY = 'npy'
+_BYTES = 'bytes'
+
+# Values smaller than this are left inline in the graph JSON
+DEF_BLOB_THRESHOLD = 64 * 1024
+
+
+def blobDirFor(filename: str) -> str:
+    """
+    Returns the side-car directory used for a graph file
+    """
+    return f'{filename}.blobs'
+
+
+def isBlobRef(jValue: Any) -> bool:
+    return isinstance(jValue, dict) and _BLOB in jValue
+
+
+# Absolute path -> LazyBlobs pointing at it that have not been loaded yet.
+# Files in this table are never replaced or pruned
+_refLock = threading.Lock()
+_refs: Dict[str, 'weakref.WeakSet[LazyBlob]'] = {}
+
+
+def _addRef(blob: 'LazyBlob'):
+    path = os.path.abspath(blob.path)
+    with _refLock:
+        refs = _refs.get(path)
+        if refs is None:
+            refs = _refs[path] = weakref.WeakSet()
+        refs.add(blob)
+
+
+def _isReferenced(path: str, exclude: Optional['LazyBlob'] = None) -> bool:
+    """
+    Whether a LazyBlob other than exclude still points at the file
+    """
+    path = os.path.abspath(path)
+    with _refLock:
+        refs = _refs.get(path)
+        if refs is None:
+            return False
+        if len(refs) == 0:
+            del _refs[path]
+            return False
+        return any(x is not exclude for x in refs)
+
+
+class LazyBlob:
+    """
+    Reference to an argument value stored in a side-car file.
+    Nothing is opened until load() is called, at which point the
+    file is memory-mapped read-only instead of being read into memory
+    """
+
+    def __init__(self, path: str, fmt: str):
+        self.path = path
+        self.fmt = fmt
+        _addRef(self)
+
+    def load(self) -> Any:
+        """
+        Maps the file into memory
+        :return: A read-only numpy memmap for .npy blobs, a read-only memoryview for raw bytes
+        """
+        if self.fmt == _NPY:
+            if np is None:
+                raise NodeGraphError("LazyBlob.load()", f"Cannot load {self.path}, numpy is not installed")
+            return np.load(self.path, mmap_mode='r')
+
+        with open(self.path, mode='rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''
+            # The mapping stays valid after the file is closed
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def getJSON(self) -> Dict[str, str]:
+        return {
+            _BLOB: os.path.basename(self.path),
+            _FORMAT: self.fmt
+        }
+
+    def __str__(self) -> str:
+        return f'LazyBlob({self.path})'
+
+
+class BlobStore:
+    """
+    Stores large argument values next to a graph file,
+    so that the graph JSON only holds a small reference to them
+    """
+
+    def __init__(self, directory: str, threshold: int = DEF_BLOB_THRESHOLD):
+        """
+        :param directory: The side-car directory
+        :param threshold: Size in bytes above which values are moved out of the JSON
+        """
+        self.directory = directory
+        self.threshold = threshold
+        # Files referenced by the graph currently being saved
+        self._written: Set[str] = set()
+
+    def isLarge(self, value: Any) -> bool:
+        if isinstance(value, (bytes, bytearray)):
+            return len(value) >= self.threshold
+        if isinstance(value, memoryview) or (np is not None and isinstance(value, np.ndarray)):
+            return value.nbytes >= self.threshold
+        return False
+
+    def _path(self, name: str, ext: str, exclude: Optional[LazyBlob] = None) -> str:
+        """
+        Returns where to write a value, never a file that an unloaded blob still points at
+        """
+        safeName = "".join(c if c.isalnum() or c in '-_' else '_' for c in name)
+        base = os.path.join(self.directory, safeName)
+        path = base + ext
+        idx = 0
+        while _isReferenced(path, exclude) or os.path.abspath(path) in self._written:
+            idx += 1
+            path = f'{base}-{idx}{ext}'
+        return path
+
+    def _replace(self, path: str, data: Any, fmt: str):
+        os.makedirs(self.directory, exist_ok=True)
+        # Write then swap, an older mapping of the same file stays valid
+        tmp = f'{path}.tmp'
+        with open(tmp, mode='wb') as f:
+            if fmt == _NPY:
+                np.save(f, data, allow_pickle=False)
+            else:
+                f.write(data)
+        os.replace(tmp, path)
+
+    def put(self, name: str, value: Any) -> Dict[str, str]:
+        """
+        Writes a value to the store
+        :param name: A unique name for the value within the graph
+        :param value: The value, bytes-like or a numpy array
+        :return: The JSON reference to store in place of the value
+        """
+        if np is not None and isinstance(value, np.ndarray):
+            fmt = _NPY
+            # Skip rewriting a read-only mapping of a file already in the store
+            if (isinstance(value, np.memmap) and value.filename is not None and not value.flags.writeable
+                    and os.path.dirname(os.path.abspath(value.filename)) == os.path.abspath(self.directory)
+                    and os.path.abspath(value.filename) not in self._written
+                    and os.path.isfile(value.filename)):
+                path = value.filename
+            else:
+                path = self._path(name, '.npy')
+                self._replace(path, value, fmt)
+        else:
+            fmt = _BYTES
+            path = self._path(name, '.bin')
+            self._replace(path, value, fmt)
+
+        self._written.add(os.path.abspath(path))
+        return LazyBlob(path, fmt).getJSON()
+
+    def putBlob(self, name: str, blob: LazyBlob) -> LazyBlob:
+        """
+        Stores a value that has not been loaded yet without mapping it
+        :return: The blob in the store, the caller should point the value at it
+        """
+        if (os.path.dirname(os.path.abspath(blob.path)) == os.path.abspath(self.directory)
+                and os.path.abspath(blob.path) not in self._written):
+            # Already in the store, keep the file
+            path = blob.path
+        else:
+            path = self._path(name, '.npy' if blob.fmt == _NPY else '.bin', blob)
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = f'{path}.tmp'
+            with open(blob.path, mode='rb') as src, open(tmp, mode='wb') as dst:
+                while True:
+                    chunk = src.read(1 << 20)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+            os.replace(tmp, path)
+
+        self._written.add(os.path.abspath(path))
+        return blob if path == blob.path else LazyBlob(path, blob.fmt)
+
+    def get(self, ref: Dict[str, str]) -> LazyBlob:
+        """
+        Resolves a JSON reference, the file is not opened until the value is used
+        """
+        try:
+            fmt = ref[_FORMAT]
+            path = os.path.join(self.directory, ref[_BLOB])
+        except KeyError:
+            raise NodeGraphError("BlobStore.get()", f"Invalid blob reference: {ref}") from None
+
+        if not os.path.exists(path):
+            raise NodeGraphError("BlobStore.get()", f"Blob file missing: {path}")
+
+        return LazyBlob(path, fmt)
+
+    def prune(self):
+        """
+        Removes files not referenced by the last save
+        """
+        if not os.path.isdir(self.directory):
+            return
+
+        for entry in os.listdir(self.directory):
+            path = os.path.abspath(os.path.join(self.directory, entry))
+            # Files unloaded values still point at are kept, even if this save doesn't use them
+            if path not in self._written and not _isReferenced(path):
+                os.remove(path)
+
+        if len(os.listdir(self.directory)) == 0:
+            os.rmdir(self.directory)
+
+        self._written = set()
+
+
+def resolveArgJSON(value: Any, blobStore: Optional[BlobStore], loc: str) -> Any:
+    """
+    Swaps a blob reference for a LazyBlob, other values are returned as is
+    """
+    if not isBlobRef(value):
+        return value
+    if blobStore is None:
+        raise NodeGraphError(loc, f"Cannot load blob reference {value}, no blob store given")
+    return blobStore.get(value)
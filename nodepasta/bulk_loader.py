@@ -0,0 +1,156 @@
+import os
+import glob
+import json
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Type, Union, Iterable, Any, Tuple
+
+from nodepasta.node import Node
+from nodepasta.nodegraph import NodeGraph, _NODES, _LINKS, _CLASS, _ARGS, _POS, _IN_VAR_PORTS, _OUT_VAR_PORTS
+from nodepasta.errors import NodeGraphError
+from nodepasta.blobstore import BlobStore, blobDirFor
+
+# Node types registered in each worker process
+_WORKER_TYPES: Sequence[Type[Node]] = []
+
+
+class GraphPlan:
+    """
+    Compact, picklable result of parsing and validating a graph file.
+    Holds the nodes and resolved links of a graph that already loaded without errors,
+    and the precomputed traversal order
+    """
+
+    def __init__(
+        self, filename: str, nodes: List[Tuple[str, Dict[str, Any], Tuple[float, float], str, List[int], List[int]]],
+        links: List[Tuple[int, int, bool]], order: List[int]
+    ):
+        self.filename = filename
+        # (Type, Args, Pos, Uid, In var ports, Out var ports)
+        self.nodes = nodes
+        # (Parent port ID, Child port ID, Delay)
+        self.links = links
+        # Traversal as indices into nodes
+        self.order = order
+
+    def build(self, nodeTypes: Sequence[Type[Node]]) -> NodeGraph:
+        """
+        Creates the NodeGraph. The plan was validated by the worker, so nothing is
+        checked again and the traversal is reused instead of being regenerated
+        """
+        ng = NodeGraph()
+        for t in nodeTypes:
+            ng.registerNodeClass(t)
+
+        ng._filename = self.filename
+        ng._loadValidated(self.nodes, self.links, self.order, BlobStore(blobDirFor(self.filename)))
+        return ng
+
+
+class BulkLoadResult:
+
+    def __init__(self):
+        # Filename -> Graph, filled when graphs are built
+        self.graphs: Dict[str, NodeGraph] = {}
+        # Filename -> Plan, filled when only plans are requested
+        self.plans: Dict[str, GraphPlan] = {}
+        # Filename -> Error, a bad file never fails the batch
+        self.errors: Dict[str, NodeGraphError] = {}
+
+    @property
+    def ok(self) -> bool:
+        return len(self.errors) == 0
+
+
+def _initWorker(nodeTypes: Sequence[Type[Node]]):
+    global _WORKER_TYPES
+    _WORKER_TYPES = nodeTypes
+
+
+def _parseGraph(filename: str) -> Tuple[str, Optional[GraphPlan], Optional[Tuple[str, str]]]:
+    """
+    Runs in a worker process, errors are returned rather than raised
+    so that they can cross the process boundary
+    """
+    try:
+        try:
+            with open(filename, mode='r') as f:
+                jGraph = json.load(f)
+        except json.JSONDecodeError as err:
+            raise NodeGraphError("NodeGraph.loadFromFile()", f"Cannot load file, JSON Error: {err}")
+
+        # Fully construct the graph to validate it
+        ng = NodeGraph()
+        for t in _WORKER_TYPES:
+            ng.registerNodeClass(t)
+        ng.loadFromJSON(jGraph, BlobStore(blobDirFor(filename)))
+
+        indices = {node.nodeID: idx for idx, node in enumerate(ng)}
+        order = [indices[node.nodeID] for node in ng._genNodeOrder()]
+        # The graph loaded, so every field is present and every link is valid
+        nodes = [
+            (n[_CLASS], n[_ARGS], tuple(n[_POS]), node.uid, n[_IN_VAR_PORTS], n[_OUT_VAR_PORTS])
+            for n, node in zip(jGraph[_NODES], ng)
+        ]
+        links = [(link[0], link[1], len(link) > 2 and bool(link[2])) for link in jGraph[_LINKS]]
+        return filename, GraphPlan(filename, nodes, links, order), None
+    except NodeGraphError as err:
+        return filename, None, (err.loc, err.msg)
+    except Exception as err:
+        return filename, None, ("bulk_loader._parseGraph()", f"{type(err).__name__}: {err}")
+
+
+def _listFiles(sources: Union[str, Iterable[str]], pattern: str) -> List[str]:
+    if isinstance(sources, str):
+        sources = [sources]
+
+    out = []
+    for src in sources:
+        if os.path.isdir(src):
+            out.extend(sorted(glob.glob(os.path.join(src, pattern))))
+        else:
+            out.append(src)
+    return out
+
+
+def loadGraphs(
+    sources: Union[str, Iterable[str]],
+    nodeTypes: Sequence[Type[Node]],
+    maxWorkers: Optional[int] = None,
+    plansOnly: bool = False,
+    pattern: str = '*.json'
+) -> BulkLoadResult:
+    """
+    Parses and validates many graph files in a process pool
+    :param sources: A directory, a file, or a list of either
+    :param nodeTypes: The node classes to register, must be importable by the workers
+    :param maxWorkers: Number of worker processes, defaults to the core count
+    :param plansOnly: Return GraphPlans instead of building the NodeGraphs in this process
+    :param pattern: Glob used to find graph files in directories
+    :return: The graphs or plans and the errors, keyed by filename
+    """
+    files = _listFiles(sources, pattern)
+    out = BulkLoadResult()
+    if len(files) == 0:
+        return out
+
+    if maxWorkers is None:
+        maxWorkers = os.cpu_count() or 1
+    maxWorkers = min(maxWorkers, len(files))
+    chunksize = max(1, len(files) // (maxWorkers * 4))
+
+    with ProcessPoolExecutor(maxWorkers, initializer=_initWorker, initargs=(list(nodeTypes), )) as pool:
+        for filename, plan, err in pool.map(_parseGraph, files, chunksize=chunksize):
+            if err is not None:
+                out.errors[filename] = NodeGraphError(err[0], err[1])
+                continue
+
+            if plansOnly:
+                out.plans[filename] = plan  # type: ignore
+                continue
+
+            try:
+                out.graphs[filename] = plan.build(nodeTypes)  # type: ignore
+            except NodeGraphError as err:
+                out.errors[filename] = err
+
+    return out
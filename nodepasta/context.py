@@ -0,0 +1,180 @@
+import time
+import threading
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from nodepasta.errors import ExecutionError, ExecutionCancelledError, ExecutionTimeoutError
+
+# The context of the execution running in the current thread, if any
+_CURRENT: ContextVar[Optional['ExecutionContext']] = ContextVar('nodepasta_exec_ctx', default=None)
+# The cancel token of the execution running in the current thread, if any
+_TOKEN: ContextVar[Optional['CancelToken']] = ContextVar('nodepasta_cancel_token', default=None)
+
+
+def currentContext() -> Optional['ExecutionContext']:
+    return _CURRENT.get()
+
+
+def currentToken() -> Optional['CancelToken']:
+    return _TOKEN.get()
+
+
+class CancelToken:
+    """
+    Stops a run from another thread, e.g. an editor or a request handler.
+    The graph stops before the next node, long running nodes should also
+    poll Node.cancelled or call Node.checkCancelled() and return early
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        """
+        :param timeout: Seconds from now after which the token cancels itself
+        """
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        # time.monotonic() time of the deadline
+        self.deadline: Optional[float] = None if timeout is None else time.monotonic() + timeout
+        self.reason = ''
+        # Set if the token was cancelled because time ran out
+        self.expired = False
+
+    def cancel(self, reason: str = 'Cancelled'):
+        self._cancel(reason, False)
+
+    def _cancel(self, reason: str, expired: bool):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self.expired = expired
+            self._event.set()
+            callbacks = list(self._callbacks)
+        for func in callbacks:
+            func()
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self._cancel('Deadline passed', True)
+            return True
+        return False
+
+    def remaining(self) -> Optional[float]:
+        """
+        :return: Seconds until the deadline, None without one
+        """
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Sleeps until the token is cancelled or the timeout passes,
+        for nodes that would otherwise call time.sleep()
+        :return: Whether the token is cancelled
+        """
+        remaining = self.remaining()
+        if remaining is not None and (timeout is None or remaining < timeout):
+            timeout = remaining
+        self._event.wait(timeout)
+        return self.cancelled
+
+    def check(self, loc: str = 'CancelToken.check()', node: Any = None):
+        """
+        Raises ExecutionCancelledError if the token is cancelled,
+        ExecutionTimeoutError if it was cancelled because time ran out
+        :param node: The node running, named in the error
+        """
+        if self.cancelled:
+            raise self.error(loc, node)
+
+    def error(self, loc: str, node: Any = None, running: bool = True) -> ExecutionError:
+        """
+        The error to raise once the token is cancelled
+        :param node: The node named in the error
+        :param running: Whether the node was running, or about to
+        """
+        msg = self.reason
+        if node is not None:
+            msg += f", {'while running' if running else 'before'} node '{node}'"
+        if self.expired:
+            return ExecutionTimeoutError(loc, msg, node)
+        return ExecutionCancelledError(loc, msg, node)
+
+    def addCallback(self, func: Callable[[], None]):
+        """
+        Calls func once the token is cancelled, right away if it already is
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(func)
+                return
+        func()
+
+    def removeCallback(self, func: Callable[[], None]):
+        with self._lock:
+            try:
+                self._callbacks.remove(func)
+            except ValueError:
+                pass
+
+
+class ExecutionContext:
+    """
+    Holds the state of a single execution of a NodeGraph.
+    Passing a separate context to each NodeGraph.execute() call allows
+    one graph instance to be executed from several threads at once
+    """
+
+    def __init__(self, datamap: Optional[Dict[Hashable, Any]] = None):
+        """
+        :param datamap: Per-run datamap values, these shadow the graph's datamap
+        """
+        # LinkID -> Value
+        self.linkValues: Dict[int, Any] = {}
+        self.datamap: Dict[Hashable, Any] = {} if datamap is None else datamap
+        # NodeID -> Scratch state
+        self.nodeState: Dict[int, Dict[str, Any]] = {}
+        # Var input port -> Its buffer for this run
+        self.varBuffers: Dict[int, Any] = {}
+        # LinkID -> Value written to a delay link by the last run
+        self.delayValues: Dict[int, Any] = {}
+        # NodeID -> Inputs and outputs of the last run of a memoized node
+        self.memos: Dict[int, Any] = {}
+        # The watchdog of a timed out or cancelled run whose worker is still in a node
+        self._abandoned: Any = None
+
+    def state(self, nodeID: int) -> Dict[str, Any]:
+        try:
+            return self.nodeState[nodeID]
+        except KeyError:
+            out = self.nodeState[nodeID] = {}
+            return out
+
+    def _forgetNode(self, nodeID: int):
+        # The node was removed, its ID may be handed to a new node
+        self.nodeState.pop(nodeID, None)
+        self.memos.pop(nodeID, None)
+
+    def _forgetLink(self, linkID: int):
+        # The link was removed, its ID may be handed to a new link
+        self.delayValues.pop(linkID, None)
+        self.linkValues.pop(linkID, None)
+        self.linkValues.pop(~linkID, None)
+
+    def reset(self):
+        """
+        Clears the link values before a new run, node state, the datamap
+        and the values carried by delay links are kept
+        """
+        self.linkValues = {}
+        self.varBuffers = {}
+
+    def resetDelays(self):
+        """
+        Clears the values carried by delay links, the next run reads None from them
+        """
+        self.delayValues = {}
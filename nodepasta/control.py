@@ -0,0 +1,88 @@
+from typing import Sequence
+
+from nodepasta.node import Node, Port, EFFECT_PURE
+from nodepasta.ports import InPort
+from nodepasta.argtypes import ANY, BOOL, INT
+
+
+class ControlNode(Node):
+    """
+    Base for control flow nodes. With lazy evaluation enabled (NodeGraph.enableLazyEvaluation())
+    only the inputs listed in CONTROL_INPUTS are evaluated first, then only the
+    upstream nodes of the ports returned by branchPorts()
+    """
+
+    EFFECT = EFFECT_PURE
+
+    # Indices into inputs of the ports deciding which branch is taken
+    CONTROL_INPUTS: Sequence[int] = ()
+
+    def controlPorts(self) -> Sequence[InPort]:
+        out = []
+        for idx in self.CONTROL_INPUTS:
+            out.extend(self.inputs[idx].getPorts())
+        return out
+
+    def branchPorts(self) -> Sequence[InPort]:
+        """
+        Called once the control ports have values
+        :return: The other input ports needed this run
+        """
+        raise NotImplementedError
+
+    def init(self) -> None:
+        pass
+
+    def setup(self) -> None:
+        pass
+
+
+class SelectNode(ControlNode):
+    DESCRIPTION = "Outputs one of two values depending on a condition, only the chosen side is evaluated"
+    _INPUTS = [
+        Port("cond", BOOL, "The condition"),
+        Port("ifTrue", ANY, "Output when the condition is true"),
+        Port("ifFalse", ANY, "Output when the condition is false")
+    ]
+    _OUTPUTS = [Port("value", ANY, "The chosen value")]
+    NODETYPE = "Select"
+    CONTROL_INPUTS = [0]
+
+    def branchPorts(self) -> Sequence[InPort]:
+        return [self.inputs[1] if self.inputs[0].value() else self.inputs[2]]
+
+    def execute(self) -> None:
+        self.outputs[0].value(self.branchPorts()[0].value())
+
+
+class GateNode(ControlNode):
+    DESCRIPTION = "Passes the value through while open, the value is only evaluated while open"
+    _INPUTS = [Port("open", BOOL, "Whether the gate is open"), Port("value", ANY, "The input")]
+    _OUTPUTS = [Port("value", ANY, "The input while open, else nothing")]
+    NODETYPE = "Gate"
+    CONTROL_INPUTS = [0]
+
+    def branchPorts(self) -> Sequence[InPort]:
+        return [self.inputs[1]] if self.inputs[0].value() else []
+
+    def execute(self) -> None:
+        self.outputs[0].value(self.inputs[1].value() if self.inputs[0].value() else None)
+
+
+class SwitchNode(ControlNode):
+    DESCRIPTION = "Outputs the case chosen by the index, only that case is evaluated"
+    _INPUTS = [Port("index", INT, "The case to output"), Port("cases", ANY, "The cases", variable=True)]
+    _OUTPUTS = [Port("value", ANY, "The chosen case, nothing if the index is out of range")]
+    NODETYPE = "Switch"
+    CONTROL_INPUTS = [0]
+
+    def branchPorts(self) -> Sequence[InPort]:
+        idx = self.inputs[0].value()
+        cases = self.inputs[1].getPorts()
+        if idx is None or not 0 <= idx < len(cases):
+            return []
+        return [cases[int(idx)]]  # type: ignore
+
+    def execute(self) -> None:
+        ports = self.branchPorts()
+        self.outputs[0].value(ports[0].value() if len(ports) > 0 else None)
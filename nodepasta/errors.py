@@ -1,3 +1,6 @@
+from typing import Any
+
+
 class NodeGraphError(Exception):
     """
     Nodepasta Base Exception
@@ -36,3 +39,25 @@ class ExecutionError(NodeGraphError):
 
     def __init__(self, loc: str, msg: str):
         super().__init__(loc, f'ExecutionError: {msg}')
+
+
+class ExecutionTimeoutError(ExecutionError):
+    """
+    A run went past its deadline, or a node past its timeout
+    """
+
+    def __init__(self, loc: str, msg: str, node: Any = None):
+        super().__init__(loc, msg)
+        # The node running when time ran out, None if between nodes
+        self.node = node
+
+
+class ExecutionCancelledError(ExecutionError):
+    """
+    A run was stopped through its CancelToken
+    """
+
+    def __init__(self, loc: str, msg: str, node: Any = None):
+        super().__init__(loc, msg)
+        # The node running when the run was cancelled, None if between nodes
+        self.node = node
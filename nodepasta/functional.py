@@ -0,0 +1,168 @@
+import inspect
+import warnings
+from typing import Any, Callable, List, Optional, Sequence, Tuple, Type
+
+from nodepasta.node import Node, EFFECT_PURE
+from nodepasta.ports import Port, OutPort
+from nodepasta.argtypes import NodeArg, ANY
+from nodepasta.context import _CURRENT
+from nodepasta.spill import SpilledValue
+from nodepasta.errors import NodeDefError
+
+_DEF_OUTPUT = 'output'
+
+
+class FunctionNode(Node):
+    """
+    Node that calls a plain function with its resolved input and arg values,
+    see nodeFunction(). Not used directly
+    """
+
+    # One entry per parameter, in order. Inputs are (Input index, Required, Default),
+    # args are (Arg name, False, None)
+    _FN_PARAMS: List[Tuple[Any, bool, Any]] = []
+
+    @staticmethod
+    def _function(*args) -> Any:
+        raise NotImplementedError
+
+    def _init(self, idManager, inVarports=None, outVarPorts=None):
+        super()._init(idManager, inVarports, outVarPorts)
+        # Bound once, the port and arg objects live as long as the node
+        # (Port or Arg, Is arg, Is variable, Required, Default)
+        self._fnParams: List[Tuple[Any, bool, bool, bool, Any]] = []
+        for key, required, default in self._FN_PARAMS:
+            if isinstance(key, str):
+                self._fnParams.append((self.args[key], True, False, False, None))
+            else:
+                port = self.inputs[key]
+                self._fnParams.append((port, False, port.port.variable, required, default))
+        self._fnOutputs: List[OutPort] = list(self.outputs)
+
+    def execute(self) -> None:
+        ctx = _CURRENT.get()
+        values = None if ctx is None else ctx.linkValues
+
+        params = []
+        for src, isArg, variable, required, default in self._fnParams:
+            if isArg:
+                params.append(src.value)
+                continue
+
+            if variable:
+                v = src.value()
+            else:
+                link = src.link
+                if link is None:
+                    v = None
+                elif values is None:
+                    v = link.value
+                else:
+                    v = values.get(link.readID)
+                if type(v) is SpilledValue:
+                    v = v.get()
+
+            if v is None:
+                if required:
+                    # Missing input, the outputs are left unset
+                    return
+                v = default
+            params.append(v)
+
+        out = self._function(*params)
+
+        outputs = self._fnOutputs
+        if len(outputs) == 1:
+            outputs[0].value(out)
+        elif out is not None:
+            for port, v in zip(outputs, out):
+                port.value(v)
+
+
+def nodeFunction(
+    nodetype: str,
+    inputs: Optional[Sequence[Port]] = None,
+    outputs: Optional[Sequence[Port]] = None,
+    args: Sequence[NodeArg] = (),
+    description: Optional[str] = None,
+    pure: bool = False,
+    effect: Optional[str] = None
+) -> Callable[[Callable], Type[Node]]:
+    """
+    Decorator that makes a Node class from a plain function.
+    Parameters are matched by name to the input ports and args,
+    and the return value is written to the output port, or to each
+    output port in order as a tuple when there is more than one.
+
+    A parameter without a default is a required input, the function is
+    not called and the outputs are left unset while its port has no value.
+    Parameters with a default receive it instead.
+
+    :param nodetype: The NODETYPE of the new class
+    :param inputs: The input ports, defaults to one port of type ANY per parameter that is not an arg
+    :param outputs: The output ports, defaults to a single port of type ANY
+    :param args: The node args
+    :param description: Defaults to the function's docstring
+    :param pure: Deprecated, use effect=EFFECT_PURE
+    :param effect: Sets Node.EFFECT
+    :return: A Node class to register with NodeGraph.registerNodeClass()
+    """
+
+    def decorator(func: Callable) -> Type[Node]:
+        loc = 'nodeFunction()'
+        fnEffect = effect
+        if pure:
+            if effect not in (None, EFFECT_PURE):
+                raise NodeDefError(loc, f'{nodetype}: pure conflicts with effect: {effect}')
+            warnings.warn(f'{nodetype}: pure is deprecated, pass effect=EFFECT_PURE', DeprecationWarning, stacklevel=2)
+            fnEffect = EFFECT_PURE
+        params = inspect.signature(func).parameters
+        argNames = [x.name for x in args]
+
+        for param in params.values():
+            if param.kind != param.POSITIONAL_OR_KEYWORD:
+                raise NodeDefError(loc, f'{nodetype}: Parameter "{param.name}" must be a plain positional parameter')
+
+        inPorts = list(inputs) if inputs is not None else [
+            Port(name, ANY, "") for name in params if name not in argNames
+        ]
+        outPorts = list(outputs) if outputs is not None else [Port(_DEF_OUTPUT, ANY, "")]
+
+        inIndex = {port.name: idx for idx, port in enumerate(inPorts)}
+        for name in inIndex:
+            if name not in params:
+                raise NodeDefError(loc, f'{nodetype}: No parameter for input "{name}"')
+        for name in argNames:
+            if name not in params:
+                raise NodeDefError(loc, f'{nodetype}: No parameter for arg "{name}"')
+
+        fnParams = []
+        for name, param in params.items():
+            if name in inIndex and name in argNames:
+                raise NodeDefError(loc, f'{nodetype}: Parameter "{name}" is both an input and an arg')
+            if name in argNames:
+                fnParams.append((name, False, None))
+            elif name in inIndex:
+                required = param.default is param.empty
+                fnParams.append((inIndex[name], required, None if required else param.default))
+            else:
+                raise NodeDefError(loc, f'{nodetype}: Parameter "{name}" is not an input or an arg')
+
+        descr = description if description is not None else inspect.getdoc(func)
+
+        return type(
+            func.__name__, (FunctionNode, ), {
+                '__module__': func.__module__,
+                '__doc__': func.__doc__,
+                'NODETYPE': nodetype,
+                'DESCRIPTION': descr if descr else Node.DESCRIPTION,
+                'EFFECT': fnEffect,
+                '_INPUTS': inPorts,
+                '_OUTPUTS': outPorts,
+                '_ARGS': list(args),
+                '_FN_PARAMS': fnParams,
+                '_function': staticmethod(func),
+            }
+        )
+
+    return decorator
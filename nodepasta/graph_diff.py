@@ -0,0 +1,281 @@
+import os
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from nodepasta.nodegraph import NodeGraph, _NODES, _LINKS, _POS, _UID, _CLASS, _ARGS, _IN_VAR_PORTS, _OUT_VAR_PORTS
+from nodepasta.blobstore import BlobStore, blobDirFor, isBlobRef, _BLOB, _FORMAT
+from nodepasta.errors import NodeGraphError
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# (Parent uid, Parent port index, Child uid, Child port index), with a trailing 1 for delay links.
+# Port indices are local to the node, inputs first, as in the graph JSON
+LinkKey = Tuple[Any, ...]
+
+_ADDED_NODES = 'addedNodes'
+_REMOVED_NODES = 'removedNodes'
+_CHANGED_ARGS = 'changedArgs'
+_MOVED_NODES = 'movedNodes'
+_ADDED_LINKS = 'addedLinks'
+_REMOVED_LINKS = 'removedLinks'
+
+
+def _uid(n: Dict[str, Any], idx: int) -> str:
+    return n.get(_UID, f'#{idx}')
+
+
+def _numPorts(n: Dict[str, Any]) -> int:
+    return sum(n[_IN_VAR_PORTS]) + sum(n[_OUT_VAR_PORTS])
+
+
+def _linkKeys(jGraph: Dict[str, Any], uids: List[str]) -> List[LinkKey]:
+    # Rebased port ID -> (uid, local index)
+    owners: List[Tuple[str, int]] = []
+    for uid, n in zip(uids, jGraph[_NODES]):
+        owners.extend((uid, i) for i in range(_numPorts(n)))
+
+    out = []
+    for link in jGraph[_LINKS]:
+        pUid, pIdx = owners[link[0]]
+        cUid, cIdx = owners[link[1]]
+        if len(link) > 2 and link[2]:
+            out.append((pUid, pIdx, cUid, cIdx, 1))
+        else:
+            out.append((pUid, pIdx, cUid, cIdx))
+    return out
+
+
+def _blobsOf(graph: Union[NodeGraph, Dict[str, Any]]) -> Optional[BlobStore]:
+    if isinstance(graph, NodeGraph) and graph._filename:
+        return BlobStore(blobDirFor(graph._filename))
+    return None
+
+
+def _resolve(v: Any, blobs: Optional[BlobStore]) -> Any:
+    """
+    Maps a blob reference, so it can be compared with a loaded value
+    """
+    if blobs is None or not isBlobRef(v):
+        return v
+    try:
+        return blobs.get(v).load()
+    except NodeGraphError:
+        return v
+
+
+def _equal(a: Any, b: Any, oldBlobs: Optional[BlobStore] = None, newBlobs: Optional[BlobStore] = None) -> bool:
+    if a is b:
+        return True
+
+    if isBlobRef(a) and isBlobRef(b):
+        sameDir = oldBlobs is None or newBlobs is None or (
+            os.path.abspath(oldBlobs.directory) == os.path.abspath(newBlobs.directory)
+        )
+        if sameDir:
+            # A file is never rewritten while an unloaded value still points at it
+            return a.get(_BLOB) == b.get(_BLOB) and a.get(_FORMAT) == b.get(_FORMAT)
+    a = _resolve(a, oldBlobs)
+    b = _resolve(b, newBlobs)
+
+    if np is not None and (isinstance(a, np.ndarray) or isinstance(b, np.ndarray)):
+        return (
+            isinstance(a, np.ndarray) and isinstance(b, np.ndarray) and a.dtype == b.dtype
+            and bool(np.array_equal(a, b))
+        )
+    try:
+        return bool(a == b)
+    except Exception:
+        # e.g. containers of arrays
+        return False
+
+
+class GraphDiff:
+    """
+    Structural difference between two graph JSON documents,
+    nodes are matched by uid
+    """
+
+    def __init__(self):
+        # JSON entries of new nodes, including their uid
+        self.addedNodes: List[Dict[str, Any]] = []
+        self.removedNodes: List[str] = []
+        # uid -> Changed args only
+        self.changedArgs: Dict[str, Dict[str, Any]] = {}
+        # uid -> New pos
+        self.movedNodes: Dict[str, List[float]] = {}
+        self.addedLinks: List[LinkKey] = []
+        self.removedLinks: List[LinkKey] = []
+
+    def isEmpty(self) -> bool:
+        return (
+            len(self.addedNodes) == 0 and len(self.removedNodes) == 0 and len(self.changedArgs) == 0
+            and len(self.movedNodes) == 0 and len(self.addedLinks) == 0 and len(self.removedLinks) == 0
+        )
+
+    def getJSON(self) -> Dict[str, Any]:
+        """
+        The diff as a JSON document, small enough to ship instead of the whole graph
+        """
+        return {
+            _ADDED_NODES: self.addedNodes,
+            _REMOVED_NODES: self.removedNodes,
+            _CHANGED_ARGS: self.changedArgs,
+            _MOVED_NODES: self.movedNodes,
+            _ADDED_LINKS: [list(x) for x in self.addedLinks],
+            _REMOVED_LINKS: [list(x) for x in self.removedLinks]
+        }
+
+    def loadJSON(self, jDiff: Dict[str, Any]):
+        try:
+            self.addedNodes = list(jDiff[_ADDED_NODES])
+            self.removedNodes = list(jDiff[_REMOVED_NODES])
+            self.changedArgs = dict(jDiff[_CHANGED_ARGS])
+            self.movedNodes = dict(jDiff[_MOVED_NODES])
+            self.addedLinks = [tuple(x) for x in jDiff[_ADDED_LINKS]]  # type: ignore
+            self.removedLinks = [tuple(x) for x in jDiff[_REMOVED_LINKS]]  # type: ignore
+        except (KeyError, TypeError) as err:
+            raise NodeGraphError("GraphDiff.loadJSON()", f"Invalid diff: {err}") from None
+
+    def __str__(self) -> str:
+        return (
+            f'GraphDiff(nodes: +{len(self.addedNodes)} -{len(self.removedNodes)}, '
+            f'args: {len(self.changedArgs)}, moved: {len(self.movedNodes)}, '
+            f'links: +{len(self.addedLinks)} -{len(self.removedLinks)})'
+        )
+
+
+def diffJSON(
+    old: Dict[str, Any],
+    new: Dict[str, Any],
+    oldBlobs: Optional[BlobStore] = None,
+    newBlobs: Optional[BlobStore] = None
+) -> GraphDiff:
+    """
+    Computes the changes that turn old into new, in linear time
+    :param old: A graph JSON document, as from NodeGraph.getJSON()
+    :param new: A graph JSON document
+    :param oldBlobs: Resolves the blob references in old, to compare them with loaded values in new
+    :param newBlobs: Resolves the blob references in new
+    :return: The diff
+    """
+    out = GraphDiff()
+
+    oldUids = [_uid(n, idx) for idx, n in enumerate(old[_NODES])]
+    newUids = [_uid(n, idx) for idx, n in enumerate(new[_NODES])]
+    oldNodes = dict(zip(oldUids, old[_NODES]))
+    newNodes = dict(zip(newUids, new[_NODES]))
+
+    # Nodes whose class or port layout changed are removed and added again
+    replaced = set()
+
+    for uid, n in oldNodes.items():
+        if uid not in newNodes:
+            out.removedNodes.append(uid)
+
+    for uid, n in newNodes.items():
+        try:
+            o = oldNodes[uid]
+        except KeyError:
+            out.addedNodes.append(dict(n, **{_UID: uid}))
+            continue
+
+        if o[_CLASS] != n[_CLASS] or o[_IN_VAR_PORTS] != n[_IN_VAR_PORTS] or o[_OUT_VAR_PORTS] != n[_OUT_VAR_PORTS]:
+            replaced.add(uid)
+            out.removedNodes.append(uid)
+            out.addedNodes.append(dict(n, **{_UID: uid}))
+            continue
+
+        oArgs = o[_ARGS]
+        changed = {
+            key: val
+            for key, val in n[_ARGS].items()
+            if key not in oArgs or not _equal(oArgs[key], val, oldBlobs, newBlobs)
+        }
+        if len(changed) > 0:
+            out.changedArgs[uid] = changed
+
+        if list(o[_POS]) != list(n[_POS]):
+            out.movedNodes[uid] = list(n[_POS])
+
+    oldLinks = _linkKeys(old, oldUids)
+    newLinks = _linkKeys(new, newUids)
+    oldSet = set(oldLinks)
+    newSet = set(newLinks)
+
+    def touchesReplaced(key: LinkKey) -> bool:
+        return key[0] in replaced or key[2] in replaced
+
+    out.removedLinks = [x for x in oldLinks if x not in newSet or touchesReplaced(x)]
+    out.addedLinks = [x for x in newLinks if x not in oldSet or touchesReplaced(x)]
+
+    return out
+
+
+def diffGraphs(old: Union[NodeGraph, Dict[str, Any]], new: Union[NodeGraph, Dict[str, Any]]) -> GraphDiff:
+    """
+    Computes the changes that turn old into new. Nodes are matched by uid,
+    so new should be a copy or a reload of old, not a separately built graph
+    :param old: A graph, or a graph JSON document
+    :param new: A graph, or a graph JSON document
+    :return: The diff
+    """
+    oldBlobs = _blobsOf(old)
+    newBlobs = _blobsOf(new)
+    if isinstance(old, NodeGraph):
+        old = old.getJSON()
+    if isinstance(new, NodeGraph):
+        new = new.getJSON()
+    return diffJSON(old, new, oldBlobs, newBlobs)
+
+
+
+def applyToJSON(jGraph: Dict[str, Any], diff: GraphDiff) -> Dict[str, Any]:
+    """
+    Patches a graph JSON document, in linear time.
+    Every node in the output has an explicit uid
+    :param jGraph: The graph document, not modified
+    :param diff: The diff to apply
+    :return: The patched document
+    """
+    uids = [_uid(n, idx) for idx, n in enumerate(jGraph[_NODES])]
+    links = _linkKeys(jGraph, uids)
+
+    removed = set(diff.removedNodes)
+    nodes: List[Dict[str, Any]] = []
+    for uid, n in zip(uids, jGraph[_NODES]):
+        if uid in removed:
+            continue
+        n = dict(n, **{_UID: uid})
+        if uid in diff.changedArgs:
+            n[_ARGS] = dict(n[_ARGS], **diff.changedArgs[uid])
+        if uid in diff.movedNodes:
+            n[_POS] = list(diff.movedNodes[uid])
+        nodes.append(n)
+    nodes.extend(diff.addedNodes)
+
+    # uid -> Rebased ID of the node's first port
+    portBase: Dict[str, int] = {}
+    numPorts = 0
+    for n in nodes:
+        portBase[n[_UID]] = numPorts
+        numPorts += _numPorts(n)
+
+    removedLinks = set(diff.removedLinks)
+    outLinks = []
+    for key in links + diff.addedLinks:
+        if key in removedLinks:
+            # Only the original link is removed, a re-added link is kept
+            removedLinks.discard(key)
+            continue
+        pUid, pIdx, cUid, cIdx = key[:4]
+        try:
+            outLinks.append([portBase[pUid] + pIdx, portBase[cUid] + cIdx] + list(key[4:]))
+        except KeyError:
+            raise NodeGraphError("graph_diff.applyToJSON()", f"Link {key} references a missing node") from None
+
+    return {
+        _NODES: nodes,
+        _LINKS: outLinks
+    }
@@ -0,0 +1,265 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Type
+
+from nodepasta.node import Node
+from nodepasta.nodegraph import NodeGraph
+from nodepasta.errors import NodeGraphError
+from nodepasta.blobstore import BlobStore, blobDirFor
+
+
+class PoolStats:
+    """
+    Snapshot of a NodeGraphPool's metrics
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.inUse = 0
+        self.checkouts = 0
+        # Checkouts that had to wait for an instance
+        self.waits = 0
+        self.totalWaitTime = 0.0
+        self.maxWaitTime = 0.0
+        # Total time instances have spent checked out
+        self.busyTime = 0.0
+        self.evicted = 0
+        self.unhealthy = 0
+
+    @property
+    def meanWaitTime(self) -> float:
+        return self.totalWaitTime / self.checkouts if self.checkouts > 0 else 0.0
+
+    @property
+    def utilization(self) -> float:
+        """
+        Fraction of the pool currently checked out
+        """
+        return self.inUse / self.size if self.size > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f'PoolStats(size: {self.size}, inUse: {self.inUse}, checkouts: {self.checkouts}, '
+            f'meanWait: {self.meanWaitTime:.6f}s, maxWait: {self.maxWaitTime:.6f}s, '
+            f'evicted: {self.evicted}, unhealthy: {self.unhealthy})'
+        )
+
+
+class NodeGraphPool:
+    """
+    Pool of loaded graph instances that have already had setupNodes() called.
+    Instances are leased to one user at a time
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        nodeTypes: Sequence[Type[Node]],
+        size: int,
+        maxSize: Optional[int] = None,
+        maxIdle: Optional[float] = None,
+        healthCheck: Optional[Callable[[NodeGraph], bool]] = None
+    ):
+        """
+        :param filename: The graph file
+        :param nodeTypes: The node classes used by the graph
+        :param size: Number of instances to preload, idle eviction never shrinks the pool below this
+        :param maxSize: Upper bound the pool may grow to under load, defaults to size
+        :param maxIdle: Seconds an instance above the minimum size may stay unused before it is dropped
+        :param healthCheck: Called on checkout, an instance failing it is replaced
+        """
+        if size < 1:
+            raise NodeGraphError("NodeGraphPool.init()", f"Invalid pool size: {size}")
+
+        self.filename = filename
+        self._nodeTypes = list(nodeTypes)
+        self._minSize = size
+        self._maxSize = size if maxSize is None else max(size, maxSize)
+        self._maxIdle = maxIdle
+        self._healthCheck = healthCheck
+
+        try:
+            with open(filename, mode='r') as f:
+                self._jGraph = json.load(f)
+        except json.JSONDecodeError as err:
+            raise NodeGraphError("NodeGraphPool.init()", f"Cannot load file, JSON Error: {err}")
+
+        self._cond = threading.Condition()
+        # Most recently returned last, along with the return time
+        self._idle: List[Tuple[NodeGraph, float]] = []
+        # id(graph) -> checkout time
+        self._leased: Dict[int, float] = {}
+        # Instances being created outside the lock
+        self._pending = 0
+        self._closed = False
+        self._stats = PoolStats()
+
+        for _ in range(size):
+            self._idle.append((self._create(), time.monotonic()))
+
+    def _create(self) -> NodeGraph:
+        ng = NodeGraph()
+        for t in self._nodeTypes:
+            ng.registerNodeClass(t)
+        ng._filename = self.filename
+        ng.loadFromJSON(self._jGraph, BlobStore(blobDirFor(self.filename)))
+        ng.genTraversal()
+        ng.setupNodes()
+        return ng
+
+    def _total(self) -> int:
+        return len(self._idle) + len(self._leased) + self._pending
+
+    def _evictIdle(self, now: float):
+        if self._maxIdle is None:
+            return
+        # Oldest instances are at the front
+        while len(self._idle) > 0 and self._total() > self._minSize and now - self._idle[0][1] > self._maxIdle:
+            self._idle.pop(0)
+            self._stats.evicted += 1
+
+    def checkout(self, timeout: Optional[float] = None) -> NodeGraph:
+        """
+        Leases an instance, waiting for one to be returned if the pool is exhausted
+        :param timeout: Max seconds to wait, None waits forever
+        :return: The graph, must be returned with checkin()
+        """
+        start = time.monotonic()
+        waited = False
+        while True:
+            create = False
+            with self._cond:
+                if self._closed:
+                    raise NodeGraphError("NodeGraphPool.checkout()", "Pool is closed")
+
+                self._evictIdle(start)
+                while len(self._idle) == 0 and self._total() >= self._maxSize:
+                    waited = True
+                    remaining = None if timeout is None else timeout - (time.monotonic() - start)
+                    if remaining is not None and remaining <= 0:
+                        raise NodeGraphError(
+                            "NodeGraphPool.checkout()", f"Timed out after {timeout}s waiting for a graph instance"
+                        )
+                    self._cond.wait(remaining)
+                    if self._closed:
+                        raise NodeGraphError("NodeGraphPool.checkout()", "Pool is closed")
+
+                if len(self._idle) > 0:
+                    ng, _ = self._idle.pop()
+                else:
+                    create = True
+                    self._pending += 1
+
+            if create:
+                try:
+                    ng = self._create()
+                finally:
+                    with self._cond:
+                        self._pending -= 1
+                        # On error the slot is free again, a waiter may take it
+                        self._cond.notify()
+            elif self._healthCheck is not None and not self._healthCheck(ng):
+                with self._cond:
+                    self._stats.unhealthy += 1
+                    self._cond.notify()
+                # Try again, the dropped instance frees a slot for a new one
+                continue
+
+            now = time.monotonic()
+            with self._cond:
+                self._leased[id(ng)] = now
+                stats = self._stats
+                wait = now - start
+                stats.checkouts += 1
+                stats.totalWaitTime += wait
+                stats.maxWaitTime = max(stats.maxWaitTime, wait)
+                if waited:
+                    stats.waits += 1
+            return ng
+
+    def checkin(self, ng: NodeGraph, healthy: bool = True):
+        """
+        Returns a leased instance
+        :param healthy: Pass False to drop the instance instead of reusing it,
+                        a new one is created if the pool drops below its minimum size
+        """
+        now = time.monotonic()
+        with self._cond:
+            try:
+                leaseStart = self._leased.pop(id(ng))
+            except KeyError:
+                raise NodeGraphError("NodeGraphPool.checkin()", "Graph was not checked out from this pool") from None
+
+            self._stats.busyTime += now - leaseStart
+            if not healthy:
+                self._stats.unhealthy += 1
+            elif not self._closed:
+                self._idle.append((ng, now))
+                self._evictIdle(now)
+            self._cond.notify()
+
+        if not healthy:
+            self._refill()
+
+    def _refill(self):
+        """
+        Creates instances until the pool is back at its minimum size
+        """
+        while True:
+            with self._cond:
+                if self._closed or self._total() >= self._minSize:
+                    return
+                self._pending += 1
+
+            ng = None
+            try:
+                ng = self._create()
+            except NodeGraphError:
+                # checkout() creates one when needed, and raises the error then
+                pass
+            finally:
+                with self._cond:
+                    self._pending -= 1
+                    if ng is not None and not self._closed:
+                        self._idle.append((ng, time.monotonic()))
+                    self._cond.notify()
+            if ng is None:
+                return
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None) -> Iterator[NodeGraph]:
+        """
+        Checks out an instance for the duration of a with block.
+        The instance is dropped if the block raises a NodeGraphError, e.g. a node failed
+        or timed out, as it may be left in a bad state. Other errors come from the caller's
+        own code and the instance is reused
+        """
+        ng = self.checkout(timeout)
+        healthy = True
+        try:
+            yield ng
+        except NodeGraphError:
+            healthy = False
+            raise
+        finally:
+            self.checkin(ng, healthy)
+
+    def stats(self) -> PoolStats:
+        with self._cond:
+            self._evictIdle(time.monotonic())
+            out = PoolStats()
+            out.__dict__.update(self._stats.__dict__)
+            out.size = self._total()
+            out.inUse = len(self._leased)
+            return out
+
+    def close(self):
+        """
+        Drops all idle instances, leased instances are dropped when returned
+        """
+        with self._cond:
+            self._closed = True
+            self._idle = []
+            self._cond.notify_all()
@@ -1,22 +1,115 @@
+from typing import List, Set, Tuple
+
+from nodepasta.errors import NodeGraphError
+
+
+def _newBlock(free: List[int], freed: Set[int], gen: int, num: int) -> Tuple[List[int], int]:
+    """
+    :return: num IDs, reused ones first, and the new last ID handed out
+    """
+    take = min(num, len(free))
+    out = free[len(free) - take:]
+    del free[len(free) - take:]
+    freed.difference_update(out)
+    rest = num - take
+    out.extend(range(gen + 1, gen + 1 + rest))
+    return out, gen + rest
+
+
+def _free(free: List[int], freed: Set[int], gen: int, objID: int, kind: str):
+    # IDs this manager never handed out, e.g. -1 for unregistered objects, are ignored
+    if objID < 0 or objID > gen:
+        return
+    if objID in freed:
+        raise NodeGraphError("IDManager.free()", f"{kind} ID {objID} freed twice")
+    free.append(objID)
+    freed.add(objID)
+
+
 class IDManager:
-    def __init__(self) -> None:
-        self._nodeIDGen = -1
-        self._portIDGen = -1
-        self._linkIDGen = -1
+    """
+    Allocates node, port and link IDs. Freed IDs are reused, the last one freed first,
+    so they don't grow without bound as objects are removed and added
+    """
+
+    def __init__(self, recycle: bool = True) -> None:
+        """
+        :param recycle: If false IDs only ever increase, as in older versions
+        """
+        self.recycle = recycle
+        self.reset()
 
     def reset(self):
         self._nodeIDGen = -1
         self._portIDGen = -1
         self._linkIDGen = -1
+        # Freed IDs waiting to be reused
+        self._freeNodes: List[int] = []
+        self._freePorts: List[int] = []
+        self._freeLinks: List[int] = []
+        # The same IDs, to catch double frees
+        self._freedNodes: Set[int] = set()
+        self._freedPorts: Set[int] = set()
+        self._freedLinks: Set[int] = set()
 
     def newNode(self) -> int:
+        if self._freeNodes:
+            out = self._freeNodes.pop()
+            self._freedNodes.discard(out)
+            return out
         self._nodeIDGen += 1
         return self._nodeIDGen
 
     def newPort(self) -> int:
+        if self._freePorts:
+            out = self._freePorts.pop()
+            self._freedPorts.discard(out)
+            return out
         self._portIDGen += 1
         return self._portIDGen
 
     def newLink(self) -> int:
+        if self._freeLinks:
+            out = self._freeLinks.pop()
+            self._freedLinks.discard(out)
+            return out
         self._linkIDGen += 1
         return self._linkIDGen
+
+    def newNodes(self, num: int) -> List[int]:
+        out, self._nodeIDGen = _newBlock(self._freeNodes, self._freedNodes, self._nodeIDGen, num)
+        return out
+
+    def newPorts(self, num: int) -> List[int]:
+        out, self._portIDGen = _newBlock(self._freePorts, self._freedPorts, self._portIDGen, num)
+        return out
+
+    def newLinks(self, num: int) -> List[int]:
+        out, self._linkIDGen = _newBlock(self._freeLinks, self._freedLinks, self._linkIDGen, num)
+        return out
+
+    # The graph frees each ID once, when the object owning it is removed. Freeing it again raises
+
+    def freeNode(self, nodeID: int):
+        if self.recycle:
+            _free(self._freeNodes, self._freedNodes, self._nodeIDGen, nodeID, "Node")
+
+    def freePort(self, portID: int):
+        if self.recycle:
+            _free(self._freePorts, self._freedPorts, self._portIDGen, portID, "Port")
+
+    def freeLink(self, linkID: int):
+        if self.recycle:
+            _free(self._freeLinks, self._freedLinks, self._linkIDGen, linkID, "Link")
+
+    def capacity(self) -> Tuple[int, int, int]:
+        """
+        :return: One more than the highest node, port and link ID handed out
+        """
+        return self._nodeIDGen + 1, self._portIDGen + 1, self._linkIDGen + 1
+
+    def numFree(self) -> Tuple[int, int, int]:
+        """
+        :return: The number of node, port and link IDs waiting to be reused
+        """
+        return len(self._freeNodes), len(self._freePorts), len(self._freeLinks)
@@ -161,13 +161,11 @@ class ImNodeGraph:
             im.Text(port.port.name)
             im.SameLine()
             if im.Button(f" + ##{port.portID}"):
-                newPort = port.addVarPort()
-                self.ng._portLookup[newPort.portID] = newPort
+                self.ng.addVarPort(port)
             im.SameLine()
             im.BeginDisabled(len(varports) == 1)
             if im.Button(f" - ##{port.portID}"):
-                port.remVarPort()
-                self.ng._portLookup.pop(varports[-1].portID)
+                self.ng.remVarPort(port)
                 varports = varports[:-1]
             im.EndDisabled()
 
@@ -199,11 +197,12 @@ class ImNodeGraph:
         if not im.BeginPopup(_ADD_NODE_PU):
             return
 
-        for nodeType in self.ng.nodeTypes():
-            if im.Selectable(nodeType.NODETYPE):
+        # Types from a registry are only imported once picked
+        for nodetype in self.ng.nodeTypeNames():
+            if im.Selectable(nodetype):
                 self.needToSave = True
                 pos = im.GetMousePosOnOpeningCurrentPopup()
                 pan = imnodes.EditorContextGetPanning()
-                self.ng.addNode(nodeType).pos = Vec(pos.x - pan.x, pos.y - pan.y)
+                self.ng.addNode(self.ng.getNodeType(nodetype)).pos = Vec(pos.x - pan.x, pos.y - pan.y)
 
         im.EndPopup()
@@ -0,0 +1,269 @@
+import os
+import json
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple, Type
+
+from nodepasta.node import Node
+from nodepasta.ports import Port, InPort, OutPort
+from nodepasta.argtypes import NodeArg, STRING, ANY
+from nodepasta.errors import NodeGraphError, NodeDefError
+from nodepasta.id_manager import IDManager
+from nodepasta.blobstore import BlobStore, blobDirFor
+from nodepasta.nodegraph import NodeGraph, _NODES, _LINKS, _CLASS, _ARGS, _IN_VAR_PORTS, _OUT_VAR_PORTS
+
+_NAME = 'name'
+_TYPE = 'type'
+
+
+def _setPortType(port: Any, name: str, typeStr: str, descr: str):
+    port.port = Port(name, typeStr, descr)
+    port.allowAny = typeStr == ANY
+
+
+class MacroInputNode(Node):
+    DESCRIPTION = "Declares an input port of the graph when it is used as a macro"
+    _OUTPUTS = [Port("value", ANY, "The value passed into the macro")]
+    _ARGS = [
+        NodeArg(_NAME, STRING, "Name", "The name of the macro port", "input"),
+        NodeArg(_TYPE, STRING, "Type", "The type of the macro port", ANY)
+    ]
+    NODETYPE = "MacroInput"
+
+    # The macro's port this node forwards, set when instantiated inside a macro
+    _source: Optional[InPort] = None
+
+    def loadArgs(self, args: Dict[str, Any], blobStore: Optional[BlobStore] = None) -> None:
+        super().loadArgs(args, blobStore)
+        # Type the output so it can be linked to typed ports
+        _setPortType(self.outputs[0], "value", self.args[_TYPE].value, "The value passed into the macro")
+
+    def init(self) -> None:
+        pass
+
+    def setup(self) -> None:
+        pass
+
+    def upstreamPorts(self) -> Sequence[InPort]:
+        # Reads the macro's port rather than its own
+        return [] if self._source is None else [self._source]
+
+    def execute(self) -> None:
+        self.outputs[0].value(None if self._source is None else self._source.value())
+
+
+class MacroOutputNode(Node):
+    DESCRIPTION = "Declares an output port of the graph when it is used as a macro"
+    _INPUTS = [Port("value", ANY, "The value returned from the macro")]
+    _ARGS = [
+        NodeArg(_NAME, STRING, "Name", "The name of the macro port", "output"),
+        NodeArg(_TYPE, STRING, "Type", "The type of the macro port", ANY)
+    ]
+    NODETYPE = "MacroOutput"
+
+    # The macro's port this node writes to, set when instantiated inside a macro
+    _target: Optional[OutPort] = None
+
+    def init(self) -> None:
+        pass
+
+    def setup(self) -> None:
+        pass
+
+    def execute(self) -> None:
+        if self._target is not None:
+            self._target.value(self.inputs[0].value())
+
+
+class MacroDefinition:
+    """
+    A parsed and validated macro graph. Loaded once per file version
+    and shared by every macro node created from it
+    """
+
+    def __init__(self, filename: str, nodeTypes: Sequence[Type[Node]]):
+        self.filename = filename
+        self.blobStore = BlobStore(blobDirFor(filename))
+
+        try:
+            with open(filename, mode='r') as f:
+                self.jGraph = json.load(f)
+        except json.JSONDecodeError as err:
+            raise NodeGraphError("MacroDefinition.init()", f"Cannot load {filename}, JSON Error: {err}")
+
+        # Build the graph once to validate it
+        ng = NodeGraph()
+        for t in nodeTypes:
+            ng.registerNodeClass(t)
+        ng.registerNodeClass(MacroInputNode)
+        ng.registerNodeClass(MacroOutputNode)
+        ng.loadFromJSON(self.jGraph, self.blobStore)
+
+        self.nodeTypes: Dict[str, Type[Node]] = dict(ng._nodeTypes)
+
+        nodes = list(ng)
+        indices = {node.nodeID: idx for idx, node in enumerate(nodes)}
+        # Execution order as indices into the node list
+        self.order = [indices[node.nodeID] for node in ng._genNodeOrder()]
+
+        # (Node index, Port)
+        self.inputs: List[Tuple[int, Port]] = []
+        self.outputs: List[Tuple[int, Port]] = []
+        for idx, node in enumerate(nodes):
+            if isinstance(node, MacroInputNode):
+                self.inputs.append((idx, Port(node.args[_NAME].value, node.args[_TYPE].value, "Macro input")))
+            elif isinstance(node, MacroOutputNode):
+                self.outputs.append((idx, Port(node.args[_NAME].value, node.args[_TYPE].value, "Macro output")))
+
+        for ports in (self.inputs, self.outputs):
+            names = [p.name for _, p in ports]
+            if len(set(names)) != len(names):
+                raise NodeDefError("MacroDefinition.init()", f"{filename}: Duplicate macro port names: {names}")
+
+    def instantiate(self, macro: 'MacroNode', idManager: IDManager) -> Tuple[List[Node], List[Node]]:
+        """
+        Creates the inner nodes for one macro node
+        :return: The inner nodes and their execution order
+        """
+        nodes: List[Node] = []
+        ports = []
+        for n in self.jGraph[_NODES]:
+            node = self.nodeTypes[n[_CLASS]]()
+            node._init(idManager, n[_IN_VAR_PORTS], n[_OUT_VAR_PORTS])
+            node.loadArgs(n[_ARGS], self.blobStore)
+            node.nodeID = idManager.newNode()
+            # Share the macro's view of the datamap
+            node.datamap = macro.datamap
+            # Same port order as NodeGraph.getJSON()
+            ports.extend(node.getInputPorts())
+            ports.extend(node.getOutputPorts())
+            nodes.append(node)
+
+        # Links were type checked when the definition was loaded
+        # [Parent, Child] or [Parent, Child, 1] for delay links
+        for jLink in self.jGraph[_LINKS]:
+            pPort = ports[jLink[0]]
+            cPort = ports[jLink[1]]
+            link = cPort.newLink(idManager.newLink(), pPort, len(jLink) > 2 and bool(jLink[2]))
+            pPort.setLink(link)
+            cPort.setLink(link)
+
+        for port, (idx, _) in zip(macro.inputs, self.inputs):
+            nodes[idx]._source = port  # type: ignore
+        for port, (idx, _) in zip(macro.outputs, self.outputs):
+            nodes[idx]._target = port  # type: ignore
+
+        return nodes, [nodes[idx] for idx in self.order]
+
+
+class MacroNode(Node):
+    """
+    A node that runs a saved graph. Its inner nodes are inlined
+    into the parent graph's traversal rather than executed as a nested graph
+    """
+    _DEFINITION: Optional[MacroDefinition] = None
+
+    def _init(
+        self, idManager: IDManager, inVarports: Optional[List[int]] = None, outVarPorts: Optional[List[int]] = None
+    ):
+        super()._init(idManager, inVarports, outVarPorts)
+        if self._DEFINITION is None:
+            raise NodeDefError("MacroNode._init()", f"{self.NODETYPE}: No macro definition set")
+        self.innerNodes, self._innerOrder = self._DEFINITION.instantiate(self, idManager)
+
+    def init(self) -> None:
+        for node in self.innerNodes:
+            try:
+                node.init()
+            except NotImplementedError:
+                pass
+
+    def setup(self) -> None:
+        for node in self.innerNodes:
+            try:
+                node.setup()
+            except NotImplementedError:
+                pass
+
+    def resetPorts(self):
+        super().resetPorts()
+        for node in self.innerNodes:
+            node.resetPorts()
+
+    def flatten(self) -> Sequence[Node]:
+        out = []
+        for node in self._innerOrder:
+            out.extend(node.flatten())
+        return out
+
+    def execute(self) -> None:
+        # Only used when the macro is run on its own, e.g. by the Tester
+        for node in self.flatten():
+            node.execute()
+
+
+# File mtime and size
+_Stamp = Tuple[int, int]
+
+# (Absolute filename, Node types) -> (File stamp, Definition)
+_DEFINITIONS: Dict[Tuple[str, FrozenSet[Type[Node]]], Tuple[_Stamp, MacroDefinition]] = {}
+# (Absolute filename, Node types, NODETYPE, Description) -> (File stamp, Class)
+_MACRO_CLASSES: Dict[Tuple[str, FrozenSet[Type[Node]], str, Optional[str]], Tuple[_Stamp, Type[MacroNode]]] = {}
+
+
+def _fileStamp(filename: str) -> _Stamp:
+    try:
+        st = os.stat(filename)
+    except OSError as err:
+        raise NodeGraphError("loadMacroDefinition()", f"Cannot load {filename}: {err}")
+    return st.st_mtime_ns, st.st_size
+
+
+def loadMacroDefinition(filename: str, nodeTypes: Sequence[Type[Node]]) -> MacroDefinition:
+    """
+    Returns the cached definition for a file, loading it on first use.
+    The file is read again when it changed since, and
+    each set of node types gets its own definition
+    """
+    key = (os.path.abspath(filename), frozenset(nodeTypes))
+    stamp = _fileStamp(filename)
+    entry = _DEFINITIONS.get(key)
+    if entry is not None and entry[0] == stamp:
+        return entry[1]
+
+    out = MacroDefinition(filename, nodeTypes)
+    _DEFINITIONS[key] = (stamp, out)
+    return out
+
+
+def makeMacroNodeClass(
+    filename: str, nodeTypes: Sequence[Type[Node]], nodetype: Optional[str] = None, description: Optional[str] = None
+) -> Type[MacroNode]:
+    """
+    Wraps a saved graph as a node type. The graph declares its ports
+    with MacroInput and MacroOutput nodes
+    :param filename: The graph file
+    :param nodeTypes: The node classes used inside the graph
+    :param nodetype: The NODETYPE of the new class, defaults to the filename
+    :param description: The node description
+    :return: A Node class to register with NodeGraph.registerNodeClass()
+    """
+    if nodetype is None:
+        nodetype = os.path.splitext(os.path.basename(filename))[0]
+
+    key = (os.path.abspath(filename), frozenset(nodeTypes), nodetype, description)
+    stamp = _fileStamp(filename)
+    entry = _MACRO_CLASSES.get(key)
+    if entry is not None and entry[0] == stamp:
+        return entry[1]
+
+    definition = loadMacroDefinition(filename, nodeTypes)
+    attrs = {
+        'NODETYPE': nodetype,
+        'DESCRIPTION': f'Macro: {filename}' if description is None else description,
+        '_INPUTS': [port for _, port in definition.inputs],
+        '_OUTPUTS': [port for _, port in definition.outputs],
+        '_ARGS': [],
+        '_DEFINITION': definition
+    }
+    out = type(f'Macro_{nodetype}', (MacroNode, ), attrs)
+    _MACRO_CLASSES[key] = (stamp, out)
+    return out
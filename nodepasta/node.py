@@ -1,35 +1,76 @@
-from typing import List, Dict, Iterator, Iterable, Any, Optional, Sequence, Hashable
+import itertools
+import uuid
+import warnings
+from typing import List, Dict, Iterator, Iterable, Any, Callable, Optional, Sequence, Hashable, Tuple, Type
 
 from nodepasta.errors import ExecutionError, NodeDefError
 from nodepasta.utils import Vec
-from nodepasta.argtypes import NodeArg, ANY
-from nodepasta.ports import Port, InPort, OutPort, Link, makeInputPort, makeOutputPort
+from nodepasta.argtypes import NodeArg, EnumNodeArg, ANY
+from nodepasta.ports import Port, InPort, OutPort, Link, _VarInPort, _VarOutPort
 from nodepasta.id_manager import IDManager
+from nodepasta.blobstore import BlobStore, resolveArgJSON
+from nodepasta.context import _CURRENT, _TOKEN
+from nodepasta.setup_cache import SetupCache, setupKey
+
+
+# Random per process so uids from different processes don't collide,
+# much cheaper than a uuid per node
+_UID_PREFIX = uuid.uuid4().hex[:16]
+_UID_COUNTER = itertools.count()
 
 
 class _DataMap:
+    """
+    View of the graph's datamap. While an ExecutionContext is active,
+    the context's datamap is checked first and receives all writes
+    """
 
     def __init__(self):
         self._datamap = None
+        # Set by the graph along with the datamap, see Node.setupCached()
+        self._setupCache: Optional['SetupCache'] = None
 
     def __contains__(self, item: Hashable) -> bool:
         if self._datamap is None:
             raise ExecutionError("_DataMap.__contains__()", "Node is not part of a NodeGraph, no datamap set")
+        ctx = _CURRENT.get()
+        if ctx is not None and item in ctx.datamap:
+            return True
         return item in self._datamap
 
     def __getitem__(self, item) -> Any:
         if self._datamap is None:
             raise ExecutionError("_DataMap.__getitem__()", "Node is not part of a NodeGraph, no datamap set")
+        ctx = _CURRENT.get()
+        if ctx is not None:
+            try:
+                return ctx.datamap[item]
+            except KeyError:
+                pass
         return self._datamap[item]
 
     def __setitem__(self, key, value) -> None:
         if self._datamap is None:
             raise ExecutionError("_DataMap.__setitem__()", "Node is not part of a NodeGraph, no datamap set")
-        self._datamap[key] = value
+        ctx = _CURRENT.get()
+        if ctx is not None:
+            ctx.datamap[key] = value
+        else:
+            self._datamap[key] = value
 
 
 NODE_ERR_CN = "__ERROR__"
 
+# Node.EFFECT values
+# Outputs depend only on the inputs and args: may be merged, cached, folded or skipped
+EFFECT_PURE = 'pure'
+# Reads external state, e.g. a clock or a file: may be skipped if nothing uses the outputs
+EFFECT_READS = 'reads'
+# Has side effects, e.g. printing: always run, in traversal order
+EFFECT_WRITES = 'writes'
+
+_EFFECTS = (EFFECT_PURE, EFFECT_READS, EFFECT_WRITES)
+
 
 class _ILinkIter(Iterator[Link]):
 
@@ -48,7 +89,8 @@ class _OLinkIter(Iterator[Link]):
 
     def __init__(self, node: 'Node') -> None:
         super().__init__()
-        self._listIter: Iterator[OutPort] = iter(node.outputs)
+        # Var output ports keep their links on the individual ports
+        self._listIter: Iterator[OutPort] = iter(node.getOutputPorts())
         self._curPortIter: Optional[Iterator[Link]] = None
 
     def __next__(self) -> Link:
@@ -64,6 +106,90 @@ class _OLinkIter(Iterator[Link]):
             self._curPortIter = iter(next(self._listIter))
 
 
+class NodeDescriptor:
+    """
+    Everything about a node type that every instance needs,
+    compiled once per class instead of once per node
+    """
+
+    def __init__(self, nodeType: Type['Node']):
+        self.nodeType = nodeType
+        self.nodetype: str = nodeType.NODETYPE
+
+        # (Port, Is variable)
+        self.inputs: List[Tuple[Port, bool]] = [(x, x.variable) for x in nodeType._INPUTS]
+        self.outputs: List[Tuple[Port, bool]] = [(x, x.variable) for x in nodeType._OUTPUTS]
+        self.defaultInVarPorts = [1] * len(self.inputs)
+        self.defaultOutVarPorts = [1] * len(self.outputs)
+        # Port name -> (Type string, Accepts any type)
+        self.inputTypes: Dict[str, Tuple[str, bool]] = {x.name: (x.typeStr, x.typeStr == ANY) for x in nodeType._INPUTS}
+        self.outputTypes: Dict[str, str] = {x.name: x.typeStr for x in nodeType._OUTPUTS}
+
+        names = [x.name for x in nodeType._ARGS]
+        if len(set(names)) != len(names):
+            raise NodeDefError("NodeDescriptor.init()", f"Node class {nodeType.__name__}, duplicate arg names: {names}")
+
+        # (Name, Prototype, Cloner)
+        self.args: List[Tuple[str, NodeArg, Callable[[], NodeArg]]] = []
+        for x in nodeType._ARGS:
+            # Subclasses with their own copy() keep using it
+            fast = type(x).copy in (NodeArg.copy, EnumNodeArg.copy)
+            self.args.append((x.name, x, x._clone if fast else x.copy))
+
+        # Datamap keys written and read during init() and setup()
+        self.produces = frozenset(nodeType.PRODUCES)
+        self.consumes = frozenset(nodeType.CONSUMES)
+
+        self.timeout: Optional[float] = nodeType.TIMEOUT
+        if self.timeout is not None and self.timeout <= 0:
+            raise NodeDefError(
+                "NodeDescriptor.init()", f"Node class {nodeType.__name__}, invalid TIMEOUT: {self.timeout}"
+            )
+
+        if nodeType.PURE:
+            if nodeType.EFFECT not in (None, EFFECT_PURE):
+                raise NodeDefError(
+                    "NodeDescriptor.init()",
+                    f"Node class {nodeType.__name__}, PURE conflicts with EFFECT: {nodeType.EFFECT}"
+                )
+            warnings.warn(
+                f"Node class {nodeType.__name__}: PURE is deprecated, set EFFECT = EFFECT_PURE",
+                DeprecationWarning,
+                stacklevel=3
+            )
+
+        self.effect: str = nodeType.effect()
+        if self.effect not in _EFFECTS:
+            raise NodeDefError(
+                "NodeDescriptor.init()", f"Node class {nodeType.__name__}, invalid EFFECT: {self.effect}"
+            )
+
+        self.docs = self._makeDocs()
+
+    def _makeDocs(self) -> str:
+        t = self.nodeType
+        out = f'{t.NODETYPE}\n' \
+              f'-----------------------------------------------\n' \
+              f'{t.DESCRIPTION}\n'
+
+        if len(t._ARGS) > 0:
+            out += "\nOptions:\n"
+            for arg in t._ARGS:
+                out += f' - {arg.display} [{arg.argType}]: {arg.descr}\n\n'
+
+        if len(t._INPUTS) > 0:
+            out += "\nInputs:\n"
+            for port in t._INPUTS:
+                out += f' - {port.name} [{port.typeStr}]: {port.descr}\n\n'
+
+        if len(t._OUTPUTS) > 0:
+            out += "\nOutputs:\n"
+            for port in t._OUTPUTS:
+                out += f' - {port.name} [{port.typeStr}]: {port.descr}\n\n'
+
+        return out
+
+
 class Node:
     _INPUTS: List[Port] = []
     _OUTPUTS: List[Port] = []
@@ -72,7 +198,31 @@ class Node:
 
     DESCRIPTION: str = "No Description Provided"
 
-    _DOC_CACHE = None
+    # One of the EFFECT_* values. Unset means EFFECT_WRITES, as nothing is known about the node
+    EFFECT: Optional[str] = None
+
+    # Deprecated alias for EFFECT = EFFECT_PURE
+    PURE = False
+
+    # Datamap keys the node writes and reads in init() and setup().
+    # setupNodes() runs the setup() of a consumer after the setup() of every producer
+    PRODUCES: Sequence[Hashable] = ()
+    CONSUMES: Sequence[Hashable] = ()
+
+    # Seconds execute() may run before NodeGraph.execute() gives up on it,
+    # overrides the nodeTimeout passed to execute()
+    TIMEOUT: Optional[float] = None
+
+    # Compiled per class by descriptor()
+    _DESCRIPTOR: Optional[NodeDescriptor] = None
+
+    # Nodes owned by this one, e.g. the graph inside a macro
+    innerNodes: Sequence['Node'] = ()
+
+    # Set by the uid property on first use, or when loaded
+    _uid: Optional[str] = None
+    # Made by the state property on first use
+    _state: Optional[Dict[str, Any]] = None
 
     def _init(
         self, idManager: IDManager, inVarports: Optional[List[int]] = None, outVarPorts: Optional[List[int]] = None
@@ -83,39 +233,89 @@ class Node:
 
         self.nodeID = -1
 
-        self.args: Dict[str, NodeArg] = {
-            x.name: x.copy()
-            for x in self._ARGS
-        }
+        d = self.descriptor()
+        # A loop, most nodes have too few args for a comprehension to pay off
+        args: Dict[str, NodeArg] = {}
+        for name, _, clone in d.args:
+            args[name] = clone()
+        self.args = args
 
         self.pos = Vec()
         self.datamap: _DataMap = _DataMap()
 
         # Initialize to a single varport for each if not specified
         if inVarports is None:
-            inVarports = [1 for _ in range(len(self._INPUTS))]
+            inVarports = d.defaultInVarPorts
 
         if outVarPorts is None:
-            outVarPorts = [1 for _ in range(len(self._OUTPUTS))]
+            outVarPorts = d.defaultOutVarPorts
 
         self.inputs: List[InPort] = []
-        for v, x in zip(inVarports, self._INPUTS):
-            port = makeInputPort(idManager, x, self)
+        for v, (x, variable) in zip(inVarports, d.inputs):
+            if variable:
+                port = _VarInPort(idManager, x, self)
+            else:
+                port = InPort(idManager.newPort(), x, self)
             port.setVarPorts(v)
             self.inputs.append(port)
 
         self.outputs: List[OutPort] = []
-        for v, x in zip(outVarPorts, self._OUTPUTS):
-            port = makeOutputPort(idManager, x, self)
+        for v, (x, variable) in zip(outVarPorts, d.outputs):
+            if variable:
+                port = _VarOutPort(idManager, x, self)
+            else:
+                port = OutPort(idManager.newPort(), x, self)
             port.setVarPorts(v)
             self.outputs.append(port)
 
+    @property
+    def uid(self) -> str:
+        """
+        Identifies the node across saves and reloads, unlike the nodeID.
+        Made on first use, most nodes are only asked for it when the graph is saved
+        """
+        uid = self._uid
+        if uid is None:
+            uid = self._uid = f'{_UID_PREFIX}{next(_UID_COUNTER):x}'
+        return uid
+
+    @uid.setter
+    def uid(self, uid: str):
+        self._uid = uid
+
+    @classmethod
+    def descriptor(cls) -> NodeDescriptor:
+        """
+        Returns the type's descriptor, compiling it on first use
+        """
+        # Looked up on the class itself, subclasses get their own
+        out = cls.__dict__.get('_DESCRIPTOR')
+        if out is None:
+            out = NodeDescriptor(cls)
+            cls._DESCRIPTOR = out
+        return out
+
+    @classmethod
+    def effect(cls) -> str:
+        """
+        Returns the type's effect, one of the EFFECT_* values
+        """
+        if cls.EFFECT is not None:
+            return cls.EFFECT
+        return EFFECT_PURE if cls.PURE else EFFECT_WRITES
+
     def getInputPorts(self) -> Sequence[InPort]:
         out = []
         for x in self.inputs:
             out.extend(x.getPorts())
         return out
 
+    def upstreamPorts(self) -> Sequence[InPort]:
+        """
+        The ports whose values execute() reads, lazy evaluation runs their upstream nodes first
+        """
+        return self.getInputPorts()
+
     def getOutputPorts(self) -> Sequence[OutPort]:
         out = []
         for x in self.outputs:
@@ -132,6 +332,37 @@ class Node:
     def incoming(self) -> Iterable[Link]:
         return _ILinkIter(self)
 
+    @property
+    def state(self) -> Dict[str, Any]:
+        """
+        Scratch state for use in execute(). Each ExecutionContext
+        gets its own, so concurrent runs don't share it
+        """
+        ctx = _CURRENT.get()
+        if ctx is None:
+            state = self._state
+            if state is None:
+                state = self._state = {}
+            return state
+        return ctx.state(self.nodeID)
+
+    @property
+    def cancelled(self) -> bool:
+        """
+        Whether the run executing this node has been cancelled or timed out,
+        long running execute()s should poll this and return early
+        """
+        token = _TOKEN.get()
+        return token is not None and token.cancelled
+
+    def checkCancelled(self):
+        """
+        Raises ExecutionCancelledError if the run executing this node has been cancelled
+        """
+        token = _TOKEN.get()
+        if token is not None:
+            token.check('Node.checkCancelled()', self)
+
     def resetPorts(self):
         for link in self.incoming():
             link.value = None
@@ -140,18 +371,43 @@ class Node:
         # This is what gets overidden by clients
         raise NotImplementedError
 
-    def unloadArgs(self) -> Dict[str, Any]:
-        return {
-            x.name: x.getJSON()
-            for x in self.args.values()
-        }
+    def flatten(self) -> Sequence['Node']:
+        """
+        Returns the nodes that are executed in place of this one
+        when the graph's traversal is generated
+        """
+        return (self, )
+
+    def unloadArgs(self, blobStore: Optional[BlobStore] = None, blobPrefix: str = '') -> Dict[str, Any]:
+        """
+        :param blobStore: If set, large values are written to the store and replaced by a reference
+        :param blobPrefix: Prefix making the blob names unique within the graph, should be stable across saves
+        """
+        out = {}
+        for x in self.args.values():
+            blob = x.pendingBlob()
+            if blob is not None:
+                # Never loaded, pass the reference through without mapping the file
+                if blobStore is not None:
+                    blob = blobStore.putBlob(f'{blobPrefix}{x.name}', blob)
+                    # The old file may be pruned, keep pointing at the one just saved
+                    x._setPendingBlob(blob)
+                out[x.name] = blob.getJSON()
+                continue
+
+            val = x.getJSON()
+            if blobStore is not None and blobStore.isLarge(val):
+                val = blobStore.put(f'{blobPrefix}{x.name}', val)
+            out[x.name] = val
+        return out
 
-    def loadArgs(self, args: Dict[str, Any]) -> None:
+    def loadArgs(self, args: Dict[str, Any], blobStore: Optional[BlobStore] = None) -> None:
         for key, val in args.items():
             try:
-                self.args[key].loadJSON(val)
+                arg = self.args[key]
             except KeyError:
                 raise NodeDefError("Node.loadArgs()", f"{self} Invalid Argument name {key}:{val}")
+            arg.loadJSON(resolveArgJSON(val, blobStore, "Node.loadArgs()"))
 
     def init(self) -> None:
         """
@@ -171,28 +427,22 @@ class Node:
         """
         raise NotImplementedError(f'Node: {self.NODETYPE}.setup() not implemented')
 
+    def setupCached(self, name: str, factory: Callable[[], Any], args: Optional[Sequence[str]] = None) -> Any:
+        """
+        For use in setup(). Returns a value made by factory, reusing the one made for a node
+        of the same type and arg values if the graph has a SetupCache, e.g. after a reload.
+        The value may be shared with other nodes, and stays valid when the cache drops it
+        :param name: Tells apart several values made by the same node
+        :param factory: Makes the value, only called on a cache miss
+        :param args: The names of the args the value depends on, defaults to all of them
+        """
+        cache = self.datamap._setupCache
+        if cache is None:
+            return factory()
+        return cache.get(setupKey(self, name, args), factory)
+
     def __str__(self):
         return f'{self.__class__.__name__}_{self.nodeID}'
 
     def docs(self) -> str:
-        if self._DOC_CACHE is None:
-            self._DOC_CACHE = f'{self.NODETYPE}\n' \
-                              f'-----------------------------------------------\n' \
-                              f'{self.DESCRIPTION}\n'
-
-            if len(self._ARGS) > 0:
-                self._DOC_CACHE += "\nOptions:\n"
-                for arg in self._ARGS:
-                    self._DOC_CACHE += f' - {arg.display} [{arg.argType}]: {arg.descr}\n\n'
-
-            if len(self._INPUTS) > 0:
-                self._DOC_CACHE += "\nInputs:\n"
-                for port in self._INPUTS:
-                    self._DOC_CACHE += f' - {port.name} [{port.typeStr}]: {port.descr}\n\n'
-
-            if len(self._OUTPUTS) > 0:
-                self._DOC_CACHE += "\nOutputs:\n"
-                for port in self._OUTPUTS:
-                    self._DOC_CACHE += f' - {port.name} [{port.typeStr}]: {port.descr}\n\n'
-
-        return self._DOC_CACHE
+        return self.descriptor().docs
@@ -1,17 +1,34 @@
 from collections import deque
-from typing import Dict, List, Set, Iterator, Tuple, Optional, Type, Deque, Any
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import threading
+import time
+import weakref
+from typing import Dict, List, Set, Iterator, Iterable, Sequence, Tuple, Optional, Type, Deque, Any, TYPE_CHECKING
 
 import json
 
 from .node import Node, Link, NODE_ERR_CN
-from .errors import ExecutionError, NodeGraphError, NodeDefError, NodeTypeError
-from .utils import Vec
-from .ports import IOPort
+from .errors import (
+    ExecutionError, ExecutionCancelledError, ExecutionTimeoutError, NodeGraphError, NodeDefError, NodeTypeError
+)
+from .utils import Vec, pausedGC
+from .ports import IOPort, InPort
 from .id_manager import IDManager
+from .blobstore import BlobStore, blobDirFor, resolveArgJSON, DEF_BLOB_THRESHOLD
+from .context import ExecutionContext, CancelToken, _CURRENT, _TOKEN
+from .plan import ExecutionPlan
+from .watchdog import _Watchdog
+from .setup_cache import SetupCache
+from .spill import SpillManager, _SPILL
+
+if TYPE_CHECKING:
+    from .graph_diff import GraphDiff
+    from .registry import NodeRegistry
 
 _NODES = 'nodes'
 _LINKS = 'links'
 _POS = 'pos'
+_UID = 'uid'
 
 _CLASS = 'class'
 _ARGS = 'args'
@@ -19,9 +36,24 @@ _IN_VAR_PORTS = 'inVarPorts'
 _OUT_VAR_PORTS = 'outVarPorts'
 
 
+def _callInit(node: Node):
+    try:
+        node.init()
+    except NotImplementedError:
+        pass
+
+
+def _callSetup(node: Node):
+    try:
+        node.setup()
+    except NotImplementedError:
+        pass
+
+
 class NodeGraph:
 
     def __init__(self):
+        # IDs are recycled, see IDManager
         # NodeID -> Node
         self._nodeLookup: Dict[int, Node] = {}
         self._portLookup: Dict[int, IOPort] = {}
@@ -29,8 +61,26 @@ class NodeGraph:
         self._linkLookup: Dict[Tuple[int, int], Link] = {}
 
         self._traversal: Optional[List[Node]] = None
+        self._plan: Optional[ExecutionPlan] = None
+        # Guards plan generation when executing concurrently
+        self._traversalLock = threading.Lock()
+        self._cse = False
+        self._constFold = False
+        self._dce = False
+        self._memoize = False
+        self._lazy = False
 
         self._nodeTypes: Dict[str, Type[Node]] = {}
+        # Types not registered yet are imported from here when first needed
+        self._registry: Optional['NodeRegistry'] = None
+        # Shared with the nodes, outlives reloads
+        self._setupCache: Optional[SetupCache] = None
+        # Moves large link values to disk, see useSpillManager()
+        self._spill: Optional[SpillManager] = None
+        # A timed out or cancelled run without a context whose worker is still in a node
+        self._abandoned: Optional[_Watchdog] = None
+        # Contexts this graph ran in, the state they hold for an ID is dropped when the ID is freed
+        self._contexts: 'weakref.WeakSet[ExecutionContext]' = weakref.WeakSet()
         self._filename = ""
         self._idManager = IDManager()
 
@@ -45,96 +95,306 @@ class NodeGraph:
     def nodeTypes(self) -> Iterator[Type[Node]]:
         return sorted(self._nodeTypes.values(), key=lambda e: e.__name__).__iter__()
 
-    def setupNodes(self):
-        for node in self:
-            try:
-                node.init()
-            except NotImplementedError:
-                pass
+    def nodeTypeNames(self) -> List[str]:
+        """
+        :return: The NODETYPE of every registered type and every type in the registry, sorted.
+            Does not import anything
+        """
+        out = set(self._nodeTypes.keys())
+        if self._registry is not None:
+            out.update(self._registry.nodeTypeNames())
+        return sorted(out)
+
+    def useRegistry(self, registry: Optional['NodeRegistry']):
+        """
+        Sets a registry to look up node types that have not been registered,
+        they are imported and registered the first time they are used
+        """
+        self._registry = registry
+
+    def useSetupCache(self, cache: Optional[SetupCache]):
+        """
+        Sets the cache used by Node.setupCached(). Keep the same cache across
+        loadFromFile() calls so nodes with unchanged args reuse their setup products
+        """
+        self._setupCache = cache
         for node in self:
-            try:
-                node.setup()
-            except NotImplementedError:
-                pass
+            node.datamap._setupCache = cache
 
-    def _loadFromJSON(self, jGraph):
-        nodeList = []
+    def useSpillManager(self, manager: Optional[SpillManager]):
+        """
+        Sets a manager that writes large numpy link values to disk during execute(),
+        consumers read them back transparently. Stats of the last run are in manager.lastRun
+        """
+        self._spill = manager
 
-        if _NODES not in jGraph or len(jGraph[_NODES]) == 0:
-            raise NodeGraphError("NodeGraph.loadFromFile()", f"No nodes defined in file")
+    def getNodeType(self, nodetype: str) -> Type[Node]:
+        """
+        Returns a registered node type, falling back to the registry
+        """
+        try:
+            return self._nodeTypes[nodetype]
+        except KeyError:
+            pass
 
-        if _LINKS not in jGraph:
-            raise NodeGraphError("NodeGraph._loadFromJSON()", f"Cannot load file, links not defined ")
+        if self._registry is None or nodetype not in self._registry:
+            raise NodeTypeError('NodeGraph.getNodeType()', f'Node Type "{nodetype}" not registered')
 
-        for idx, n in enumerate(jGraph[_NODES]):
-            try:
-                nodeClass = n[_CLASS]
-            except KeyError:
-                raise NodeGraphError("NodeGraph._loadFromJSON()", f"Node #{idx}, no class was defined")
+        out = self._registry.get(nodetype)
+        self.registerNodeClass(out)
+        return out
 
-            try:
-                args = n[_ARGS]
-            except KeyError:
-                raise NodeGraphError("NodeGraph._loadFromJSON()", f"Node #{idx}, no args were defined")
+    def setupNodes(self, nodes: Optional[Iterable[Node]] = None, maxWorkers: Optional[int] = None):
+        """
+        Calls init() then setup() on the nodes. Every init() finishes before the first setup(),
+        and a node's setup() runs after the setup() of every node producing a datamap key it consumes
+        (see Node.PRODUCES and Node.CONSUMES)
+        :param nodes: The nodes to set up, defaults to every node in the graph
+        :param maxWorkers: If set, runs each phase on a pool of this many threads,
+            otherwise everything runs on the calling thread
+        """
+        nodes = list(self) if nodes is None else list(nodes)
+        if self._plan is not None:
+            # Setup may change what constant nodes output
+            self._plan.dirtyFold()
+
+        setupDeps = self._setupDeps(nodes)
+        if maxWorkers is None or maxWorkers <= 1 or len(nodes) <= 1:
+            for node in nodes:
+                _callInit(node)
+            for idx in self._setupOrder(nodes, setupDeps):
+                _callSetup(nodes[idx])
+            return
 
-            try:
-                pos = n[_POS]
-                if len(pos) != 2:
-                    raise NodeGraphError(f'NodeGraph._loadFromJSON()', f'Node #{idx}, invalid pos length')
-            except KeyError:
-                raise NodeGraphError(f"NodeGraph._loadFromJSON()", f"Node #{idx}, no pos was defined")
+        with ThreadPoolExecutor(max_workers=maxWorkers) as pool:
+            self._runPhase(pool, nodes, _callInit, [set() for _ in nodes])
+            self._runPhase(pool, nodes, _callSetup, setupDeps)
 
-            try:
-                nodeType = self._nodeTypes[nodeClass]
-            except KeyError:
+    @staticmethod
+    def _setupDeps(nodes: List[Node]) -> List[Set[int]]:
+        """
+        :return: For each node, the indices of the nodes whose setup() has to run first
+        """
+        # Datamap key -> Producer indices
+        producers: Dict[Any, List[int]] = {}
+        for idx, node in enumerate(nodes):
+            for key in node.descriptor().produces:
+                producers.setdefault(key, []).append(idx)
+
+        out: List[Set[int]] = []
+        for idx, node in enumerate(nodes):
+            deps = set()
+            for key in node.descriptor().consumes:
+                deps.update(producers.get(key, ()))
+            deps.discard(idx)
+            out.append(deps)
+        return out
+
+    @staticmethod
+    def _setupOrder(nodes: List[Node], deps: List[Set[int]]) -> List[int]:
+        """
+        Orders the setups so producers come first, otherwise keeping the order of nodes
+        """
+        # Producer index -> Consumer indices
+        consumers: List[List[int]] = [[] for _ in nodes]
+        remaining = [len(x) for x in deps]
+        for idx, x in enumerate(deps):
+            for dep in x:
+                consumers[dep].append(idx)
+
+        ready = deque(idx for idx, x in enumerate(remaining) if x == 0)
+        out = []
+        while len(ready) > 0:
+            idx = ready.popleft()
+            out.append(idx)
+            for c in consumers[idx]:
+                remaining[c] -= 1
+                if remaining[c] == 0:
+                    ready.append(c)
+
+        if len(out) != len(nodes):
+            stuck = ', '.join(str(nodes[idx]) for idx, x in enumerate(remaining) if x > 0)
+            raise NodeGraphError('NodeGraph.setupNodes()', f'Cycle in datamap dependencies between: {stuck}')
+        return out
+
+    def _runPhase(self, pool: ThreadPoolExecutor, nodes: List[Node], func: Any, deps: List[Set[int]]):
+        """
+        Runs func on every node, each once all of its dependencies have finished.
+        The first error is raised once the running calls finish, nothing new is started after it
+        """
+        # Validates and raises on cycles before anything runs
+        self._setupOrder(nodes, deps)
+
+        consumers: List[List[int]] = [[] for _ in nodes]
+        remaining = [len(x) for x in deps]
+        for idx, x in enumerate(deps):
+            for dep in x:
+                consumers[dep].append(idx)
+
+        # Future -> Node index
+        running = {pool.submit(func, nodes[idx]): idx for idx, x in enumerate(remaining) if x == 0}
+        error: Optional[BaseException] = None
+        while len(running) > 0:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                idx = running.pop(future)
+                err = future.exception()
+                if err is not None:
+                    if error is None:
+                        error = err
+                    continue
+                if error is not None:
+                    continue
+                for c in consumers[idx]:
+                    remaining[c] -= 1
+                    if remaining[c] == 0:
+                        running[pool.submit(func, nodes[c])] = c
+
+        if error is not None:
+            raise error
+
+    def _nodeFromJSON(self, idx: int, n: Dict[str, Any], blobStore: Optional[BlobStore] = None) -> Node:
+        """
+        Creates a node from its JSON entry, the node is not added to the graph
+        """
+        try:
+            nodeClass = n[_CLASS]
+        except KeyError:
+            raise NodeGraphError("NodeGraph._loadFromJSON()", f"Node #{idx}, no class was defined")
+
+        try:
+            args = n[_ARGS]
+        except KeyError:
+            raise NodeGraphError("NodeGraph._loadFromJSON()", f"Node #{idx}, no args were defined")
+
+        try:
+            pos = n[_POS]
+            if len(pos) != 2:
+                raise NodeGraphError(f'NodeGraph._loadFromJSON()', f'Node #{idx}, invalid pos length')
+        except KeyError:
+            raise NodeGraphError(f"NodeGraph._loadFromJSON()", f"Node #{idx}, no pos was defined")
+
+        try:
+            nodeType = self._nodeTypes[nodeClass]
+        except KeyError:
+            if self._registry is None or nodeClass not in self._registry:
                 raise NodeGraphError(
                     f'NodeGraph._loadFromJSON()', f'Node #{idx}, class type "{nodeClass}" not registered'
                 )
-
             try:
-                inVarPorts = n[_IN_VAR_PORTS]
-            except KeyError:
-                raise NodeGraphError(f"NodeGraph._loadFromJSON()", f"Node #{idx}, varPorts field missing")
+                nodeType = self.getNodeType(nodeClass)
+            except NodeGraphError as err:
+                raise NodeGraphError(f'NodeGraph._loadFromJSON()', f'Node #{idx}, {err.msg}')
 
-            try:
-                outVarPorts = n[_OUT_VAR_PORTS]
-            except KeyError:
-                raise NodeGraphError(f"NodeGraph._loadFromJSON()", f"Node #{idx}, varPorts field missing")
+        try:
+            inVarPorts = n[_IN_VAR_PORTS]
+        except KeyError:
+            raise NodeGraphError(f"NodeGraph._loadFromJSON()", f"Node #{idx}, varPorts field missing")
 
-            newNode = nodeType()
-            newNode._init(self._idManager, inVarPorts, outVarPorts)
-            newNode.loadArgs(args)
-            newNode.pos = Vec(pos[0], pos[1])
+        try:
+            outVarPorts = n[_OUT_VAR_PORTS]
+        except KeyError:
+            raise NodeGraphError(f"NodeGraph._loadFromJSON()", f"Node #{idx}, varPorts field missing")
+
+        newNode = nodeType()
+        newNode._init(self._idManager, inVarPorts, outVarPorts)
+        newNode.loadArgs(args, blobStore)
+        newNode.pos = Vec(pos[0], pos[1])
+        # Files saved without uids are identified by node index
+        newNode.uid = n.get(_UID, f'#{idx}')
+        return newNode
+
+    def _loadFromJSON(self, jGraph, blobStore: Optional[BlobStore] = None):
+        nodeList = []
+        # Rebased port ID -> Port, in the same order as getJSON()
+        portList: List[IOPort] = []
+
+        if _NODES not in jGraph or len(jGraph[_NODES]) == 0:
+            raise NodeGraphError("NodeGraph.loadFromFile()", f"No nodes defined in file")
+
+        if _LINKS not in jGraph:
+            raise NodeGraphError("NodeGraph._loadFromJSON()", f"Cannot load file, links not defined ")
+
+        for idx, n in enumerate(jGraph[_NODES]):
+            newNode = self._nodeFromJSON(idx, n, blobStore)
             nodeList.append(newNode)
+            portList.extend(newNode.getInputPorts())
+            portList.extend(newNode.getOutputPorts())
             self._addNode(newNode)
 
+        pairs = []
         for idx, link in enumerate(jGraph[_LINKS]):
-            if len(link) != 2:
+            # [Parent, Child] or [Parent, Child, 1] for delay links
+            if len(link) not in (2, 3):
                 raise NodeGraphError(f'NodeGraph._loadFromJSON()', f'Link #{idx}, invalid length')
             pPortId = link[0]
             cPortId = link[1]
-            pPort = self._portLookup[pPortId]
-            cPort = self._portLookup[cPortId]
+            try:
+                pairs.append((portList[pPortId], portList[cPortId], len(link) > 2 and bool(link[2])))
+            except IndexError:
+                raise NodeGraphError(f'NodeGraph._loadFromJSON()', f'Link #{idx}, invalid port ID') from None
 
-            self.makeLink(pPort, cPort)
+        self.makeLinks(pairs)
+
+    def _loadValidated(
+        self, nodes: Sequence[Tuple[str, Dict[str, Any], Tuple[float, float], str, List[int], List[int]]],
+        links: Sequence[Tuple[int, int, bool]], order: List[int], blobStore: Optional[BlobStore] = None
+    ):
+        """
+        Clears the graph and loads one that already loaded without errors elsewhere, e.g. in a
+        bulk_loader worker with the same node types. Fields, arg names and links are not checked again
+        :param nodes: (Type, Args, Pos, Uid, In var ports, Out var ports) of each node
+        :param links: (Parent port, Child port, Delay), port IDs as in getJSON()
+        :param order: The traversal, as indices into nodes
+        """
+        self.clear()
+        try:
+            with pausedGC():
+                portList: List[IOPort] = []
+                for nodeClass, args, pos, uid, inVarPorts, outVarPorts in nodes:
+                    node = self._nodeTypes[nodeClass]()
+                    node._init(self._idManager, inVarPorts, outVarPorts)
+                    nodeArgs = node.args
+                    for key, val in args.items():
+                        nodeArgs[key].loadJSON(resolveArgJSON(val, blobStore, "NodeGraph._loadValidated()"))
+                    node.pos = Vec(pos[0], pos[1])
+                    node.uid = uid
+                    portList.extend(node.getInputPorts())
+                    portList.extend(node.getOutputPorts())
+                    self._addNode(node)
+
+                linkIDs = self._idManager.newLinks(len(links))
+                link = self._link
+                for linkID, (pIdx, cIdx, delay) in zip(linkIDs, links):
+                    link(portList[cIdx].newLink(linkID, portList[pIdx], delay))
+            self._setTraversalOrder(order)
+        except:
+            self.clear()
+            raise
 
     def clear(self):
         """
         Clears the current graph
         """
         self._nodeLookup = {}
+        self._portLookup = {}
+        self._linkIDLookup = {}
+        self._linkLookup = {}
         self._traversal = None
+        self._plan = None
         self._idManager.reset()
 
-    def loadFromJSON(self, jGraph):
+    def loadFromJSON(self, jGraph, blobStore: Optional[BlobStore] = None):
         """
         Clears the current graph and lodds the graph from a json object
         :param jGraph: The JSON dict-like object
+        :param blobStore: Store used to resolve side-car argument values
         :return: None
         """
         self.clear()
         try:
-            self._loadFromJSON(jGraph)
+            with pausedGC():
+                self._loadFromJSON(jGraph, blobStore)
         except:
             self.clear()
             raise
@@ -153,9 +413,95 @@ class NodeGraph:
         except json.JSONDecodeError as err:
             raise NodeGraphError("NodeGraph.loadFromFile()", f"Cannot load file, JSON Error: {err}")
 
-        self.loadFromJSON(jGraph)
+        # Side-car values are only mapped when a node reads them
+        self.loadFromJSON(jGraph, BlobStore(blobDirFor(filename)))
         self.genTraversal()
 
+    def applyDiff(self, diff: 'GraphDiff', blobStore: Optional[BlobStore] = None) -> List[Node]:
+        """
+        Applies a diff in place. Nodes the diff doesn't name are left untouched,
+        including any state from setupNodes()
+        :param diff: The diff, nodes are matched by uid
+        :param blobStore: Store used to resolve side-car argument values
+        :return: The added nodes and the nodes with changed args, these need to be set up
+        """
+        nodes = {node.uid: node for node in self}
+
+        def getNode(uid: str) -> Node:
+            try:
+                return nodes[uid]
+            except KeyError:
+                raise NodeGraphError("NodeGraph.applyDiff()", f"Node uid {uid} not in graph") from None
+
+        def getPort(uid: str, idx: int) -> IOPort:
+            node = getNode(uid)
+            inPorts = node.getInputPorts()
+            if idx < len(inPorts):
+                return inPorts[idx]
+            try:
+                return node.getOutputPorts()[idx - len(inPorts)]
+            except IndexError:
+                raise NodeGraphError("NodeGraph.applyDiff()", f"Invalid port index {idx} for {node}") from None
+
+        for pUid, pIdx, cUid, cIdx in (key[:4] for key in diff.removedLinks):
+            if pUid not in nodes or cUid not in nodes:
+                continue
+            pPort = getPort(pUid, pIdx)
+            link = getPort(cUid, cIdx).link  # type: ignore
+            if link is not None and link.pPort is pPort:
+                self.unlink(link)
+
+        for uid in diff.removedNodes:
+            self.removeNode(getNode(uid))
+            del nodes[uid]
+
+        touched = []
+        for idx, n in enumerate(diff.addedNodes):
+            node = self._nodeFromJSON(idx, n, blobStore)
+            self._addNode(node)
+            nodes[node.uid] = node
+            touched.append(node)
+
+        for uid, args in diff.changedArgs.items():
+            node = getNode(uid)
+            node.loadArgs(args, blobStore)
+            touched.append(node)
+
+        for uid, pos in diff.movedNodes.items():
+            getNode(uid).pos = Vec(pos[0], pos[1])
+
+        for key in diff.addedLinks:
+            pUid, pIdx, cUid, cIdx = key[:4]
+            self.makeLink(getPort(pUid, pIdx), getPort(cUid, cIdx), delay=len(key) > 4 and bool(key[4]))
+
+        return touched
+
+    def hotReload(self, filename: Optional[str] = None) -> Tuple['GraphDiff', List[Node]]:
+        """
+        Reloads the graph from a file, only applying what changed on disk.
+        Unchanged nodes keep their state, call setupNodes() on the returned nodes
+        :param filename: The graph filename, defaults to the last loaded file
+        :return: The applied diff and the nodes that need to be set up
+        """
+        # graph_diff depends on this module
+        from .graph_diff import diffJSON
+
+        if filename is None:
+            filename = self._filename
+
+        try:
+            with open(filename, mode='r') as f:
+                jGraph = json.load(f)
+        except json.JSONDecodeError as err:
+            raise NodeGraphError("NodeGraph.hotReload()", f"Cannot load file, JSON Error: {err}")
+
+        blobStore = BlobStore(blobDirFor(filename))
+        oldBlobs = BlobStore(blobDirFor(self._filename)) if self._filename else None
+        diff = diffJSON(self.getJSON(), jGraph, oldBlobs, blobStore)
+        touched = self.applyDiff(diff, blobStore)
+        self._filename = filename
+        return diff, touched
+
     def loadArgs(self, args: Dict[int, Dict[str, Any]]):
         for nodeID, arg in args.items():
             try:
@@ -180,9 +526,14 @@ class NodeGraph:
         except KeyError:
             pass
 
+        # Compiled now so creating nodes only clones from it
+        nodeType.descriptor()
         self._nodeTypes[nodeType.NODETYPE] = nodeType
 
-    def getJSON(self) -> Dict[str, Any]:
+    def getJSON(self, blobStore: Optional[BlobStore] = None) -> Dict[str, Any]:
+        """
+        :param blobStore: If set, large argument values are written to the store instead of the JSON
+        """
         nodeList: List[Node] = [None] * len(self._nodeLookup)  # type: ignore
 
         # Node IDs don't matter and can be regenerated when the graph is reloaded
@@ -204,8 +555,10 @@ class NodeGraph:
 
             nodeJList.append(
                 {
+                    _UID: node.uid,
                     _CLASS: node.NODETYPE,
-                    _ARGS: node.unloadArgs(),
+                    # Named by uid so a node keeps its files when others are added or removed
+                    _ARGS: node.unloadArgs(blobStore, f'{node.uid}_'),
                     _POS: [node.pos.x, node.pos.y],
                     _IN_VAR_PORTS: [len(x.getPorts()) for x in node.inputs],
                     _OUT_VAR_PORTS: [len(x.getPorts()) for x in node.outputs]
@@ -213,7 +566,10 @@ class NodeGraph:
             )
 
             for link in node:
-                linkJList.append([rebasePortLookup[link.pPort.portID], rebasePortLookup[link.cPort.portID]])
+                jLink = [rebasePortLookup[link.pPort.portID], rebasePortLookup[link.cPort.portID]]
+                if link.delay:
+                    jLink.append(1)
+                linkJList.append(jLink)
 
         out = {
             _NODES: nodeJList,
@@ -222,24 +578,28 @@ class NodeGraph:
 
         return out
 
-    def saveToFile(self, filename: str):
-        out = self.getJSON()
+    def saveToFile(self, filename: str, blobThreshold: int = DEF_BLOB_THRESHOLD):
+        """
+        Saves the graph, argument values larger than blobThreshold bytes (numpy arrays, bytes)
+        are written to a side-car directory next to the file
+        """
+        blobStore = BlobStore(blobDirFor(filename), blobThreshold)
+        out = self.getJSON(blobStore)
         with open(filename, mode='w') as f:
             json.dump(out, f, indent=2)
+        blobStore.prune()
 
     def _addNode(self, node: Node):
         if node.nodeID == -1:
             node.nodeID = self._idManager.newNode()
             node.datamap._datamap = self.datamap  # type: ignore
+            node.datamap._setupCache = self._setupCache
             self._nodeLookup[node.nodeID] = node
-            self._portLookup.update({
-                x.portID: x
-                for x in node.getInputPorts()
-            })
-            self._portLookup.update({
-                x.portID: x
-                for x in node.getOutputPorts()
-            })
+            portLookup = self._portLookup
+            for x in node.getInputPorts():
+                portLookup[x.portID] = x
+            for x in node.getOutputPorts():
+                portLookup[x.portID] = x
         else:
             raise NodeGraphError('NodeGraph.addNodes()', f"Cannot add node {node}, it already belongs to a node graph")
         self._traversal = None
@@ -250,6 +610,34 @@ class NodeGraph:
         self._addNode(node)
         return node
 
+    def addNodes(self, nodetypes: Sequence[Type[Node]]) -> List[Node]:
+        """
+        Makes many nodes at once
+        :param nodetypes: The class of each node
+        :return: The new nodes, in the same order
+        """
+        for t in nodetypes:
+            if t.NODETYPE == NODE_ERR_CN:
+                raise NodeDefError("NodeGraph.addNodes()", f"Node class {t.__name__}, NODETYPE class variable not set")
+
+        out = []
+        ports = []
+        with pausedGC():
+            for t, nodeID in zip(nodetypes, self._idManager.newNodes(len(nodetypes))):
+                node = t()
+                node._init(self._idManager)
+                node.nodeID = nodeID
+                node.datamap._datamap = self.datamap  # type: ignore
+                node.datamap._setupCache = self._setupCache
+                ports.extend(node.getInputPorts())
+                ports.extend(node.getOutputPorts())
+                out.append(node)
+
+        self._nodeLookup.update((x.nodeID, x) for x in out)
+        self._portLookup.update((x.portID, x) for x in ports)
+        self._traversal = None
+        return out
+
     def makeLinkByID(self, pPortID: int, cPortID: int):
         print(f"Linking {pPortID} -> {cPortID}")
         pPort = self._portLookup[pPortID]
@@ -257,41 +645,44 @@ class NodeGraph:
         link, _ = self.makeLink(pPort, cPort)
         print(f'Linked: {link.linkID}')
 
-    def makeLink(self, pPort: IOPort, cPort: IOPort) -> Tuple[Link, Optional[Link]]:
-        """
-        Makes a new link.
-        :param parent: The parent node
-        :param child: The child node
-        :param addr: The address of the ports
-        :return: The new link and an old link that was replaced, if it exists, else None
-        """
-        if pPort.node.nodeID not in self._nodeLookup:
-            raise NodeGraphError(
-                f'NodeGraph.makeLink()', f'Cannot make link, '
-                f'parent not in this graph: "{str(pPort.node)}"'
-            )
-        if cPort.node.nodeID not in self._nodeLookup:
-            raise NodeGraphError(
-                f'NodeGraph.makeLink()', f'Cannot make link, '
-                f'child not in this graph: "{str(cPort.node)}"'
-            )
-        if cPort.node.nodeID == pPort.node.nodeID:
-            raise NodeGraphError(
-                'NodeGraph.makeLink()', f'Cannot make link, parent == child: {pPort.node} == {cPort.node}'
-            )
+    def _checkLink(self, pPort: IOPort, cPort: IOPort, loc: str, delay: bool = False):
+        # IDs of removed nodes are reused, so check the node itself
+        if self._nodeLookup.get(pPort.node.nodeID) is not pPort.node:
+            raise NodeGraphError(loc, f'Cannot make link, parent not in this graph: "{str(pPort.node)}"')
+        if self._nodeLookup.get(cPort.node.nodeID) is not cPort.node:
+            raise NodeGraphError(loc, f'Cannot make link, child not in this graph: "{str(cPort.node)}"')
+        # A delay link may feed a node's output back into itself
+        if cPort.node.nodeID == pPort.node.nodeID and not delay:
+            raise NodeGraphError(loc, f'Cannot make link, parent == child: {pPort.node} == {cPort.node}')
 
         # Check the typing on the inport
         if not cPort.allowAny and pPort.port.typeStr != cPort.port.typeStr:
             raise NodeTypeError(
-                f"Node.addChild()",
-                f"{pPort.node} -> {cPort.node}: Invalid type, expected {cPort.port.typeStr},"
+                loc, f"{pPort.node} -> {cPort.node}: Invalid type, expected {cPort.port.typeStr},"
                 f" got {pPort.port.typeStr}"
             )
 
-        # Make new link
-        linkID = self._idManager.newLink()
-        link = Link(linkID, pPort, cPort)
+    def _newLinks(self, pairs: Sequence[Tuple[IOPort, IOPort, bool]]) -> List[Link]:
+        """
+        Creates the link objects without attaching them, so a port
+        that refuses a link leaves the graph and the link IDs unchanged
+        """
+        linkIDs = self._idManager.newLinks(len(pairs))
+        out = []
+        for idx, (linkID, (pPort, cPort, delay)) in enumerate(zip(linkIDs, pairs)):
+            try:
+                out.append(cPort.newLink(linkID, pPort, delay))
+            except NodeGraphError as err:
+                for x in linkIDs:
+                    self._idManager.freeLink(x)
+                if len(pairs) > 1:
+                    err.msg = f'Link #{idx}: {err.msg}'
+                raise
+        return out
 
+    def _link(self, link: Link) -> Tuple[Link, Optional[Link]]:
+        pPort = link.pPort
+        cPort = link.cPort
         pPort.setLink(link)
         old = cPort.setLink(link)
 
@@ -299,12 +690,51 @@ class NodeGraph:
         if old is not None:
             # Remove if present
             old.pPort.remLink(old)
+            self._releaseLink(old)
 
         self._linkLookup[(pPort.portID, cPort.portID)] = link
         self._linkIDLookup[link.linkID] = link
+        return link, old
+
+    def makeLink(self, pPort: IOPort, cPort: IOPort, delay: bool = False) -> Tuple[Link, Optional[Link]]:
+        """
+        Makes a new link.
+        :param pPort: The parent's output port
+        :param cPort: The child's input port
+        :param delay: Make a feedback link, the child reads the value the parent wrote
+                      during the previous run. These may form loops
+        :return: The new link and an old link that was replaced, if it exists, else None
+        """
+        self._checkLink(pPort, cPort, 'NodeGraph.makeLink()', delay)
+
+        link, = self._newLinks([(pPort, cPort, delay)])
+        out = self._link(link)
         # Reset the traversal
         self._traversal = None
-        return link, old
+        return out
+
+    def makeLinks(self, pairs: Sequence[Tuple]) -> List[Link]:
+        """
+        Makes many links at once. Every pair is validated before any link is made,
+        so on error the graph is unchanged. Later pairs replace earlier links
+        into the same child port, as with makeLink()
+        :param pairs: (Parent port, Child port) pairs, or (Parent port, Child port, Delay)
+        :return: The new links
+        """
+        delays = [len(pair) > 2 and bool(pair[2]) for pair in pairs]
+        for idx, (pair, delay) in enumerate(zip(pairs, delays)):
+            try:
+                self._checkLink(pair[0], pair[1], 'NodeGraph.makeLinks()', delay)
+            except NodeGraphError as err:
+                err.msg = f'Link #{idx}: {err.msg}'
+                raise
+
+        links = self._newLinks([(pair[0], pair[1], delay) for pair, delay in zip(pairs, delays)])
+        with pausedGC():
+            out = [self._link(link)[0] for link in links]
+
+        self._traversal = None
+        return out
 
     def unlink(self, link: Link):
         """
@@ -314,30 +744,163 @@ class NodeGraph:
         """
         link.pPort.remLink(link)
         link.cPort.remLink(link)
-        del link
+        self._releaseLink(link)
 
         self._traversal = None
 
+    def _releaseLink(self, link: Link):
+        if self._linkIDLookup.get(link.linkID) is link:
+            self._linkIDLookup.pop(link.linkID)
+        key = (link.pPort.portID, link.cPort.portID)
+        if self._linkLookup.get(key) is link:
+            del self._linkLookup[key]
+        self._freeLinkID(link.linkID)
+        # Drop the last value so it isn't kept alive by a stale reference
+        link.value = None
+
+    def _freeLinkID(self, linkID: int):
+        self._idManager.freeLink(linkID)
+        for ctx in list(self._contexts):
+            ctx._forgetLink(linkID)
+
     def unlinkByID(self, linkID: int):
         print(f"Unlinking {linkID}")
         link = self._linkIDLookup[linkID]
 
         self.unlink(link)
 
-    def removeNode(self, node: Node):
-        for link in node:
-            self.unlink(link)
-
+    def unlinkNode(self, node: Node):
+        """
+        Removes all of a node's incoming and outgoing links
+        :param node: The node
+        :return: None
+        """
+        # Collected first, unlink() modifies the ports' link storage.
+        # A delay link from the node into itself is both outgoing and incoming
+        links = {link.linkID: link for link in node}
         for link in node.incoming():
-            if link is not None:
-                self.unlink(link)
+            links[link.linkID] = link
+        for link in links.values():
+            self.unlink(link)
 
+    def removeNode(self, node: Node):
+        self.unlinkNode(node)
         self._nodeLookup.pop(node.nodeID)
+        self._releaseNode(node)
+        # The plan holds on to every node in the old traversal
+        self._traversal = None
+        self._plan = None
+
+    def addVarPort(self, port: IOPort) -> IOPort:
+        """
+        Adds a var port and registers it with the graph
+        :param port: The variable port
+        :return: The new port
+        """
+        out = port.addVarPort()
+        self._portLookup[out.portID] = out
+        # Plans hold on to the node's ports
+        self._plan = None
+        return out
+
+    def remVarPort(self, port: IOPort):
+        """
+        Removes the last var port, along with its links
+        :param port: The variable port
+        :return: None
+        """
+        varports = port.getPorts()
+        if len(varports) > 1:
+            last = varports[-1]
+            links = [last.link] if isinstance(last, InPort) else list(last.links)  # type: ignore
+            for link in links:
+                if link is not None:
+                    self.unlink(link)
+            if self._portLookup.get(last.portID) is last:
+                self._portLookup.pop(last.portID)
+
+        # Raises if this is the last var port
+        port.remVarPort()
+        self._plan = None
+
+    def _releaseNode(self, node: Node):
+        """
+        Frees a removed node's IDs for reuse
+        """
+        for port in node.getInputPorts() + node.getOutputPorts():  # type: ignore
+            if self._portLookup.get(port.portID) is port:
+                self._portLookup.pop(port.portID)
+            self._idManager.freePort(port.portID)
+
+        for inner in node.innerNodes:
+            for link in inner:
+                self._freeLinkID(link.linkID)
+            self._releaseNode(inner)
+
+        self._idManager.freeNode(node.nodeID)
+        for ctx in list(self._contexts):
+            ctx._forgetNode(node.nodeID)
+
+    def compactIDs(self):
+        """
+        Renumbers nodes, ports and links from zero with no gaps.
+        IDs held outside the graph, e.g. by the UIs or an ExecutionContext, are invalidated
+        """
+        nodes = list(self._nodeLookup.values())
+
+        self._idManager.reset()
+        self._nodeLookup = {}
+        self._portLookup = {}
+        self._linkIDLookup = {}
+        self._linkLookup = {}
+
+        def renumber(node: Node):
+            node.nodeID = self._idManager.newNode()
+            for port in node.getInputPorts():
+                port.portID = self._idManager.newPort()
+            for port in node.getOutputPorts():
+                port.portID = self._idManager.newPort()
+            for inner in node.innerNodes:
+                renumber(inner)
+
+        def renumberInnerLinks(node: Node):
+            for inner in node.innerNodes:
+                for link in inner:
+                    link.setID(self._idManager.newLink())
+                renumberInnerLinks(inner)
+
+        def rekey(node: Node):
+            # Output ports store their links by ID
+            for port in node.getOutputPorts():
+                port.rekeyLinks()  # type: ignore
+            for inner in node.innerNodes:
+                rekey(inner)
+
+        for node in nodes:
+            renumber(node)
+            self._nodeLookup[node.nodeID] = node
+            for port in node.getInputPorts() + node.getOutputPorts():  # type: ignore
+                self._portLookup[port.portID] = port
+
+        for node in nodes:
+            for link in node:
+                link.setID(self._idManager.newLink())
+                self._linkIDLookup[link.linkID] = link
+                self._linkLookup[(link.pPort.portID, link.cPort.portID)] = link
+            renumberInnerLinks(node)
+
+        for node in nodes:
+            rekey(node)
+
+        self._traversal = None
 
     def _recurGenTraversal(self, out: Deque[Node], curNode: Node, ahead: Set[int], behind: Set[int]):
         ahead.add(curNode.nodeID)
 
         for link in curNode:
+            if link.delay:
+                # Cut edge, the child reads the previous run's value
+                continue
             childID = link.cPort.node.nodeID
             if childID in ahead:
                 raise ExecutionError(
@@ -356,7 +919,10 @@ class NodeGraph:
         # print(f'Adding {curNode}')
         out.appendleft(curNode)
 
-    def genTraversal(self):
+    def _genNodeOrder(self) -> List[Node]:
+        """
+        Topologically sorts the graph's own nodes, macros are not expanded
+        """
         newQ = deque()
         ahead: Set[int] = set()
         behind: Set[int] = set()
@@ -373,7 +939,24 @@ class NodeGraph:
                 continue
             self._recurGenTraversal(newQ, curItem, ahead, behind)
 
-        self._traversal = list(newQ)
+        return list(newQ)
+
+    @staticmethod
+    def _flatten(order: List[Node]) -> List[Node]:
+        out = []
+        for node in order:
+            out.extend(node.flatten())
+        return out
+
+    def genTraversal(self):
+        self._traversal = self._flatten(self._genNodeOrder())
+
+    def _setTraversalOrder(self, order: List[int]):
+        """
+        Sets a precomputed traversal, as indices into the node list
+        """
+        nodes = list(self._nodeLookup.values())
+        self._traversal = self._flatten([nodes[idx] for idx in order])
 
     def str_traversal(self) -> str:
         """
@@ -392,20 +975,287 @@ class NodeGraph:
             lines.append(str(x))
         return "\n".join(lines)
 
-    def execute(self):
-        if self._traversal is None:
-            self.genTraversal()
+    def _getPlan(self) -> ExecutionPlan:
+        plan = self._plan
+        if plan is None or plan.isStale(self._traversal):
+            with self._traversalLock:
+                if self._traversal is None:
+                    self.genTraversal()
+                plan = self._plan
+                if plan is None or plan.isStale(self._traversal):
+                    plan = self._plan = ExecutionPlan(
+                        self._traversal,  # type: ignore
+                        cse=self._cse,
+                        constFold=self._constFold,
+                        dce=self._dce,
+                        memoize=self._memoize,
+                        lazy=self._lazy
+                    )
+        return plan
+
+    def executionPlan(self) -> ExecutionPlan:
+        """
+        Returns the plan the next execute() will run, building it if needed
+        """
+        return self._getPlan()
 
-        if self._traversal is None:
+    def enableCSE(self, enabled: bool = True) -> int:
+        """
+        Enables common-subexpression elimination. Pure nodes with the same
+        type, args and upstream ports are only executed once per run
+        :return: The number of nodes eliminated from the plan
+        """
+        self._cse = enabled
+        self._plan = None
+        return self._getPlan().numEliminated
+
+    def enableConstantFolding(self, enabled: bool = True) -> int:
+        """
+        Enables constant folding. Pure nodes without inputs, and pure nodes fed only by them,
+        are executed once and their outputs are kept across runs. They are only
+        executed again when one of their args changes or setupNodes() is called
+        :return: The number of nodes folded
+        """
+        self._constFold = enabled
+        self._plan = None
+        return self._getPlan().numFolded
+
+    def enableDeadNodeElimination(self, enabled: bool = True) -> int:
+        """
+        Enables dead node elimination. Nodes without side effects (see Node.EFFECT)
+        whose outputs never reach a node with side effects are not executed
+        :return: The number of nodes eliminated from the plan
+        """
+        self._dce = enabled
+        self._plan = None
+        return self._getPlan().numDead
+
+    def enableMemoization(self, enabled: bool = True) -> int:
+        """
+        Enables memoization. Pure nodes are only executed when one of their input values
+        or args has changed since the last run, otherwise their last outputs are reused.
+        Input values are compared by value (see plan._MemoStep), each ExecutionContext
+        keeps its own memos. setupNodes() clears the memos
+        :return: The number of nodes memoized
+        """
+        self._memoize = enabled
+        self._plan = None
+        return self._getPlan().numMemoized
+
+    def enableLazyEvaluation(self, enabled: bool = True):
+        """
+        Enables pull-based evaluation. Nodes with side effects (see Node.EFFECT) always run,
+        other nodes only run when a node downstream needs their outputs.
+        Control nodes (see control.py) only evaluate the branch they take
+        """
+        self._lazy = enabled
+        self._plan = None
+
+    def execute(
+        self,
+        ctx: Optional[ExecutionContext] = None,
+        timeout: Optional[float] = None,
+        nodeTimeout: Optional[float] = None,
+        token: Optional[CancelToken] = None
+    ):
+        """
+        Runs every node in the graph
+        :param ctx: Holds the link values, datamap scope and node state for this run.
+                    Without one, values are stored on the graph's links and the graph
+                    must not be executed from more than one thread at a time
+        :param timeout: Seconds the whole run may take before ExecutionTimeoutError is raised
+        :param nodeTimeout: Seconds each node may take, for types that don't set Node.TIMEOUT
+        :param token: Cancels the run from another thread, ExecutionCancelledError is raised.
+                      It is also cancelled when the run times out, so nodes polling it stop
+
+        With a timeout or a token the nodes run on a worker thread and execute() returns
+        as soon as the run expires or is cancelled. Python can't stop a thread, the node
+        that was running keeps going in the background until it returns, no further nodes
+        are run. Until it returns, running the graph again without a context, or with
+        the same ctx, raises ExecutionError so its late writes can't mix with a new run.
+        See waitIdle()
+        :return: None
+        """
+        self._checkIdle(ctx, 'NodeGraph.execute()')
+        plan = self._getPlan()
+        plan.refold()
+
+        guard = None
+        if timeout is not None or nodeTimeout is not None or token is not None or plan.timeouts:
+            guard = _Watchdog(self._runStep, CancelToken() if token is None else token, timeout, nodeTimeout)
+
+        spill = self._spill
+        run = None if spill is None else spill.newRun()
+        reset = None if run is None else _SPILL.set(run)
+        try:
+            self._execute(plan, ctx, guard)
+        except ExecutionError:
+            if guard is not None and guard.running:
+                # Its late writes would land in the next run
+                if ctx is None:
+                    self._abandoned = guard
+                else:
+                    ctx._abandoned = guard
+            raise
+        finally:
+            if run is not None:
+                _SPILL.reset(reset)  # type: ignore
+                spill.endRun(run)  # type: ignore
+
+    def _checkIdle(self, ctx: Optional[ExecutionContext], loc: str):
+        guard = self._abandoned if ctx is None else ctx._abandoned
+        if guard is not None and guard.running:
+            raise ExecutionError(
+                loc, f"A timed out or cancelled run is still running node '{guard.node}', see NodeGraph.waitIdle()"
+            )
+
+    def waitIdle(self, ctx: Optional[ExecutionContext] = None, timeout: Optional[float] = None) -> bool:
+        """
+        Waits for the node left running by a timed out or cancelled execute() to return
+        :param ctx: The context of that run, None for a run without one
+        :param timeout: Seconds to wait, None to wait as long as it takes
+        :return: Whether the graph, or ctx, can be executed again
+        """
+        guard = self._abandoned if ctx is None else ctx._abandoned
+        return guard is None or guard.join(timeout)
+
+    def _execute(self, plan: ExecutionPlan, ctx: Optional[ExecutionContext], guard: Optional[_Watchdog]):
+        if ctx is None:
+            # Last run's writes become this run's reads, before the ports are cleared
+            for link in plan.delayLinks:
+                link.promote()
+            # Reset input ports to None or []
+            for n in self._nodeLookup.values():
+                n.resetPorts()
+            for link, value in plan.pinned:
+                link.value = value
+            self._runPlan(plan, guard)
             return
 
-        # Reset input ports to None or []
-        for n in self._nodeLookup.values():
-            n.resetPorts()
+        self._contexts.add(ctx)
+        reset = _CURRENT.set(ctx)
+        try:
+            self._runInContext(plan, ctx, guard)
+        finally:
+            _CURRENT.reset(reset)
+
+    def executeN(
+        self,
+        n: int,
+        ctx: Optional[ExecutionContext] = None,
+        timeout: Optional[float] = None,
+        nodeTimeout: Optional[float] = None,
+        token: Optional[CancelToken] = None
+    ) -> ExecutionContext:
+        """
+        Runs the graph n times back to back, e.g. to step a loop built from delay links.
+        The plan is checked and the context entered once for all the runs,
+        rather than once per run as when calling execute() n times.
+        Timeouts and the token are enforced as in execute(), which runs the nodes
+        on a worker thread
+        :param n: The number of runs
+        :param ctx: The context shared by the runs, defaults to a new one
+        :param timeout: Seconds all the runs together may take before ExecutionTimeoutError is raised
+        :param nodeTimeout: Seconds each node may take, for types that don't set Node.TIMEOUT
+        :param token: Cancels the runs from another thread, ExecutionCancelledError is raised
+        :return: The context, holding the values of the last run
+        """
+        if n < 0:
+            raise NodeGraphError("NodeGraph.executeN()", f"Invalid number of runs: {n}")
+        if ctx is None:
+            ctx = ExecutionContext()
+        self._checkIdle(ctx, 'NodeGraph.executeN()')
+        self._contexts.add(ctx)
+
+        plan = self._getPlan()
+        plan.refold()
+
+        guarded = timeout is not None or nodeTimeout is not None or token is not None or plan.timeouts
+        if guarded and token is None:
+            # Shared by the runs, so nodes of every run see the timeout
+            token = CancelToken()
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        spill = self._spill
+        reset = _CURRENT.set(ctx)
+        resetToken = _TOKEN.set(token)
+        try:
+            for idx in range(n):
+                if token is not None:
+                    token.check(f'NodeGraph.executeN(), run {idx}')
+                guard = None
+                if guarded:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    guard = _Watchdog(self._runStep, token, remaining, nodeTimeout)  # type: ignore
+
+                run = None if spill is None else spill.newRun()
+                resetSpill = None if run is None else _SPILL.set(run)
+                try:
+                    self._runInContext(plan, ctx, guard)
+                except ExecutionError:
+                    if guard is not None and guard.running:
+                        # Its late writes would land in the next run
+                        ctx._abandoned = guard
+                    raise
+                finally:
+                    if run is not None:
+                        _SPILL.reset(resetSpill)  # type: ignore
+                        spill.endRun(run)  # type: ignore
+        finally:
+            _TOKEN.reset(resetToken)
+            _CURRENT.reset(reset)
+        return ctx
+
+    def _runInContext(self, plan: ExecutionPlan, ctx: ExecutionContext, guard: Optional[_Watchdog] = None):
+        ctx.reset()
+        values = ctx.linkValues
+        values.update(plan.pinnedByID)
+        for link, value in plan.pinnedSlots:
+            link.store(ctx, value)
+
+        delayValues = ctx.delayValues
+        for linkID, readID in plan.delayIDs:
+            values[readID] = delayValues.get(linkID)
+
+        self._runPlan(plan, guard)
+
+        for linkID, _ in plan.delayIDs:
+            delayValues[linkID] = values.get(linkID)
+
+    def resetDelays(self):
+        """
+        Clears the values carried by delay links between runs without an ExecutionContext,
+        the next run reads None from them. See ExecutionContext.resetDelays()
+        """
+        for node in self._nodeLookup.values():
+            for link in node.incoming():
+                if link.delay:
+                    link.clear()  # type: ignore
+
+    def _runPlan(self, plan: ExecutionPlan, guard: Optional[_Watchdog] = None):
+        if guard is not None:
+            guard.run(plan)
+        elif plan.lazy:
+            plan.runLazy(self._runStep)
+        else:
+            self._runSteps(plan.steps)
+
+    @staticmethod
+    def _runStep(n: Any):
+        try:
+            n.execute()
+        except (ExecutionCancelledError, ExecutionTimeoutError):
+            # From Node.checkCancelled()
+            raise
+        except Exception as err:
+            raise ExecutionError("Nodegraph.execute()", f"Error running node '{n}': {err}") from None
 
-        for n in self._traversal:
+    def _runSteps(self, steps: List[Any]):
+        for n in steps:
             try:
                 n.execute()
+            except (ExecutionCancelledError, ExecutionTimeoutError):
+                raise
             except Exception as err:
                 raise ExecutionError("Nodegraph.execute()", f"Error running node '{n}': {err}") from None
 
@@ -0,0 +1,459 @@
+import operator
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from nodepasta.node import Node, EFFECT_PURE, EFFECT_WRITES
+from nodepasta.control import ControlNode
+from nodepasta.ports import OutPort, Link, DelayLink, _SlotLink
+from nodepasta.argtypes import NodeArg, argsKey
+from nodepasta.context import ExecutionContext, _CURRENT
+from nodepasta.errors import ExecutionError, NodeGraphError
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Versions only increase, so the sum over a fixed set of args changes whenever one of them is set
+_version = operator.attrgetter('version')
+
+
+def _argsKey(node: Node) -> Optional[str]:
+    try:
+        return argsKey(node.args.values())
+    except NodeGraphError:
+        # Never merged
+        return None
+
+
+class _AliasStep:
+    """
+    Runs in place of a node merged into an identical one,
+    forwards the representative's outputs to the merged node's links
+    """
+
+    def __init__(self, node: Node, rep: Node, pairs: List[Tuple[OutPort, OutPort]]):
+        self.node = node
+        self.rep = rep
+        # (Representative port, Merged port)
+        self._pairs = pairs
+
+    def execute(self):
+        for src, dst in self._pairs:
+            dst.value(src.current())
+
+    def __str__(self):
+        return f'{self.node} = {self.rep}'
+
+
+# Input values compared by value, other types never count as unchanged
+_SCALARS = (type(None), bool, int, float, complex, str, bytes)
+# Never equal to anything, not even itself
+_UNKNOWN = object()
+
+
+def _inputKey(v: Any) -> Any:
+    """
+    A copy of an input value that compares equal to the key of any equal value,
+    _UNKNOWN if it can't be compared cheaply
+    """
+    if isinstance(v, _SCALARS):
+        # 1, 1.0 and True are equal, but a node may output something different for them
+        return type(v), v
+    if isinstance(v, (list, tuple)):
+        out = tuple(_inputKey(x) for x in v)
+        if any(x is _UNKNOWN for x in out):
+            return _UNKNOWN
+        return type(v), out
+    if np is not None and isinstance(v, (np.ndarray, np.generic)) and v.dtype.kind in 'biufcmMSU':
+        return type(v), v.dtype.str, v.shape, v.tobytes()
+    return _UNKNOWN
+
+
+class _MemoStep:
+    """
+    Runs a pure node only when its inputs or args have changed since the last run,
+    otherwise writes the outputs it produced last time again.
+    Inputs are compared by value, scalars, strings, lists and tuples of them, and numpy arrays.
+    Nodes fed any other kind of value always run.
+    Each ExecutionContext keeps its own memo
+    """
+
+    def __init__(self, node: Node):
+        self.node = node
+        self._inPorts = list(node.getInputPorts())
+        self._outPorts = [x for x in node.getOutputPorts() if len(x.links) > 0]  # type: ignore
+        self._args = list(node.args.values())
+        # Bumped by clear(), memos made before are ignored
+        self._generation = 0
+        # (Step, Generation, Input keys, Arg versions, Output values) of the last run without a context
+        self._last: Optional[Tuple[Any, int, Tuple, Tuple, List[Any]]] = None
+        self.hits = 0
+
+    def execute(self):
+        inputs = tuple(_inputKey(port.value()) for port in self._inPorts)
+        versions = tuple(arg.version for arg in self._args)
+
+        ctx = _CURRENT.get()
+        last = self._last if ctx is None else ctx.memos.get(self.node.nodeID)
+        # The memo may have been left by a step of an older plan
+        hit = last is not None and last[0] is self and last[1] == self._generation
+        if hit and last[3] == versions and last[2] == inputs and _UNKNOWN not in inputs:
+            for port, v in zip(self._outPorts, last[4]):
+                port.value(v)
+            self.hits += 1
+            return
+
+        self.node.execute()
+        memo = (self, self._generation, inputs, versions, [port.current() for port in self._outPorts])
+        if ctx is None:
+            self._last = memo
+        else:
+            ctx.memos[self.node.nodeID] = memo
+
+    def clear(self):
+        self._generation += 1
+        self._last = None
+
+    def __str__(self):
+        return str(self.node)
+
+
+class ExecutionPlan:
+    """
+    The steps run by NodeGraph.execute(), built from the graph's traversal.
+    Optimization passes only change the plan, never the editable graph
+    """
+
+    def __init__(
+        self,
+        traversal: List[Node],
+        cse: bool = False,
+        constFold: bool = False,
+        dce: bool = False,
+        memoize: bool = False,
+        lazy: bool = False
+    ):
+        self.traversal = traversal
+        # Objects with an execute() method, run in order
+        self.steps: List[Any] = list(traversal)
+
+        self.dce = dce
+        self.numDead = 0
+
+        self.cse = cse
+        self.numEliminated = 0
+        # Args of the nodes CSE compared, merges depend on their values
+        self._cseArgs: List[NodeArg] = []
+        self._cseVersion = 0
+
+        self.constFold = constFold
+        # Steps evaluated once, whose outputs stay pinned across runs
+        self.folded: List[Any] = []
+        # Args of each folded step
+        self._foldArgs: List[List[NodeArg]] = []
+        self._foldLinks: List[Link] = []
+        self._foldLock = threading.Lock()
+        # Arg versions the pinned values were computed with, None if they need computing
+        self._foldVersions: Optional[List[List[int]]] = None
+        # Sum of _foldVersions, checked before comparing them one by one
+        self._foldVersion = -1
+        # (Link, Value)
+        self.pinned: List[Tuple[Link, Any]] = []
+        # LinkID -> Value
+        self.pinnedByID: Dict[int, Any] = {}
+        # Pinned links into var ports, these also fill the port's buffer
+        self.pinnedSlots: List[Tuple[_SlotLink, Any]] = []
+
+        self.memoize = memoize
+        self.memoSteps: List[_MemoStep] = []
+
+        # Feedback links into the traversal's nodes, their values carry over between runs
+        self.delayLinks: List[DelayLink] = [
+            link for node in traversal for link in node.incoming() if link.delay  # type: ignore
+        ]
+        # Whether a node in the plan sets Node.TIMEOUT
+        self.timeouts = any(node.descriptor().timeout is not None for node in traversal)
+        # (Written ID, Read ID) of each delay link
+        self.delayIDs: List[Tuple[int, int]] = [(link.linkID, link.readID) for link in self.delayLinks]
+
+        if dce:
+            self._eliminateDeadNodes()
+        if cse:
+            self._eliminateCommonSubexpressions()
+        if constFold:
+            self._foldConstants()
+        if memoize:
+            self._memoize()
+
+        self.lazy = lazy
+        # NodeID -> Step running it
+        self._lazySteps: Dict[int, Any] = {}
+        # Nodes with side effects, lazy runs start from them in traversal order
+        self._lazyRoots: List[Node] = []
+        if lazy:
+            self._prepareLazy()
+
+    @property
+    def numFolded(self) -> int:
+        return len(self.folded)
+
+    @property
+    def numMemoized(self) -> int:
+        return len(self.memoSteps)
+
+    def _eliminateDeadNodes(self):
+        """
+        Drops nodes without side effects whose outputs never reach a node with side effects
+        """
+        live: Set[int] = set()
+        changed = True
+        # A delay link may feed a node earlier in the traversal, repeat until nothing changes
+        while changed:
+            changed = False
+            for node in reversed(self.steps):
+                if node.nodeID not in live and (
+                    node.descriptor().effect == EFFECT_WRITES or any(
+                        link.cPort.node.nodeID in live  # type: ignore
+                        for port in node.getOutputPorts() for link in port.links  # type: ignore
+                    )
+                ):
+                    live.add(node.nodeID)
+                    changed = True
+
+        steps = [node for node in self.steps if node.nodeID in live]
+        self.numDead = len(self.steps) - len(steps)
+        self.steps = steps
+
+    def _prepareLazy(self):
+        for step in self.steps:
+            node: Node = step if isinstance(step, Node) else step.node
+            self._lazySteps[node.nodeID] = step
+            if node.descriptor().effect == EFFECT_WRITES:
+                self._lazyRoots.append(node)
+        # Nothing pulls on a delay link during the run that reads it, so its parent is pulled
+        # afterwards to hold the value for the next run
+        for link in self.delayLinks:
+            node = link.pPort.node
+            if node.nodeID in self._lazySteps:
+                self._lazyRoots.append(node)
+
+    def _lazyDeps(self, step: Any, ports: Any, done: Set[int]) -> List[Node]:
+        """
+        The upstream nodes of the ports that still have to run
+        """
+        out = []
+        if isinstance(step, _AliasStep) and step.rep.nodeID not in done:
+            out.append(step.rep)
+        steps = self._lazySteps
+        for port in ports:
+            link = port.link
+            if link is None or link.delay:
+                continue
+            node = link.pPort.node
+            # Folded and eliminated nodes have no step
+            if node.nodeID not in done and node.nodeID in steps:
+                out.append(node)
+        return out
+
+    def runLazy(self, run: Callable[[Any], None]):
+        """
+        Pull-based run. Starting from the nodes with side effects, a node only runs
+        once something downstream needs it. Control nodes only pull the branch taken
+        :param run: Runs a single step
+        """
+        steps = self._lazySteps
+        done: Set[int] = set()
+        for root in self._lazyRoots:
+            if root.nodeID in done:
+                continue
+
+            # [Node, Control ports evaluated]
+            stack: List[List[Any]] = [[root, False]]
+            while len(stack) > 0:
+                frame = stack[-1]
+                node: Node = frame[0]
+                if node.nodeID in done:
+                    stack.pop()
+                    continue
+
+                step = steps[node.nodeID]
+                alias = isinstance(step, _AliasStep)
+                control = not alias and isinstance(node, ControlNode)
+                if alias:
+                    # Only needs the representative
+                    ports = ()
+                elif not control:
+                    ports = node.upstreamPorts()
+                elif not frame[1]:
+                    ports = node.controlPorts()
+                else:
+                    ports = node.branchPorts()
+
+                deps = self._lazyDeps(step, ports, done)
+                if len(deps) > 0:
+                    stack.extend([x, False] for x in deps)
+                    continue
+
+                if control and not frame[1]:
+                    frame[1] = True
+                    continue
+
+                stack.pop()
+                run(step)
+                done.add(node.nodeID)
+
+    def _memoize(self):
+        """
+        Wraps the remaining pure nodes so they are skipped while their inputs don't change
+        """
+        for idx, step in enumerate(self.steps):
+            if isinstance(step, Node) and step.descriptor().effect == EFFECT_PURE:
+                memo = _MemoStep(step)
+                self.steps[idx] = memo
+                self.memoSteps.append(memo)
+
+    def isStale(self, traversal: Optional[List[Node]]) -> bool:
+        if traversal is not self.traversal:
+            return True
+        # Merges depend on argument values
+        return self.cse and self._cseVersion != sum(map(_version, self._cseArgs))
+
+    def _foldConstants(self):
+        """
+        Moves pure steps fed only by other constant steps out of the per-run steps
+        """
+        constNodes: Set[int] = set()
+        remaining = []
+        for step in self.steps:
+            node: Node = step.node if isinstance(step, _AliasStep) else step
+            if node.descriptor().effect == EFFECT_PURE and all(
+                port.link is None or (not port.link.delay and port.link.pPort.node.nodeID in constNodes)  # type: ignore
+                for port in node.getInputPorts()
+            ):
+                constNodes.add(node.nodeID)
+                self.folded.append(step)
+                self._foldArgs.append(list(node.args.values()))
+                for port in node.getOutputPorts():
+                    self._foldLinks.extend(port.links)  # type: ignore
+            else:
+                remaining.append(step)
+
+        self.steps = remaining
+
+    def dirtyFold(self):
+        """
+        Forces the constant steps to be evaluated again on the next run,
+        and the memoized steps to run again
+        """
+        self._foldVersions = None
+        for memo in self.memoSteps:
+            memo.clear()
+
+    def refold(self):
+        """
+        Evaluates the constant steps if this is the first run
+        or one of their arguments has changed since
+        """
+        if not self.constFold:
+            return
+
+        version = sum(sum(map(_version, args)) for args in self._foldArgs)
+        if self._foldVersions is not None and version == self._foldVersion:
+            return
+
+        with self._foldLock:
+            versions = [[arg.version for arg in args] for args in self._foldArgs]
+            if versions != self._foldVersions:
+                self._evalFolded(versions)
+            self._foldVersion = sum(map(sum, versions))
+
+    def _evalFolded(self, versions: List[List[int]]):
+        # Only steps whose args changed, and the constant steps they feed, are run again
+        oldVersions = self._foldVersions
+        dirty: Set[int] = set()
+
+        # Run in a private context so the values don't touch a run in progress
+        ctx = ExecutionContext()
+        ctx.linkValues = dict(self.pinnedByID)
+        for link, value in self.pinnedSlots:
+            link.store(ctx, value)
+        token = _CURRENT.set(ctx)
+        try:
+            for idx, step in enumerate(self.folded):
+                node: Node = step.node if isinstance(step, _AliasStep) else step
+                if (
+                    oldVersions is not None and versions[idx] == oldVersions[idx]
+                    and not (isinstance(step, _AliasStep) and step.rep.nodeID in dirty) and all(
+                        port.link is None or port.link.pPort.node.nodeID not in dirty  # type: ignore
+                        for port in node.getInputPorts()
+                    )
+                ):
+                    continue
+
+                dirty.add(node.nodeID)
+                try:
+                    step.execute()
+                except Exception as err:
+                    raise ExecutionError("ExecutionPlan.refold()", f"Error running node '{step}': {err}") from None
+        finally:
+            _CURRENT.reset(token)
+
+        values = ctx.linkValues
+        self.pinned = [(link, values.get(link.linkID)) for link in self._foldLinks]
+        self.pinnedByID = {link.linkID: v for link, v in self.pinned}
+        self.pinnedSlots = [(link, v) for link, v in self.pinned if isinstance(link, _SlotLink)]  # type: ignore
+        self._foldVersions = versions
+
+    def _eliminateCommonSubexpressions(self):
+        """
+        Merges pure nodes with the same type, args and upstream ports
+        """
+        # Merged port ID -> Representative port ID
+        portAlias: Dict[int, int] = {}
+        # Signature -> Representatives
+        groups: Dict[Tuple, List[Node]] = {}
+
+        for idx, node in enumerate(self.steps):
+            if not isinstance(node, Node) or node.descriptor().effect != EFFECT_PURE:
+                continue
+
+            upstream = []
+            for port in node.getInputPorts():
+                link = port.link  # type: ignore
+                if link is None:
+                    upstream.append(None)
+                else:
+                    pID = link.pPort.portID
+                    upstream.append((portAlias.get(pID, pID), link.delay))
+
+            self._cseArgs.extend(node.args.values())
+            key = _argsKey(node)
+            if key is None:
+                continue
+            # The class, not NODETYPE, which different classes may share
+            sig = (
+                type(node),
+                key,
+                tuple(len(x.getPorts()) for x in node.inputs),
+                tuple(len(x.getPorts()) for x in node.outputs),
+                tuple(upstream)
+            )
+
+            outPorts = node.getOutputPorts()
+            reps = groups.setdefault(sig, [])
+            for rep in reps:
+                repPorts = rep.getOutputPorts()
+                # The representative must hold a value for every port the merged node feeds
+                if all(len(rp.links) > 0 or len(op.links) == 0 for rp, op in zip(repPorts, outPorts)):  # type: ignore
+                    pairs = [(rp, op) for rp, op in zip(repPorts, outPorts) if len(op.links) > 0]  # type: ignore
+                    self.steps[idx] = _AliasStep(node, rep, pairs)  # type: ignore
+                    for rp, op in zip(repPorts, outPorts):
+                        portAlias[op.portID] = rp.portID
+                    self.numEliminated += 1
+                    break
+            else:
+                reps.append(node)
+
+        self._cseVersion = sum(map(_version, self._cseArgs))
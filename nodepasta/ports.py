@@ -1,21 +1,35 @@
-from typing import Any, Optional, Iterator, List, Sequence, TYPE_CHECKING
+from typing import Any, Dict, Optional, Iterator, List, Sequence, Tuple, ValuesView, TYPE_CHECKING
 
 from nodepasta.argtypes import ANY
 from nodepasta.errors import NodeDefError, ExecutionError
 from nodepasta.id_manager import IDManager
+from nodepasta.context import _CURRENT, ExecutionContext
+from nodepasta.spill import _SPILL, SpilledValue
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 if TYPE_CHECKING:
     from nodepasta.node import Node
 
 
 class Link:
+    # Whether the link carries the previous run's value, see DelayLink
+    delay = False
 
     def __init__(self, linkID: int, pPort: 'IOPort', cPort: 'IOPort'):
-        self.linkID = linkID
+        self.setID(linkID)
         self.pPort = pPort
         self.cPort = cPort
         self.value = None
 
+    def setID(self, linkID: int):
+        self.linkID = linkID
+        # Key the child reads the value from in an ExecutionContext
+        self.readID = linkID
+
     def __str__(self):
         return f'Link {self.pPort} -> {self.cPort}'
 
@@ -26,16 +40,89 @@ class Link:
         return self.linkID == __o.linkID
 
 
+class DelayLink(Link):
+    """
+    A feedback link. The child reads the value the parent wrote during the previous run,
+    None on the first run, so the traversal does not order the parent before the child
+    and the link may close a loop
+    """
+
+    delay = True
+
+    def __init__(self, linkID: int, pPort: 'IOPort', cPort: 'IOPort'):
+        # Value read this run
+        self._prev: Any = None
+        # Value written this run
+        self._next: Any = None
+        super().__init__(linkID, pPort, cPort)
+
+    def setID(self, linkID: int):
+        self.linkID = linkID
+        # Written under the link ID, read back under its complement on the next run
+        self.readID = ~linkID
+
+    @property  # type: ignore
+    def value(self) -> Any:
+        return self._prev
+
+    @value.setter
+    def value(self, v: Any):
+        self._next = v
+
+    def promote(self):
+        """
+        Makes the value written this run the one read on the next
+        """
+        self._prev = self._next
+
+    def clear(self):
+        self._prev = None
+        self._next = None
+
+
+class _SlotLink(Link):
+    """
+    A link into a variable input port. Its value lives in
+    the var port's buffer rather than on the link
+    """
+
+    @property  # type: ignore
+    def value(self) -> Any:
+        cPort: _VarSlotPort = self.cPort  # type: ignore
+        if cPort.link is not self:
+            # Not linked yet, or already removed
+            return None
+        return cPort.parent._buffer[cPort.slot]
+
+    @value.setter
+    def value(self, v: Any):
+        cPort: _VarSlotPort = self.cPort  # type: ignore
+        if cPort.link is self:
+            cPort.parent._store(cPort.parent._buffer, cPort.slot, v)
+
+    def store(self, ctx: ExecutionContext, v: Any):
+        """
+        Writes a value into the context's copy of the buffer
+        """
+        cPort: _VarSlotPort = self.cPort  # type: ignore
+        parent = cPort.parent
+        parent._store(parent._ctxBuffer(ctx), cPort.slot, v)
+
+
 class Port:
 
-    def __init__(self, name: str, typeStr: str, descr: str, variable=False) -> None:
+    def __init__(self, name: str, typeStr: str, descr: str, variable=False, dtype: Any = None) -> None:
+        """
+        :param dtype: For variable input ports, a numpy dtype for the buffer holding the values
+        """
         self.name = name
         self.typeStr = typeStr
         self.descr = descr
         self.variable = variable
+        self.dtype = dtype
 
     def copy(self) -> 'Port':
-        return Port(self.name, self.typeStr, self.descr, self.variable)
+        return Port(self.name, self.typeStr, self.descr, self.variable, self.dtype)
 
 
 class IOPort:
@@ -47,6 +134,15 @@ class IOPort:
         self.port = port
         self.allowAny = port.typeStr == ANY
 
+    def newLink(self, linkID: int, pPort: 'IOPort', delay: bool = False) -> Link:
+        """
+        Makes a link into this port, of the type this port needs
+        :param delay: Make a DelayLink
+        """
+        if delay:
+            return DelayLink(linkID, pPort, self)
+        return Link(linkID, pPort, self)
+
     def setLink(self, link: Link) -> Optional[Link]:
         raise NotImplementedError
 
@@ -83,8 +179,16 @@ class InPort(IOPort):
         self.link: Optional[Link] = None
 
     def value(self) -> Any:
-        if self.link is not None:
-            return self.link.value
+        link = self.link
+        if link is not None:
+            ctx = _CURRENT.get()
+            if ctx is None:
+                v = link.value
+            else:
+                v = ctx.linkValues.get(link.readID)
+            if type(v) is SpilledValue:
+                return v.get()
+            return v
 
     def setLink(self, link: Link):
         if link.cPort != self:
@@ -117,29 +221,82 @@ class InPort(IOPort):
 
 
 class OutPort(IOPort):
+    # Set on the ports of a variable output port
+    _parent: Optional['_VarOutPort'] = None
 
     def __init__(self, portID: int, port: Port, node: 'Node'):
         super().__init__(portID, port, node)
-        self.links: List[Link] = []
+        # LinkID -> Link, insertion ordered with constant time removal
+        self._links: Dict[int, Link] = {}
+        # The subset of links into variable input ports
+        self._slotLinks: Dict[int, _SlotLink] = {}
+
+    @property
+    def links(self) -> ValuesView[Link]:
+        return self._links.values()
 
     def value(self, v: Any):
-        for link in self.links:
-            link.value = v
+        raw = v
+        spill = _SPILL.get()
+        if spill is not None:
+            v = spill.wrap(v)
+
+        ctx = _CURRENT.get()
+        if ctx is None:
+            for link in self._links.values():
+                link.value = v
+            if v is not raw and self._slotLinks:
+                # Var port buffers always hold the value itself
+                for slotLink in self._slotLinks.values():
+                    slotLink.value = raw
+        else:
+            values = ctx.linkValues
+            for link in self._links.values():
+                values[link.linkID] = v
+            if self._slotLinks:
+                for slotLink in self._slotLinks.values():
+                    slotLink.store(ctx, raw)
+
+    def current(self) -> Any:
+        """
+        Returns the value last written to this port this run,
+        None if the port has no links to hold it
+        """
+        for link in self._links.values():
+            ctx = _CURRENT.get()
+            if ctx is None:
+                # Delay links only hand out the previous run's value
+                return link._next if link.delay else link.value  # type: ignore
+            return ctx.linkValues.get(link.linkID)
+        return None
 
     def setLink(self, link: Link) -> Optional[Link]:
-        self.links.append(link)
+        self.addLink(link)
 
     def addLink(self, link: Link):
-        self.links.append(link)
+        self._links[link.linkID] = link
+        if isinstance(link, _SlotLink):
+            self._slotLinks[link.linkID] = link
+        if self._parent is not None:
+            self._parent._scatter = None
 
     def getPorts(self) -> Sequence['IOPort']:
         return [self]
 
+    def rekeyLinks(self):
+        """
+        Rebuilds the link storage after the links' IDs have changed
+        """
+        self._links = {link.linkID: link for link in self._links.values()}
+        self._slotLinks = {link.linkID: link for link in self._slotLinks.values()}
+
     def remLink(self, link: Link):
-        try:
-            self.links.remove(link)
-        except ValueError:
-            raise NodeDefError("OutPort.remLink()", "Cannot remove link, link not found") from None
+        if self._links.get(link.linkID) is not link:
+            raise NodeDefError("OutPort.remLink()", "Cannot remove link, link not found")
+        del self._links[link.linkID]
+        self._slotLinks.pop(link.linkID, None)
+        if self._parent is not None:
+            self._parent._scatter = None
 
     def setVarPorts(self, num: int):
         if num != 1:
@@ -152,36 +309,114 @@ class OutPort(IOPort):
         raise NodeDefError('OutPort.remVarPort()', 'Cannot rem var port, port is not variable')
 
     def __iter__(self) -> Iterator[Link]:
-        return iter(self.links)
+        return iter(self._links.values())
 
     def __str__(self):
         return f'OutPort(name: {self.port.name}, type: {self.port.typeStr})'
 
 
+class _VarSlotPort(InPort):
+    """
+    One input of a variable input port, owns a slot of the port's buffer
+    """
+
+    def __init__(self, portID: int, port: Port, node: 'Node', parent: '_VarInPort', slot: int):
+        super().__init__(portID, port, node)
+        self.parent = parent
+        self.slot = slot
+
+    def newLink(self, linkID: int, pPort: IOPort, delay: bool = False) -> Link:
+        if delay:
+            raise NodeDefError("_VarSlotPort.newLink()", "Delay links into var ports are not supported")
+        return _SlotLink(linkID, pPort, self)
+
+    def setLink(self, link: Link):
+        if not isinstance(link, _SlotLink):
+            raise NodeDefError("_VarSlotPort.setLink()", "Links into var ports must be made with port.newLink()")
+        return super().setLink(link)
+
+    def remLink(self, link: Link):
+        super().remLink(link)
+        # Unlinked ports read as empty
+        self.parent._store(self.parent._buffer, self.slot, None)
+
+
 class _VarInPort(InPort):
 
     def __init__(self, idManager: IDManager, port: Port, node: 'Node'):
         super().__init__(-1, port, node)
-        self.ports: List[InPort] = []
+        self.ports: List[_VarSlotPort] = []
         self.idManager = idManager
+        if port.dtype is not None and np is None:
+            raise NodeDefError("_VarInPort.init()", f"Port {port.name} has a dtype but numpy is not installed")
+        # Values of the ports, written in place by upstream nodes
+        self._buffer: Any = self._newBuffer(0)
 
     # Set Link is not implemented, should never be setting a link on a parent VarPort
 
+    def _newBuffer(self, num: int) -> Any:
+        if self.port.dtype is None:
+            return [None] * num
+        return np.zeros(num, dtype=self.port.dtype)
+
+    def _store(self, buffer: Any, slot: int, v: Any):
+        if v is None and self.port.dtype is not None:
+            # Arrays can't hold None, empty slots read as zero
+            v = 0
+        buffer[slot] = v
+
+    def _ctxBuffer(self, ctx: ExecutionContext) -> Any:
+        try:
+            return ctx.varBuffers[id(self)]
+        except KeyError:
+            out = ctx.varBuffers[id(self)] = self._newBuffer(len(self.ports))
+            return out
+
+    def _resize(self, num: int):
+        old = self._buffer
+        self._buffer = self._newBuffer(num)
+        keep = min(num, len(old))
+        self._buffer[:keep] = old[:keep]
+
     def setVarPorts(self, num: int):
-        self.ports = [InPort(self.idManager.newPort(), self.port, self.node) for _ in range(num)]
+        self.ports = [_VarSlotPort(self.idManager.newPort(), self.port, self.node, self, idx) for idx in range(num)]
+        self._buffer = self._newBuffer(num)
 
     def getPorts(self) -> Sequence['IOPort']:
         return self.ports
 
-    def value(self) -> List[Any]:
-        out = [None for _ in range(len(self.ports))]
-        for idx, port in enumerate(self.ports):
-            out[idx] = port.value()
+    def value(self) -> Any:
+        """
+        A snapshot of the values of the var ports, a list, or a read-only numpy array if the port has a dtype.
+        Safe to keep or pass downstream, later runs don't change it
+        """
+        ctx = _CURRENT.get()
+        buffer = self._buffer if ctx is None else self._ctxBuffer(ctx)
+        if self.port.dtype is None:
+            return list(buffer)
+        out = buffer.copy()
+        out.flags.writeable = False
+        return out
+
+    def valueView(self) -> Any:
+        """
+        The values of the var ports without a copy. This is the port's buffer itself,
+        a read-only numpy view if the port has a dtype, else a list that must not be modified.
+        Upstream nodes overwrite it in place on the next run, so it must not be kept or output,
+        use value() for that
+        """
+        ctx = _CURRENT.get()
+        buffer = self._buffer if ctx is None else self._ctxBuffer(ctx)
+        if self.port.dtype is None:
+            return buffer
+        out = buffer.view()
+        out.flags.writeable = False
         return out
 
     def addVarPort(self) -> IOPort:
-        out = InPort(self.idManager.newPort(), self.port, self.node)
+        out = _VarSlotPort(self.idManager.newPort(), self.port, self.node, self, len(self.ports))
         self.ports.append(out)
+        self._resize(len(self.ports))
         return out
 
     def remVarPort(self):
@@ -193,6 +428,66 @@ class _VarInPort(InPort):
         if link is not None:
             port.remLink(link)
             link.pPort.remLink(link)
+        self._resize(len(self.ports))
+        self.idManager.freePort(port.portID)
+
+
+class _Scatter:
+    """
+    Where each value written to a var output port goes, rebuilt when its links change
+    """
+
+    def __init__(self, ports: List[OutPort]):
+        # (Value index, Link) for every link
+        self.links: List[Tuple[int, Link]] = []
+        # (Value index, Link) for links that hold their own value
+        self.plain: List[Tuple[int, Link]] = []
+        # Target var port -> (Value indices, Buffer slots)
+        self.groups: Dict[int, Tuple[_VarInPort, List[int], List[int]]] = {}
+
+        for idx, port in enumerate(ports):
+            for link in port.links:
+                self.links.append((idx, link))
+                if isinstance(link, _SlotLink):
+                    cPort: _VarSlotPort = link.cPort  # type: ignore
+                    _, src, slots = self.groups.setdefault(id(cPort.parent), (cPort.parent, [], []))
+                    src.append(idx)
+                    slots.append(cPort.slot)
+                else:
+                    self.plain.append((idx, link))
+
+        if np is not None:
+            # Index arrays for the array-backed targets
+            self.arrayGroups = [
+                (target, np.asarray(src, dtype=np.intp), np.asarray(slots, dtype=np.intp))
+                for target, src, slots in self.groups.values()
+                if target.port.dtype is not None
+            ]
+        else:
+            self.arrayGroups = []
+        self.listGroups = [
+            (target, list(zip(src, slots))) for target, src, slots in self.groups.values() if target.port.dtype is None
+        ]
+
+    def write(self, v: Any, ctx: Optional[ExecutionContext]):
+        if ctx is None:
+            for idx, link in self.plain:
+                link.value = v[idx]
+        else:
+            values = ctx.linkValues
+            for idx, link in self.links:
+                values[link.linkID] = v[idx]
+
+        if len(self.arrayGroups) > 0:
+            arr = np.asarray(v)
+            for target, src, slots in self.arrayGroups:
+                buffer = target._buffer if ctx is None else target._ctxBuffer(ctx)
+                buffer[slots] = arr[src]
+
+        for target, pairs in self.listGroups:
+            buffer = target._buffer if ctx is None else target._ctxBuffer(ctx)
+            for idx, slot in pairs:
+                buffer[slot] = v[idx]
 
 
 class _VarOutPort(OutPort):
@@ -201,26 +496,40 @@ class _VarOutPort(OutPort):
         super().__init__(-1, port, node)
         self.ports: List[OutPort] = []
         self.idManager = idManager
+        self._scatter: Optional[_Scatter] = None
+
+    def _newPort(self) -> OutPort:
+        out = OutPort(self.idManager.newPort(), self.port, self.node)
+        out._parent = self
+        return out
 
     def setVarPorts(self, num: int):
-        self.ports = [OutPort(self.idManager.newPort(), self.port, self.node) for _ in range(num)]
+        self.ports = [self._newPort() for _ in range(num)]
+        self._scatter = None
 
     def getPorts(self) -> Sequence['IOPort']:
         return self.ports
 
     def value(self, v: Any):
+        """
+        Writes one value to each var port
+        :param v: A sequence or numpy array, written to linked var inputs without a call per value
+        """
         if len(v) != len(self.ports):
             raise ExecutionError(
                 "_VarOutPort.value()",
                 f"Invalid number of values len(varports) != len(value), expected {len(self.ports)} got {len(v)}"
             )
 
-        for port, value in zip(self.ports, v):
-            port.value(value)
+        scatter = self._scatter
+        if scatter is None:
+            scatter = self._scatter = _Scatter(self.ports)
+        scatter.write(v, _CURRENT.get())
 
     def addVarPort(self) -> IOPort:
-        out = OutPort(self.idManager.newPort(), self.port, self.node)
+        out = self._newPort()
         self.ports.append(out)
+        self._scatter = None
         return out
 
     def remVarPort(self):
@@ -230,6 +539,10 @@ class _VarOutPort(OutPort):
         port = self.ports.pop()
         for link in port.links:
             link.cPort.remLink(link)
+        port._links = {}
+        port._slotLinks = {}
+        self._scatter = None
+        self.idManager.freePort(port.portID)
 
 
 def makeInputPort(idManager: IDManager, port: Port, node: 'Node') -> InPort:
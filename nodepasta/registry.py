@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import importlib
+from typing import Dict, List, Optional, Any, Type
+
+from nodepasta.node import Node
+from nodepasta.errors import NodeGraphError, NodeTypeError
+
+# Packages advertise node types under this entry point group,
+# with the NODETYPE as the name and "module:Class" as the value
+ENTRY_POINT_GROUP = 'nodepasta.nodes'
+
+_MANIFEST_VERSION = 1
+
+_VERSION = 'version'
+_GROUP = 'group'
+_STAMP = 'stamp'
+_TYPES = 'types'
+
+
+def _entryPoints(group: str) -> List[Any]:
+    try:
+        from importlib import metadata
+    except ImportError:  # pragma: no cover
+        try:
+            import importlib_metadata as metadata  # type: ignore
+        except ImportError:
+            return []
+
+    eps = metadata.entry_points()
+    if hasattr(eps, 'select'):
+        return list(eps.select(group=group))
+    # Python < 3.10 returns a dict of group -> entry points
+    return list(eps.get(group, []))  # type: ignore
+
+
+def _pathStamp() -> List[List[Any]]:
+    """
+    Cheap fingerprint of the import path, installing or removing a
+    distribution changes the mtime of the directory holding its metadata
+    """
+    out = []
+    for path in sys.path:
+        try:
+            out.append([path, os.stat(path or '.').st_mtime_ns])
+        except OSError:
+            pass
+    return out
+
+
+def _classPath(nodeType: Type[Node]) -> str:
+    return f'{nodeType.__module__}:{nodeType.__qualname__}'
+
+
+class NodeRegistry:
+    """
+    Maps NODETYPE names to the module defining them, without importing anything.
+    Classes are only imported the first time they are needed
+    """
+
+    def __init__(self):
+        # NODETYPE -> "module:Class"
+        self._paths: Dict[str, str] = {}
+        # NODETYPE -> Class, filled as types are imported
+        self._loaded: Dict[str, Type[Node]] = {}
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def __contains__(self, nodetype: object) -> bool:
+        return nodetype in self._paths
+
+    def nodeTypeNames(self) -> List[str]:
+        """
+        :return: Every known NODETYPE, sorted. Does not import anything
+        """
+        return sorted(self._paths.keys())
+
+    def isLoaded(self, nodetype: str) -> bool:
+        return nodetype in self._loaded
+
+    def add(self, nodetype: str, path: str):
+        """
+        Adds a type without importing it
+        :param nodetype: The NODETYPE of the class
+        :param path: Where to find the class, as "module:Class"
+        """
+        if ':' not in path:
+            raise NodeGraphError('NodeRegistry.add()', f'Node Type "{nodetype}", invalid path "{path}", expected "module:Class"')
+
+        x = self._paths.get(nodetype)
+        if x is not None and x != path:
+            raise NodeGraphError(
+                'NodeRegistry.add()', f'Node Type "{nodetype}" already defined in {x}, cannot redefine in {path}'
+            )
+        self._paths[nodetype] = path
+
+    def register(self, nodeType: Type[Node]):
+        """
+        Adds an already imported class
+        """
+        self.add(nodeType.NODETYPE, _classPath(nodeType))
+        self._loaded[nodeType.NODETYPE] = nodeType
+
+    def get(self, nodetype: str) -> Type[Node]:
+        """
+        Returns the class for a NODETYPE, importing its module if needed
+        """
+        try:
+            return self._loaded[nodetype]
+        except KeyError:
+            pass
+
+        try:
+            path = self._paths[nodetype]
+        except KeyError:
+            raise NodeTypeError('NodeRegistry.get()', f'Node Type "{nodetype}" not found')
+
+        modName, _, clsName = path.partition(':')
+        try:
+            out: Any = importlib.import_module(modName)
+            for attr in clsName.split('.'):
+                out = getattr(out, attr)
+        except (ImportError, AttributeError) as err:
+            raise NodeTypeError('NodeRegistry.get()', f'Node Type "{nodetype}", cannot import {path}: {err}')
+
+        if not isinstance(out, type) or not issubclass(out, Node):
+            raise NodeTypeError('NodeRegistry.get()', f'Node Type "{nodetype}", {path} is not a Node class')
+        if out.NODETYPE != nodetype:
+            raise NodeTypeError(
+                'NodeRegistry.get()', f'Node Type "{nodetype}", {path} has NODETYPE "{out.NODETYPE}"'
+            )
+
+        self._loaded[nodetype] = out
+        return out
+
+    def discover(self, group: str = ENTRY_POINT_GROUP, cacheFile: Optional[str] = None):
+        """
+        Adds every node type advertised by installed packages
+        :param group: The entry point group to read
+        :param cacheFile: If set, the result is cached in this file and reused
+            until a package is installed or removed
+        """
+        stamp = _pathStamp()
+        if cacheFile is not None:
+            try:
+                with open(cacheFile, mode='r') as f:
+                    jCache = json.load(f)
+                if (jCache.get(_VERSION) == _MANIFEST_VERSION and jCache.get(_GROUP) == group
+                        and jCache.get(_STAMP) == stamp):
+                    self._addTypes(jCache[_TYPES], 'NodeRegistry.discover()')
+                    return
+            except (OSError, ValueError, KeyError, AttributeError):
+                # Missing or bad cache, rebuild it
+                pass
+
+        types = {ep.name: ep.value for ep in _entryPoints(group)}
+        self._addTypes(types, 'NodeRegistry.discover()')
+
+        if cacheFile is not None:
+            try:
+                with open(cacheFile, mode='w') as f:
+                    # Stamped after creating the file, in case it is on the import path itself
+                    stamp = _pathStamp()
+                    json.dump({_VERSION: _MANIFEST_VERSION, _GROUP: group, _STAMP: stamp, _TYPES: types}, f)
+            except OSError:
+                # Caching is only an optimization
+                pass
+
+    def loadManifest(self, filename: str):
+        """
+        Adds the types listed in a manifest written by saveManifest()
+        """
+        try:
+            with open(filename, mode='r') as f:
+                jManifest = json.load(f)
+        except json.JSONDecodeError as err:
+            raise NodeGraphError('NodeRegistry.loadManifest()', f'Cannot load {filename}, JSON Error: {err}')
+
+        try:
+            types = jManifest[_TYPES]
+        except (KeyError, TypeError):
+            raise NodeGraphError('NodeRegistry.loadManifest()', f'Cannot load {filename}, no types were defined')
+
+        self._addTypes(types, 'NodeRegistry.loadManifest()')
+
+    def saveManifest(self, filename: str):
+        """
+        Writes every known type to a manifest, nothing is imported
+        """
+        with open(filename, mode='w') as f:
+            json.dump({_VERSION: _MANIFEST_VERSION, _TYPES: self._paths}, f, indent=4)
+
+    def _addTypes(self, types: Dict[str, str], loc: str):
+        if not isinstance(types, dict):
+            raise NodeGraphError(loc, 'Invalid type list')
+        for nodetype, path in types.items():
+            self.add(nodetype, path)
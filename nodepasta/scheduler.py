@@ -0,0 +1,209 @@
+import time
+import threading
+from typing import List, Optional
+
+from nodepasta.nodegraph import NodeGraph
+from nodepasta.context import ExecutionContext
+from nodepasta.errors import NodeGraphError
+
+# Datamap keys set by the scheduler before every tick
+TICK_KEY = 'tick'
+# Seconds since the scheduler's first tick. Scheduled rather than measured in run(),
+# measured for ticks run by tick()
+TICK_TIME_KEY = 'tickTime'
+# Seconds between the TICK_TIME_KEY of the previous tick and this one, 0 on the first tick
+TICK_DELTA_KEY = 'tickDelta'
+
+# Remaining time below which the scheduler spins instead of sleeping
+DEF_SPIN = 0.002
+
+
+class TickStats:
+    """
+    Snapshot of a TickScheduler's metrics
+    """
+
+    def __init__(self, latencies: Optional[List[float]] = None):
+        self.ticks = 0
+        # Ticks whose execution took longer than the period
+        self.overruns = 0
+        # Ticks that finished after their deadline
+        self.deadlineMisses = 0
+        # Ticks skipped to get back on schedule after an overrun
+        self.skipped = 0
+        # Largest difference between when a tick was scheduled and when it started
+        self.maxJitter = 0.0
+        # Execution times of the most recent ticks, sorted
+        self.latencies: List[float] = [] if latencies is None else sorted(latencies)
+
+    def percentile(self, p: float) -> float:
+        """
+        :param p: In the range [0, 100]
+        :return: The execution time of the tick at this percentile of the recent history
+        """
+        if len(self.latencies) == 0:
+            return 0.0
+        idx = min(len(self.latencies) - 1, max(0, int(round(p / 100 * (len(self.latencies) - 1)))))
+        return self.latencies[idx]
+
+    @property
+    def p50(self) -> float:
+        return self.percentile(50)
+
+    @property
+    def p99(self) -> float:
+        return self.percentile(99)
+
+    @property
+    def maxLatency(self) -> float:
+        return self.latencies[-1] if len(self.latencies) > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f'TickStats(ticks: {self.ticks}, overruns: {self.overruns}, deadlineMisses: {self.deadlineMisses}, '
+            f'skipped: {self.skipped}, p50: {self.p50:.6f}s, p99: {self.p99:.6f}s, max: {self.maxLatency:.6f}s, '
+            f'maxJitter: {self.maxJitter:.6f}s)'
+        )
+
+
+class TickScheduler:
+    """
+    Executes a graph at a fixed rate. Ticks are scheduled against absolute times so
+    the rate doesn't drift, sleeping until shortly before each tick and spinning the rest.
+
+    Every tick runs in the same ExecutionContext, so the plan is only rebuilt when the
+    graph is edited, no port sweep is needed, and node state (Node.state) and the
+    context's datamap carry over from one tick to the next
+    """
+
+    def __init__(
+        self,
+        graph: NodeGraph,
+        rate: float,
+        deadline: Optional[float] = None,
+        ctx: Optional[ExecutionContext] = None,
+        spin: float = DEF_SPIN,
+        catchUp: bool = False,
+        history: int = 4096
+    ):
+        """
+        :param graph: The graph, setupNodes() must already have been called
+        :param rate: Ticks per second
+        :param deadline: Seconds after its scheduled start a tick must finish by, defaults to the period
+        :param ctx: The context the ticks run in, defaults to a new one
+        :param spin: Seconds before a tick to stop sleeping and spin, trades CPU for lower jitter
+        :param catchUp: After an overrun, run the missed ticks back to back instead of skipping them
+        :param history: Number of recent tick latencies kept for the percentiles
+        """
+        if rate <= 0:
+            raise NodeGraphError("TickScheduler.init()", f"Invalid rate: {rate}")
+        if history < 1:
+            raise NodeGraphError("TickScheduler.init()", f"Invalid history size: {history}")
+
+        self.graph = graph
+        self.period = 1.0 / rate
+        self.deadline = self.period if deadline is None else deadline
+        self.ctx = ExecutionContext() if ctx is None else ctx
+        self.spin = spin
+        self.catchUp = catchUp
+
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = TickStats()
+        # Ring buffer of recent latencies
+        self._latencies: List[float] = [0.0] * history
+        self._numLatencies = 0
+        self._tick = 0
+        # perf_counter() time of the first tick, TICK_TIME_KEY counts from it
+        self._start: Optional[float] = None
+        # TICK_TIME_KEY of the last tick
+        self._lastTime: Optional[float] = None
+
+    def stats(self) -> TickStats:
+        with self._lock:
+            history = len(self._latencies)
+            n = min(self._numLatencies, history)
+            out = TickStats(self._latencies[:n])
+            for key, value in self._stats.__dict__.items():
+                if key != 'latencies':
+                    setattr(out, key, value)
+            return out
+
+    def stop(self):
+        """
+        Stops run() after the current tick, can be called from any thread
+        """
+        self._stop.set()
+
+    def tick(self):
+        """
+        Runs a single tick now
+        """
+        now = time.perf_counter()
+        if self._start is None:
+            self._start = now
+        self._runTick(now, now - self._start)
+
+    def _runTick(self, scheduled: float, elapsed: float):
+        datamap = self.ctx.datamap
+        datamap[TICK_KEY] = self._tick
+        datamap[TICK_TIME_KEY] = elapsed
+        datamap[TICK_DELTA_KEY] = 0.0 if self._lastTime is None else elapsed - self._lastTime
+        self._lastTime = elapsed
+        self._tick += 1
+
+        start = time.perf_counter()
+        self.graph.execute(self.ctx)
+        end = time.perf_counter()
+
+        latency = end - start
+        with self._lock:
+            stats = self._stats
+            stats.ticks += 1
+            if latency > self.period:
+                stats.overruns += 1
+            if end - scheduled > self.deadline:
+                stats.deadlineMisses += 1
+            jitter = start - scheduled
+            if jitter > stats.maxJitter:
+                stats.maxJitter = jitter
+            self._latencies[self._numLatencies % len(self._latencies)] = latency
+            self._numLatencies += 1
+
+    def run(self, ticks: Optional[int] = None):
+        """
+        Runs ticks until stop() is called or the number of ticks have run
+        :param ticks: Number of ticks to run, None runs until stopped
+        """
+        self._stop.clear()
+        period = self.period
+        spin = self.spin
+        clock = time.perf_counter
+
+        origin = clock()
+        if self._start is None:
+            self._start = origin
+        # Carries on from earlier runs and manual ticks
+        offset = origin - self._start
+        # Index of the next tick since origin
+        idx = 0
+        done = 0
+        while not self._stop.is_set() and (ticks is None or done < ticks):
+            scheduled = origin + idx * period
+            remaining = scheduled - clock()
+            if remaining > spin:
+                time.sleep(remaining - spin)
+            while clock() < scheduled:
+                pass
+
+            self._runTick(scheduled, offset + idx * period)
+            done += 1
+            idx += 1
+
+            if not self.catchUp:
+                # Skip the ticks that are already late instead of bursting through them
+                behind = int((clock() - origin) / period) - idx
+                if behind > 0:
+                    idx += behind
+                    with self._lock:
+                        self._stats.skipped += behind
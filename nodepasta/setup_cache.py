@@ -0,0 +1,191 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+from nodepasta.argtypes import argsKey
+from nodepasta.errors import NodeGraphError
+
+if TYPE_CHECKING:
+    from nodepasta.node import Node
+
+
+class SetupCacheStats:
+    """
+    Snapshot of a SetupCache's metrics
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        # Entries dropped to stay under the size limit
+        self.evicted = 0
+        # Entries dropped after going unused for too long
+        self.expired = 0
+
+    def __str__(self) -> str:
+        return (
+            f'SetupCacheStats(size: {self.size}, hits: {self.hits}, misses: {self.misses}, '
+            f'evicted: {self.evicted}, expired: {self.expired})'
+        )
+
+
+def setupKey(node: 'Node', name: str, args: Optional[Sequence[str]] = None) -> Tuple[str, str, str]:
+    """
+    Returns the key a node's setup product is cached under
+    :param name: Tells apart several products of the same node
+    :param args: The args the product depends on, defaults to all of them
+    """
+    values = node.args
+    if args is not None:
+        try:
+            values = {x: values[x] for x in args}
+        except KeyError as err:
+            raise NodeGraphError('setupKey()', f'{node}: Invalid arg name {err}')
+    try:
+        return node.NODETYPE, name, argsKey(values.values())
+    except NodeGraphError as err:
+        raise NodeGraphError('setupKey()', f'{node}: {err.msg}') from None
+
+
+class SetupCache:
+    """
+    Keeps expensive setup products, e.g. loaded models or opened files, across
+    graph reloads. Entries are keyed by node type and arg values, and are
+    dropped least recently used first once there are too many or they go unused.
+
+    Dropping an entry only drops the cache's own reference. Nodes that got the value
+    from setupCached() keep using it, so values must not be closed when they are dropped.
+    Let them be closed when the last user lets go of them, e.g. in __del__ or a weakref.finalize()
+    """
+
+    def __init__(
+        self,
+        maxSize: int = 64,
+        maxIdle: Optional[float] = None,
+        onEvict: Optional[Callable[[Any], None]] = None
+    ):
+        """
+        :param maxSize: Number of entries kept
+        :param maxIdle: Seconds an entry may go unused before it is dropped
+        :param onEvict: Called with each dropped value, e.g. for logging.
+                        The value may still be in use by nodes, don't close it here
+        """
+        if maxSize < 1:
+            raise NodeGraphError("SetupCache.init()", f"Invalid cache size: {maxSize}")
+
+        self._maxSize = maxSize
+        self._maxIdle = maxIdle
+        self._onEvict = onEvict
+
+        self._lock = threading.Lock()
+        # Key -> (Value, Last used), least recently used first
+        self._entries: 'OrderedDict[Hashable, Tuple[Any, float]]' = OrderedDict()
+        # Key -> Set once the value being made by another thread is stored
+        self._pending: Dict[Hashable, threading.Event] = {}
+        self._stats = SetupCacheStats()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def stats(self) -> SetupCacheStats:
+        with self._lock:
+            self._stats.size = len(self._entries)
+            out = SetupCacheStats()
+            out.__dict__.update(self._stats.__dict__)
+            return out
+
+    def get(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """
+        Returns the cached value, calling factory to make it if there is none.
+        Concurrent calls for the same key only call factory once
+        """
+        # Values are disposed of outside the lock
+        dropped: List[Any] = []
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._expire(now, dropped)
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries[key] = (entry[0], now)
+                    self._entries.move_to_end(key)
+                    self._stats.hits += 1
+                    break
+
+                event = self._pending.get(key)
+                if event is None:
+                    event = self._pending[key] = threading.Event()
+                    self._stats.misses += 1
+                    break
+            # Another thread is making it
+            event.wait()
+
+        if entry is not None:
+            self._dispose(dropped)
+            return entry[0]
+
+        try:
+            value = factory()
+        except BaseException:
+            with self._lock:
+                del self._pending[key]
+            event.set()
+            self._dispose(dropped)
+            raise
+
+        with self._lock:
+            del self._pending[key]
+            self._entries[key] = (value, time.monotonic())
+            while len(self._entries) > self._maxSize:
+                _, (old, _) = self._entries.popitem(last=False)
+                dropped.append(old)
+                self._stats.evicted += 1
+        event.set()
+        self._dispose(dropped)
+        return value
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._dispose([entry[0]])
+
+    def clear(self):
+        with self._lock:
+            dropped = [x for x, _ in self._entries.values()]
+            self._entries.clear()
+        self._dispose(dropped)
+
+    def purge(self):
+        """
+        Drops the entries that have gone unused for longer than maxIdle
+        """
+        dropped: List[Any] = []
+        with self._lock:
+            self._expire(time.monotonic(), dropped)
+        self._dispose(dropped)
+
+    def _expire(self, now: float, dropped: List[Any]):
+        if self._maxIdle is None:
+            return
+        cutoff = now - self._maxIdle
+        entries = self._entries
+        # Least recently used first, stops at the first entry still in use
+        while len(entries) > 0:
+            key, (value, lastUsed) = next(iter(entries.items()))
+            if lastUsed >= cutoff:
+                break
+            del entries[key]
+            dropped.append(value)
+            self._stats.expired += 1
+
+    def _dispose(self, values: List[Any]):
+        if self._onEvict is None:
+            return
+        for x in values:
+            self._onEvict(x)
@@ -0,0 +1,268 @@
+import os
+import time
+import shutil
+import tempfile
+import itertools
+import threading
+import weakref
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Optional, Tuple
+
+from nodepasta.blobstore import LazyBlob, _NPY
+from nodepasta.errors import NodeGraphError
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+# Arrays smaller than this are never spilled
+DEF_MIN_SPILL_SIZE = 1024 * 1024
+
+
+class SpillStats:
+    """
+    Counts of a SpillManager's work, for a single run or in total
+    """
+
+    def __init__(self):
+        # Values written to disk, including evictions
+        self.spilled = 0
+        self.spilledBytes = 0
+        # Values written to disk to get back under the budget
+        self.evicted = 0
+        # Spilled values mapped back in by a consumer
+        self.reloaded = 0
+        self.reloadedBytes = 0
+        # Largest number of bytes held in memory by tracked values
+        self.peakResident = 0
+        # Seconds spent writing and mapping files
+        self.spillTime = 0.0
+        self.reloadTime = 0.0
+
+    def __str__(self) -> str:
+        return (
+            f'SpillStats(spilled: {self.spilled} ({self.spilledBytes} B), evicted: {self.evicted}, '
+            f'reloaded: {self.reloaded} ({self.reloadedBytes} B), peakResident: {self.peakResident} B, '
+            f'spillTime: {self.spillTime:.6f}s, reloadTime: {self.reloadTime:.6f}s)'
+        )
+
+
+def _removeFile(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        # e.g. still mapped on Windows, the temp directory is removed later
+        pass
+
+
+class SpilledValue:
+    """
+    Holds a large link value that may be moved to disk.
+    InPort.value() swaps it for the value, reading a spilled value back
+    maps the file read-only instead of loading it into memory
+    """
+
+    def __init__(self, manager: 'SpillManager', value: Any):
+        self._manager = manager
+        # The array in memory, or the mapped file once reloaded. None while only on disk
+        self._value: Any = value
+        self._blob: Optional[LazyBlob] = None
+        self._lock = threading.Lock()
+        self.nbytes: int = value.nbytes
+
+    @property
+    def spilled(self) -> bool:
+        return self._blob is not None
+
+    def get(self) -> Any:
+        v = self._value
+        if v is not None:
+            return v
+
+        with self._lock:
+            if self._value is None:
+                start = time.perf_counter()
+                self._value = self._blob.load()  # type: ignore
+                self._manager._onReload(self, time.perf_counter() - start)
+            return self._value
+
+    def _spill(self, path: str) -> bool:
+        """
+        Writes the value to path and drops it from memory
+        :return: False if it was already on disk
+        """
+        with self._lock:
+            if self._blob is not None:
+                return False
+            with open(path, mode='wb') as f:
+                np.save(f, self._value, allow_pickle=False)
+            self._blob = LazyBlob(path, _NPY)
+            self._value = None
+        # The file lives as long as something can still read it
+        weakref.finalize(self, _removeFile, path)
+        return True
+
+    def __str__(self) -> str:
+        return f'SpilledValue({self.nbytes} B, {"on disk" if self.spilled else "in memory"})'
+
+
+class _SpillRun:
+    """
+    The manager and stats of the run writing values, see NodeGraph.useSpillManager()
+    """
+
+    def __init__(self, manager: 'SpillManager'):
+        self.manager = manager
+        self.stats = SpillStats()
+
+    def wrap(self, v: Any) -> Any:
+        return self.manager._wrap(v, self.stats)
+
+
+# The spill manager of the execution running in the current thread, if any
+_SPILL: ContextVar[Optional[_SpillRun]] = ContextVar('nodepasta_spill', default=None)
+
+
+class SpillManager:
+    """
+    Keeps large numpy link values from piling up in memory.
+    Arrays at least threshold bytes large are written to a temporary .npy file as soon as
+    they are output. Other arrays stay in memory until the tracked arrays add up to more
+    than the budget, then the oldest ones are written out. Consumers read spilled
+    values back through a read-only memory map.
+
+    Only plain numpy arrays written to non-variable output ports are managed,
+    values going into variable input ports stay in memory
+    """
+
+    def __init__(
+        self,
+        budget: Optional[int] = None,
+        threshold: Optional[int] = None,
+        minSize: int = DEF_MIN_SPILL_SIZE,
+        directory: Optional[str] = None
+    ):
+        """
+        :param budget: Bytes of tracked arrays kept in memory, None for no limit
+        :param threshold: Size in bytes from which arrays are always spilled, None to only spill for the budget
+        :param minSize: Size in bytes below which arrays are ignored
+        :param directory: Where to write the files, defaults to a new temporary directory
+        """
+        if np is None:
+            raise NodeGraphError("SpillManager.init()", "Cannot spill values, numpy is not installed")
+        if budget is not None and budget < 0:
+            raise NodeGraphError("SpillManager.init()", f"Invalid budget: {budget}")
+
+        self.budget = budget
+        self.threshold = threshold
+        self.minSize = minSize
+
+        self._lock = threading.Lock()
+        self._directory = directory
+        self._ownsDirectory = directory is None
+        self._cleanup: Optional[weakref.finalize] = None
+        self._fileCounter = itertools.count()
+        self._keyCounter = itertools.count()
+        # Key -> (Value, Size), oldest first
+        self._resident: 'OrderedDict[int, Tuple[weakref.ref, int]]' = OrderedDict()
+        self._residentBytes = 0
+
+        self.totals = SpillStats()
+        # Stats of the last finished run
+        self.lastRun = SpillStats()
+
+    @property
+    def residentBytes(self) -> int:
+        return self._residentBytes
+
+    def newRun(self) -> _SpillRun:
+        return _SpillRun(self)
+
+    def endRun(self, run: _SpillRun):
+        with self._lock:
+            self.lastRun = run.stats
+
+    def close(self):
+        """
+        Removes the temporary directory, spilled values can't be read after this
+        """
+        with self._lock:
+            cleanup = self._cleanup
+            self._cleanup = None
+        if cleanup is not None:
+            cleanup()
+
+    def _dir(self) -> str:
+        with self._lock:
+            if self._directory is None:
+                self._directory = tempfile.mkdtemp(prefix='nodepasta-spill-')
+            elif not os.path.isdir(self._directory):
+                os.makedirs(self._directory, exist_ok=True)
+            if self._ownsDirectory and self._cleanup is None:
+                self._cleanup = weakref.finalize(self, shutil.rmtree, self._directory, True)
+            return self._directory
+
+    def _wrap(self, v: Any, stats: SpillStats) -> Any:
+        # Memory maps are already backed by a file
+        if not isinstance(v, np.ndarray) or isinstance(v, np.memmap) or v.nbytes < self.minSize:
+            return v
+
+        if self.threshold is not None and v.nbytes >= self.threshold:
+            out = SpilledValue(self, v)
+            self._spill(out, stats, False)
+            return out
+
+        if self.budget is None:
+            return v
+
+        out = SpilledValue(self, v)
+        key = next(self._keyCounter)
+        victims = []
+        with self._lock:
+            self._resident[key] = (weakref.ref(out), out.nbytes)
+            self._residentBytes += out.nbytes
+            while self._residentBytes > self.budget and len(self._resident) > 0:
+                _, (ref, nbytes) = self._resident.popitem(last=False)
+                self._residentBytes -= nbytes
+                victim = ref()
+                if victim is not None:
+                    victims.append(victim)
+            resident = self._residentBytes
+            if resident > stats.peakResident:
+                stats.peakResident = resident
+            if resident > self.totals.peakResident:
+                self.totals.peakResident = resident
+        weakref.finalize(out, self._forget, key)
+
+        for victim in victims:
+            self._spill(victim, stats, True)
+        return out
+
+    def _forget(self, key: int):
+        with self._lock:
+            entry = self._resident.pop(key, None)
+            if entry is not None:
+                self._residentBytes -= entry[1]
+
+    def _spill(self, value: SpilledValue, stats: SpillStats, evicted: bool):
+        path = os.path.join(self._dir(), f'{next(self._fileCounter)}.npy')
+        start = time.perf_counter()
+        if not value._spill(path):
+            return
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            for x in (stats, self.totals):
+                x.spilled += 1
+                x.spilledBytes += value.nbytes
+                x.evicted += int(evicted)
+                x.spillTime += elapsed
+
+    def _onReload(self, value: SpilledValue, elapsed: float):
+        run = _SPILL.get()
+        with self._lock:
+            for x in (self.totals, ) if run is None else (run.stats, self.totals):
+                x.reloaded += 1
+                x.reloadedBytes += value.nbytes
+                x.reloadTime += elapsed
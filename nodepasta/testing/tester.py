@@ -55,7 +55,7 @@ class Tester:
             # with a single value
             if not port.port.variable:
                 newPort = OutPort(self._idManager.newPort(), port.port.copy(), Node())
-                newLink = Link(self._idManager.newLink(), newPort, port)
+                newLink = port.newLink(self._idManager.newLink(), newPort)
                 port.setLink(newLink)
                 newLink.value = value
             # else attempt to iterate over the value
@@ -64,7 +64,7 @@ class Tester:
                 port.setVarPorts(len(value))
                 for x, varPort in zip(value, port.getPorts()):
                     newPort = OutPort(self._idManager.newPort(), port.port.copy(), Node())
-                    newLink = Link(self._idManager.newLink(), newPort, varPort)
+                    newLink = varPort.newLink(self._idManager.newLink(), newPort)
                     varPort.setLink(newLink)
                     newLink.value = x
 
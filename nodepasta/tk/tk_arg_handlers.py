@@ -11,6 +11,12 @@ class NodeArgValue(abc.ABC):
     def get(self) -> Any:
         raise NotImplementedError
 
+    def reload(self):
+        """
+        Updates the widget from the arg value
+        """
+        pass
+
 class TKArgHandler(abc.ABC):
     def __init__(self):
         pass
@@ -1,7 +1,7 @@
 import tkinter as tk
 from enum import IntEnum
 
-from typing import Optional, List, Dict, Iterator, Type, Tuple, Any, Sequence
+from typing import Optional, List, Dict, Iterator, Tuple, Any, Sequence
 
 from nodepasta.node import Node
 from nodepasta.ports import IOPort, Link, _VarInPort, _VarOutPort, InPort, OutPort
@@ -259,14 +259,30 @@ class TKNodeGraph(tk.Frame):
 
     def reloadGraph(self):
         """
-        Reloads the graph visuals and updates nodes
+        Reloads the graph visuals and updates nodes.
+        Widgets are only rebuilt for nodes and links that changed
         :return: None
         """
+        graphNodes = {node.nodeID: node for node in self.nodeGraph}
+        for nodeID, nodeRef in list(self._idToNode.items()):
+            if graphNodes.get(nodeID) is not nodeRef.node:
+                self._dropNodeRef(nodeRef)
+
+        graphLinks = {link.linkID: link for node in self.nodeGraph for link in node}
+        for linkID, linkRef in list(self._idToLink.items()):
+            if graphLinks.get(linkID) is not linkRef.link:
+                self._dropLinkRef(linkRef)
+
         for node in self.nodeGraph:
             try:
                 nodeRef = self._idToNode[node.nodeID]
-                # Make sure that the ref gets updated if reloaded
-                nodeRef.node = node
+                for name, argVal in nodeRef.args.items():
+                    try:
+                        if argVal.get() == node.args[name].value:
+                            continue
+                    except tk.TclError:
+                        pass
+                    argVal.reload()
                 self._updateNode(nodeRef)
             except KeyError:
                 self._makeNewNode(node)
@@ -287,11 +303,24 @@ class TKNodeGraph(tk.Frame):
         self._canvToNodeRef = {}
         self._canvToLinkRef = {}
         self._canvToPortRef = {}
+        self._idToPortRef = {}
         self._lowestNode = None
-        self._nodeCanvas.delete('all')
+        self._deleteItems('all')
 
     # endregion
 
+    def _deleteItems(self, tag):
+        """
+        Deletes canvas items, destroying any widgets embedded in them.
+        Deleting a window item on its own leaves the widget alive
+        """
+        for item in self._nodeCanvas.find_withtag(tag):
+            if self._nodeCanvas.type(item) == 'window':
+                name = self._nodeCanvas.itemcget(item, 'window')
+                if name:
+                    self.nametowidget(name).destroy()
+        self._nodeCanvas.delete(tag)
+
     def _current(self) -> Optional[int]:
         try:
             return self._nodeCanvas.find_withtag(tk.CURRENT)[0]
@@ -445,8 +474,7 @@ class TKNodeGraph(tk.Frame):
                     link, removed = self.nodeGraph.makeLink(parentRef.port, childRef.port)
 
                     if removed is not None:
-                        linkRef = self._idToLink[removed.linkID]
-                        self._nodeCanvas.delete(linkRef.canvasID)
+                        self._dropLinkRef(self._idToLink[removed.linkID])
 
                     self._makeNewLink(link, parentRef, childRef)
                 except NodeGraphError as err:
@@ -603,7 +631,7 @@ class TKNodeGraph(tk.Frame):
                                  "DEV: Cannot add varport to non variable port")
 
         nextNum = len(portref.port.getPorts())
-        varPort = portref.port.addVarPort()
+        varPort = self.nodeGraph.addVarPort(portref.port)
         varPortRef = _VarPortRef(nextNum, portref, varPort)
 
         portref.nodeRef.numPorts += 1
@@ -616,10 +644,10 @@ class TKNodeGraph(tk.Frame):
             raise NodeGraphError("TKNodeGraph._remVarPort()",
                                  "DEV: Cannot rem varport on non variable port")
         if len(portref.port.getPorts()) > 1:
-            for link in portref.varPorts[-1].links:
+            for link in list(portref.varPorts[-1].links):
                 if link is not None:
                     self._removeLink(link)
-            portref.port.remVarPort()
+            self.nodeGraph.remVarPort(portref.port)
             portref.nodeRef.numPorts -= 1
             varport = portref.varPorts.pop()
             self._nodeCanvas.delete(varport.textCanvasID, varport.canvasID)
@@ -754,20 +782,50 @@ class TKNodeGraph(tk.Frame):
 
     def _removeLink(self, linkRef: _LinkRef):
         self.nodeGraph.unlink(linkRef.link)
-        linkRef.oPort.links.remove(linkRef)
-        linkRef.iPort.links[0] = None
+        self._dropLinkRef(linkRef)
+
+    def _dropLinkRef(self, linkRef: _LinkRef):
+        """
+        Removes a link's visuals, the graph is not modified
+        """
+        try:
+            linkRef.oPort.links.remove(linkRef)
+        except ValueError:
+            pass
+        if len(linkRef.iPort.links) > 0 and linkRef.iPort.links[0] is linkRef:
+            linkRef.iPort.links[0] = None
 
         self._nodeCanvas.delete(linkRef.canvasID)
-        del self._canvToLinkRef[linkRef.canvasID]
+        self._canvToLinkRef.pop(linkRef.canvasID, None)
+        self._idToLink.pop(linkRef.link.linkID, None)
 
-    def _addNewNode(self, nodeType: Type[Node], pos: Vec):
-        self._nodeCanvas.delete(DIALOG_TAG)
-        node = self.nodeGraph.addNode(nodeType)
+    def _dropNodeRef(self, nodeRef: _NodeRef):
+        """
+        Removes a node's visuals and links, the graph is not modified
+        """
+        for portRef in nodeRef.iPorts + nodeRef.oPorts:
+            for varport in portRef.varPorts:
+                for linkRef in list(varport.links):
+                    if linkRef is not None:
+                        self._dropLinkRef(linkRef)
+                self._canvToPortRef.pop(varport.canvasID, None)
+                self._idToPortRef.pop(varport.port.portID, None)
+
+        self._canvToNodeRef.pop(nodeRef.blockCanvasID, None)
+        self._idToNode.pop(nodeRef.node.nodeID, None)
+        self._deleteItems(nodeRef.nodeTag)
+        if self._lowestNode == nodeRef.argCanvasID:
+            self._lowestNode = None
+
+    def _addNewNode(self, nodetype: str, pos: Vec):
+        self._deleteItems(DIALOG_TAG)
+        # Types from a registry are only imported once picked
+        node = self.nodeGraph.addNode(self.nodeGraph.getNodeType(nodetype))
         node.pos = pos
         self._makeNewNode(node)
 
     def _addNewNodeDialog(self, e):
-        self._nodeCanvas.delete(DIALOG_TAG)
+        self._deleteItems(DIALOG_TAG)
         pos = Vec(self._nodeCanvas.canvasx(e.x), self._nodeCanvas.canvasy(e.y))
         # TODO bind click outside of frame to cancel
 
@@ -781,10 +839,10 @@ class TKNodeGraph(tk.Frame):
         dialogCanvas.configure(yscrollcommand=sb.set, yscrollincrement=0.5)
 
         dialogFrame = tk.Frame(dialogCanvas)
-        for idx, nodeType in enumerate(self.nodeGraph.nodeTypes()):
+        for idx, nodetype in enumerate(self.nodeGraph.nodeTypeNames()):
             btn = tk.Button(dialogFrame,
-                            text=nodeType.__name__,
-                            command=lambda x=nodeType: self._addNewNode(x, pos)
+                            text=nodetype,
+                            command=lambda x=nodetype: self._addNewNode(x, pos)
                             )
             btn.grid(row=idx + 1, column=0, sticky='nesw')
             btn.bind('<MouseWheel>', lambda event: dialogCanvas.yview_scroll(-event.delta, 'units'))
@@ -798,7 +856,7 @@ class TKNodeGraph(tk.Frame):
                                        window=mainDialogFrame, tags=[DIALOG_TAG])
 
     def _cancel(self, _):
-        self._nodeCanvas.delete(DIALOG_TAG)
+        self._deleteItems(DIALOG_TAG)
 
     def _deleteNode(self, _):
         cur = self._current()
@@ -808,16 +866,5 @@ class TKNodeGraph(tk.Frame):
             except KeyError:
                 return
 
-            for port in node.iPorts:
-                for varport in port.varPorts:
-                    for link in varport.links:
-                        if link is not None:
-                            self._removeLink(link)
-            for port in node.oPorts:
-                for varport in port.varPorts:
-                    for link in varport.links:
-                        if link is not None:
-                            self._removeLink(link)
-
             self.nodeGraph.removeNode(node.node)
-            self._nodeCanvas.delete(node.nodeTag)
+            self._dropNodeRef(node)
@@ -1,3 +1,9 @@
+import contextlib
+import gc
+import threading
+from typing import Iterator
+
+
 
 
 class Vec:
@@ -16,4 +22,34 @@ class Vec:
         self.y += y
 
     def __str__(self) -> str:
-        return f'<{self.x}, {self.y}>'
\ No newline at end of file
+        return f'<{self.x}, {self.y}>'
+
+
+# Number of open pausedGC() blocks, across all threads
+_gcPauses = 0
+# Whether the collector was enabled when the first block opened
+_gcWasEnabled = False
+_gcLock = threading.Lock()
+
+
+@contextlib.contextmanager
+def pausedGC() -> Iterator[None]:
+    """
+    Pauses the cyclic garbage collector while building many objects at once.
+    Each collection would otherwise rescan the whole graph being built.
+    Blocks may nest or overlap across threads, the collector
+    is restored once the last one exits
+    """
+    global _gcPauses, _gcWasEnabled
+    with _gcLock:
+        if _gcPauses == 0:
+            _gcWasEnabled = gc.isenabled()
+            gc.disable()
+        _gcPauses += 1
+    try:
+        yield
+    finally:
+        with _gcLock:
+            _gcPauses -= 1
+            if _gcPauses == 0 and _gcWasEnabled:
+                gc.enable()
@@ -0,0 +1,225 @@
+import time
+import threading
+import contextvars
+from typing import Any, Callable, List, Optional
+
+from nodepasta.node import Node
+from nodepasta.plan import ExecutionPlan
+from nodepasta.context import CancelToken, _TOKEN
+
+_LOC = 'Nodegraph.execute()'
+
+
+# Idle workers kept for later runs, more are started when runs overlap
+_MAX_IDLE = 4
+
+
+def _stepNode(step: Any) -> Node:
+    return step if isinstance(step, Node) else step.node
+
+
+class _Worker:
+    """
+    A daemon thread that runs guarded plans, kept between runs
+    so a graph with Node.TIMEOUTs doesn't start a thread for every execute()
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._job: Optional[Callable[[], None]] = None
+        threading.Thread(target=self._loop, name='nodepasta-execute', daemon=True).start()
+
+    def submit(self, job: Callable[[], None]):
+        with self._cond:
+            self._job = job
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self._job is None:
+                    self._cond.wait()
+                job = self._job
+                self._job = None
+            job()
+            # Only once the job returns, an abandoned run keeps its worker
+            if not _release(self):
+                return
+
+
+_poolLock = threading.Lock()
+_idle: List[_Worker] = []
+
+
+def _acquire() -> _Worker:
+    with _poolLock:
+        if len(_idle) > 0:
+            return _idle.pop()
+    return _Worker()
+
+
+def _release(worker: _Worker) -> bool:
+    """
+    :return: False if there are enough idle workers, the worker's thread should exit
+    """
+    with _poolLock:
+        if len(_idle) >= _MAX_IDLE:
+            return False
+        _idle.append(worker)
+        return True
+
+
+class _Watchdog:
+    """
+    Runs a plan on a worker thread while the calling thread enforces the deadline,
+    the node timeouts and the cancel token.
+
+    Python threads cannot be stopped from outside, so on expiry the token is cancelled
+    and the caller returns at once. The worker finishes the node it is in, in the
+    background, and then stops without running any more nodes. Until then the
+    graph, or the ExecutionContext, refuses to run again, see NodeGraph.waitIdle()
+    """
+
+    def __init__(
+        self,
+        run: Callable[[Any], None],
+        token: CancelToken,
+        timeout: Optional[float] = None,
+        nodeTimeout: Optional[float] = None
+    ):
+        """
+        :param run: Runs a single step
+        :param token: Cancelled on expiry, checked before every step
+        :param timeout: Seconds the whole run may take
+        :param nodeTimeout: Seconds each node may take, unless its type sets Node.TIMEOUT
+        """
+        self._run = run
+        self.token = token
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.nodeTimeout = nodeTimeout
+
+        self._cond = threading.Condition()
+        # The step being run, when it started and its timeout
+        self._step: Any = None
+        self._stepStart = 0.0
+        self._stepTimeout: Optional[float] = None
+        self._done = False
+        self._error: Optional[BaseException] = None
+
+    def runStep(self, step: Any):
+        node = _stepNode(step)
+        token = self.token
+        timeout = node.descriptor().timeout
+        if timeout is None:
+            timeout = self.nodeTimeout
+        with self._cond:
+            # Checked under the lock, so once the token is cancelled no node starts
+            # without running being set
+            if token.cancelled:
+                raise token.error(_LOC, node, running=False)
+            self._step = step
+            self._stepStart = time.monotonic()
+            self._stepTimeout = timeout
+            if timeout is not None:
+                # The caller's wait has to shorten to this node's timeout
+                self._cond.notify_all()
+
+        self._run(step)
+
+        with self._cond:
+            self._step = None
+            # Wakes join()
+            self._cond.notify_all()
+
+    def run(self, plan: ExecutionPlan):
+        """
+        Runs the plan, raising ExecutionTimeoutError or ExecutionCancelledError
+        as soon as time runs out or the token is cancelled
+        """
+        # The worker sees the caller's ExecutionContext and the token
+        reset = _TOKEN.set(self.token)
+        try:
+            ctx = contextvars.copy_context()
+        finally:
+            _TOKEN.reset(reset)
+
+        self.token.addCallback(self._wake)
+        try:
+            _acquire().submit(lambda: ctx.run(self._work, plan))
+            self._wait()
+        finally:
+            self.token.removeCallback(self._wake)
+
+        if self._error is not None:
+            raise self._error
+
+    @property
+    def running(self) -> bool:
+        """
+        Whether the worker is still in a node, e.g. one stuck after the run expired.
+        Once the token is cancelled it starts no further nodes
+        """
+        with self._cond:
+            return not self._done and self._step is not None
+
+    @property
+    def node(self) -> Optional[Node]:
+        """
+        The node being run
+        """
+        step = self._step
+        return None if step is None else _stepNode(step)
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits for the worker to leave the node it is in
+        :return: Whether it has
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._done or self._step is None, timeout)
+
+    def _work(self, plan: ExecutionPlan):
+        try:
+            if plan.lazy:
+                plan.runLazy(self.runStep)
+            else:
+                for step in plan.steps:
+                    self.runStep(step)
+        except BaseException as err:
+            self._error = err
+        finally:
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _wait(self):
+        token = self.token
+        with self._cond:
+            while not self._done:
+                now = time.monotonic()
+                step = self._step
+                node = None if step is None else _stepNode(step)
+
+                limit = self.deadline
+                if token.deadline is not None and (limit is None or token.deadline < limit):
+                    limit = token.deadline
+                if limit is not None and now >= limit:
+                    token._cancel('Deadline passed', True)
+                    raise token.error(_LOC, node)
+
+                if step is not None and self._stepTimeout is not None:
+                    stepLimit = self._stepStart + self._stepTimeout
+                    if now >= stepLimit:
+                        token._cancel(f'Timed out after {self._stepTimeout}s', True)
+                        raise token.error(_LOC, node)
+                    if limit is None or stepLimit < limit:
+                        limit = stepLimit
+
+                if token.cancelled:
+                    raise token.error(_LOC, node)
+
+                self._cond.wait(None if limit is None else limit - now)